@@ -0,0 +1,82 @@
+import time
+from django.db import transaction
+
+
+class BulkUpserter:
+    """
+    Batched replacement for calling update_or_create() once per row.
+    - Existing rows are preloaded ONCE into a dict keyed on key_fields.
+    - add() only queues an INSERT or UPDATE; nothing touches the database
+      until batch_size rows are waiting.
+    - Each batch is written with bulk_create / bulk_update inside a single
+      transaction, instead of a SELECT + write + autocommit per row.
+    A key seen twice in one import behaves like update_or_create: the last
+    values win.
+
+    key_fields use attribute names (e.g. 'trail_id', not 'trail').
+    """
+
+    def __init__(self, model, key_fields, update_fields, batch_size=500, queryset=None):
+        self.model = model
+        self.key_fields = tuple(key_fields)
+        self.update_fields = list(update_fields)
+        self.batch_size = batch_size
+
+        queryset = model.objects.all() if queryset is None else queryset
+        self.existing = {
+            tuple(row[1:]): row[0]
+            for row in queryset.values_list('pk', *self.key_fields).iterator()
+        }
+
+        self.to_create = {}
+        self.to_update = {}
+        self.created = 0
+        self.updated = 0
+        self.started = time.perf_counter()
+
+    def key(self, values):
+        return tuple(values[field] for field in self.key_fields)
+
+    def add(self, **values):
+        key = self.key(values)
+        pk = self.existing.get(key)
+
+        if pk is None:
+            self.to_create[key] = self.model(**values)
+        else:
+            self.to_update[key] = self.model(pk=pk, **values)
+
+        if len(self.to_create) + len(self.to_update) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        if not self.to_create and not self.to_update:
+            return
+
+        with transaction.atomic():
+            if self.to_create:
+                created = self.model.objects.bulk_create(self.to_create.values(), batch_size=self.batch_size)
+                for key, obj in zip(self.to_create, created):
+                    # Later rows with the same key become updates, not duplicates
+                    if obj.pk is not None:
+                        self.existing[key] = obj.pk
+                self.created += len(created)
+
+            if self.to_update:
+                self.model.objects.bulk_update(self.to_update.values(), self.update_fields, batch_size=self.batch_size)
+                self.updated += len(self.to_update)
+
+        self.to_create = {}
+        self.to_update = {}
+
+    def finish(self):
+        """Writes anything still queued and returns throughput stats"""
+        self.flush()
+        seconds = time.perf_counter() - self.started
+        rows = self.created + self.updated
+        return {
+            'created': self.created,
+            'updated': self.updated,
+            'seconds': round(seconds, 2),
+            'rows_per_second': round(rows / seconds, 1) if seconds else None,
+        }
@@ -0,0 +1,53 @@
+from django.core import checks
+from django.core.exceptions import ImproperlyConfigured
+from django.db import connections
+
+from .filters import FTS_TABLE
+
+# Created with FTS_TABLE by migration 0014. SQLite drops them whenever
+# api_app_trail is rebuilt, and search then silently goes stale.
+FTS_TRIGGERS = (
+    'api_app_trail_fts_insert',
+    'api_app_trail_fts_delete',
+    'api_app_trail_fts_update',
+)
+
+
+def missing_fts_triggers(connection):
+    """FTS_TRIGGERS absent from a SQLite database that has the FTS index ([] otherwise)"""
+    if connection.vendor != 'sqlite':
+        return []
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT type, name FROM sqlite_master WHERE type IN ('table', 'trigger')")
+        found = {name for _, name in cursor.fetchall()}
+    if FTS_TABLE not in found:
+        return []  # Migration 0014 hasn't run yet
+    return [name for name in FTS_TRIGGERS if name not in found]
+
+
+@checks.register(checks.Tags.database)
+def check_fts_triggers(app_configs, databases=None, **kwargs):
+    """
+    Runs with `check --database default` and before migrate. Only a warning,
+    so migrate can still apply the migration that restores the triggers.
+    """
+    warnings = []
+    for alias in databases or []:
+        missing = missing_fts_triggers(connections[alias])
+        if missing:
+            warnings.append(checks.Warning(
+                f"Trail search triggers are missing from '{alias}': {', '.join(missing)}.",
+                hint="A migration rebuilt api_app_trail. Re-create the triggers from migration 0014's CREATE_FTS.",
+                id='api_app.W001',
+            ))
+    return warnings
+
+
+def assert_fts_triggers(using, **kwargs):
+    """post_migrate: fail the migrate that left the triggers dropped, not a later search"""
+    missing = missing_fts_triggers(connections[using])
+    if missing:
+        raise ImproperlyConfigured(
+            f"Migrating '{using}' left trail search without its triggers: {', '.join(missing)}. "
+            "Re-create them from migration 0014's CREATE_FTS."
+        )
@@ -0,0 +1,184 @@
+import threading
+from math import floor, log, pi, radians, tan, cos
+
+from django.core.cache import cache
+from django.db import connection
+
+from .dataversion import get_data_version
+from .models import CarPark, TransportLink
+
+# --- CONFIGURATION ---
+CLUSTER_RADIUS_PX = 60      # Grid cell size on screen, in 256px-tile pixels
+TILE_SIZE = 256
+MAX_CLUSTER_ZOOM = 16       # Finest precomputed level; closer zooms reuse it
+CLUSTER_VERSION_KEY = 'clusters_version'    # Data version the cached levels were built for
+REBUILD_LOCK_KEY = 'clusters_rebuilding'
+REBUILD_LOCK_TTL = 60 * 10  # Seconds before a rebuild that died can be queued again
+REBUILD_RETRY_AFTER = 10    # Seconds clients are told to wait while levels are rebuilt
+
+# dataset -> (model, filterable fields). Clusters are precomputed for every
+# combination of these fields' values, so filtered requests are a merge of
+# a few precomputed levels instead of a pass over the points.
+DATASETS = {
+    'carparks': (CarPark, ['is_free', 'has_disabled_parking']),
+    'transport': (TransportLink, ['type']),
+}
+
+
+class ClustersNotReady(Exception):
+    """The level isn't cached for the current data version yet; a rebuild is queued"""
+
+
+def world_pixels(lat, lon, zoom):
+    """Web Mercator pixel position of a point at a zoom level"""
+    size = TILE_SIZE * 2 ** zoom
+    x = (lon + 180.0) / 360.0 * size
+    lat = radians(max(min(lat, 85.0511), -85.0511))
+    y = (1 - log(tan(lat) + 1 / cos(lat)) / pi) / 2 * size
+    return x, y
+
+
+def build_clusters(dataset):
+    """
+    Grid cluster hierarchy for one dataset.
+    - Each point lands in a CLUSTER_RADIUS_PX cell at MAX_CLUSTER_ZOOM.
+    - A cell at zoom z is exactly four cells at z + 1, so each coarser
+      level is built by merging the level below (cell // 2), not by
+      re-reading the points.
+    - Cells are kept per combination of filter values.
+    Returns {'fields': [...], 'levels': {combo: {zoom: {cell: [count, sum_lon, sum_lat, id]}}}}
+    """
+    model, fields = DATASETS[dataset]
+    rows = model.objects.exclude(latitude=None).exclude(longitude=None).values_list(
+        'id', 'latitude', 'longitude', *fields
+    )
+
+    levels = {}
+    for row in rows.iterator(chunk_size=2000):
+        pk, lat, lon, combo = row[0], float(row[1]), float(row[2]), tuple(row[3:])
+        x, y = world_pixels(lat, lon, MAX_CLUSTER_ZOOM)
+        cell = (floor(x / CLUSTER_RADIUS_PX), floor(y / CLUSTER_RADIUS_PX))
+        finest = levels.setdefault(combo, {MAX_CLUSTER_ZOOM: {}})[MAX_CLUSTER_ZOOM]
+        entry = finest.setdefault(cell, [0, 0.0, 0.0, pk])
+        entry[0] += 1
+        entry[1] += lon
+        entry[2] += lat
+
+    for combo_levels in levels.values():
+        for zoom in range(MAX_CLUSTER_ZOOM - 1, -1, -1):
+            coarser = {}
+            for (cx, cy), (count, sum_lon, sum_lat, pk) in combo_levels[zoom + 1].items():
+                entry = coarser.setdefault((cx // 2, cy // 2), [0, 0.0, 0.0, pk])
+                entry[0] += count
+                entry[1] += sum_lon
+                entry[2] += sum_lat
+            combo_levels[zoom] = coarser
+
+    return {'fields': fields, 'levels': levels}
+
+
+def _cache_key(dataset, version, zoom):
+    return f"clusters_{version}_{dataset}_{zoom}"
+
+
+def _store_levels(dataset, version, hierarchy):
+    """Caches each zoom level separately, so a request only reads its own level"""
+    levels = {zoom: {} for zoom in range(MAX_CLUSTER_ZOOM + 1)}
+    for combo, combo_levels in hierarchy['levels'].items():
+        for zoom, cells in combo_levels.items():
+            levels[zoom][combo] = cells
+    # No timeout: levels stay until the next rebuild replaces them
+    cache.set_many(
+        {_cache_key(dataset, version, zoom): {'fields': hierarchy['fields'], 'combos': combos}
+         for zoom, combos in levels.items()},
+        None,
+    )
+
+
+def rebuild_clusters():
+    """
+    Precomputes every dataset's clusters for the current data version (run
+    after imports and clears), then drops the levels of the version before.
+    """
+    version = get_data_version()['version']
+    for dataset in DATASETS:
+        _store_levels(dataset, version, build_clusters(dataset))
+
+    previous = cache.get(CLUSTER_VERSION_KEY)
+    cache.set(CLUSTER_VERSION_KEY, version, None)
+    if previous and previous != version:
+        cache.delete_many([
+            _cache_key(dataset, previous, zoom)
+            for dataset in DATASETS for zoom in range(MAX_CLUSTER_ZOOM + 1)
+        ])
+
+
+def _rebuild_in_background():
+    try:
+        rebuild_clusters()
+    finally:
+        cache.delete(REBUILD_LOCK_KEY)
+        connection.close()  # The thread's own connection
+
+
+def queue_rebuild():
+    """
+    Starts rebuild_clusters() in a background thread, unless a rebuild is
+    already running. The lock lives in the shared cache, so one worker
+    rebuilds for all of them. Returns True if this call started it.
+    """
+    if not cache.add(REBUILD_LOCK_KEY, True, REBUILD_LOCK_TTL):
+        return False
+    threading.Thread(target=_rebuild_in_background, daemon=True).start()
+    return True
+
+
+def get_level(dataset, zoom):
+    """
+    {'fields': [...], 'combos': {combo: {cell: [count, sum_lon, sum_lat, id]}}} for one zoom.
+    A miss (e.g. the cache was wiped) never builds on the request path: it
+    queues a rebuild and raises ClustersNotReady.
+    """
+    version = get_data_version()['version']
+    level = cache.get(_cache_key(dataset, version, zoom))
+    if level is None:
+        queue_rebuild()
+        raise ClustersNotReady(dataset)
+    return level
+
+
+def get_clusters(dataset, zoom, filters=None, bbox=None):
+    """
+    Clusters for a zoom level as dicts with latitude, longitude (the
+    members' centroid), count, and id when the cluster is a single row.
+    - filters: {field: value}, matched against the precomputed combinations
+    - bbox: (west, south, east, north) keeps clusters whose point is inside
+    Only this zoom's level is read from the cache, so the cost depends on
+    the number of clusters, not the number of points.
+    """
+    zoom = max(0, min(int(zoom), MAX_CLUSTER_ZOOM))
+    level = get_level(dataset, zoom)
+    fields = level['fields']
+    filters = filters or {}
+
+    merged = {}
+    for combo, cells in level['combos'].items():
+        values = dict(zip(fields, combo))
+        if any(values[field] != value for field, value in filters.items()):
+            continue
+        for cell, (count, sum_lon, sum_lat, pk) in cells.items():
+            entry = merged.setdefault(cell, [0, 0.0, 0.0, pk])
+            entry[0] += count
+            entry[1] += sum_lon
+            entry[2] += sum_lat
+
+    clusters = []
+    for count, sum_lon, sum_lat, pk in merged.values():
+        lat, lon = sum_lat / count, sum_lon / count
+        if bbox and not (bbox[0] <= lon <= bbox[2] and bbox[1] <= lat <= bbox[3]):
+            continue
+        cluster = {'latitude': round(lat, 6), 'longitude': round(lon, 6), 'count': count}
+        if count == 1:
+            cluster['id'] = pk
+        clusters.append(cluster)
+    return clusters
@@ -0,0 +1,50 @@
+import time
+import uuid
+from django.core.cache import cache
+
+# --- CONFIGURATION ---
+DATA_VERSION_KEY = 'data_version'
+
+# Scopes of data that change independently:
+# - 'data': trails, car parks, transport links (import and clear commands)
+# - 'reviews': trail rating aggregates (review writes)
+# - 'weather': cached weather readings (refresh_weather)
+SCOPES = ('data', 'reviews', 'weather')
+
+
+def _key(scope):
+    return DATA_VERSION_KEY if scope == 'data' else f"{DATA_VERSION_KEY}_{scope}"
+
+
+def bump_data_version(scope='data'):
+    """
+    Marks one scope of data as changed.
+    The 'data' scope covers the imported rows (trails, car parks, transport
+    links) and is bumped by the import and clear commands. Everything cached
+    under the old version (tiles, clusters, responses) is simply never read
+    again.
+    """
+    state = {'version': uuid.uuid4().hex[:12], 'changed_at': time.time()}
+    cache.set(_key(scope), state, None)
+    return state
+
+
+def get_data_version(scope='data'):
+    """
+    {'version': token, 'changed_at': unix time} for a scope.
+    If the cache was wiped, a new version is started, which safely
+    invalidates anything that might have been cached against the old one.
+    """
+    state = cache.get(_key(scope))
+    if state is None:
+        state = bump_data_version(scope)
+    return state
+
+
+def get_data_versions(scopes):
+    """Versions of several scopes in one cache round trip"""
+    states = cache.get_many([_key(scope) for scope in scopes])
+    return {
+        scope: states.get(_key(scope)) or bump_data_version(scope)
+        for scope in scopes
+    }
@@ -0,0 +1,135 @@
+from rest_framework import serializers
+from django.db import models
+
+
+class DerivedData:
+    """
+    Request-scoped store for expensive per-object lookups (weather, scores...).
+    - One instance lives in the serializer context, so every field of every
+      object on the page shares it for the whole request.
+    - Each (lookup, object) pair is computed once, however many fields use it.
+    - Lookups can register a prime() hook that resolves a whole page at once.
+
+    New lookups are added with the register() decorator and exposed with
+    DerivedField:
+
+        @DerivedData.register('trail_rating', depends_on=['current_weather'])
+        def trail_rating(trail, derived):
+            weather = derived.get('current_weather', trail)
+            ...
+
+        class TrailSerializer(serializers.ModelSerializer):
+            trail_rating = DerivedField()
+    """
+    registry = {}
+
+    @classmethod
+    def register(cls, name, prime=None, depends_on=(), requires=None):
+        """
+        Registers compute(obj, derived) under name.
+        - prime(objs, derived): optional batch hook run once per page
+        - depends_on: other lookups compute() reads, so they get primed too
+        - requires: model columns compute()/prime() read (None = unknown,
+          so sparse fieldsets load every column)
+        """
+        def decorator(compute):
+            cls.registry[name] = {
+                'compute': compute,
+                'prime': prime,
+                'depends_on': tuple(depends_on),
+                'requires': None if requires is None else tuple(requires),
+            }
+            return compute
+        return decorator
+
+    @classmethod
+    def required_columns(cls, name):
+        """Columns a lookup and its dependencies read, or None if any is unknown"""
+        columns = set()
+        for dependency in cls._with_dependencies([name]):
+            requires = cls.registry[dependency]['requires']
+            if requires is None:
+                return None
+            columns.update(requires)
+        return sorted(columns)
+
+    def __init__(self, context):
+        self.context = context
+        self._values = {}
+        self._primed = set()
+
+    @classmethod
+    def _with_dependencies(cls, names):
+        pending, resolved = list(names), []
+        while pending:
+            name = pending.pop()
+            if name in resolved:
+                continue
+            resolved.append(name)
+            pending.extend(cls.registry[name]['depends_on'])
+        return resolved
+
+    def prime(self, names, objs):
+        """Runs each lookup's batch hook once for the objects on this page"""
+        objs = list(objs)
+        for name in self._with_dependencies(names):
+            hook = self.registry[name]['prime']
+            if hook and name not in self._primed:
+                hook(objs, self)
+                self._primed.add(name)
+
+    def get(self, name, obj):
+        key = (name, obj.pk if obj.pk is not None else id(obj))
+        if key not in self._values:
+            self._values[key] = self.registry[name]['compute'](obj, self)
+        return self._values[key]
+
+
+def get_derived(context):
+    """Returns the DerivedData for a serializer context, creating it on first use"""
+    if 'derived' not in context:
+        context['derived'] = DerivedData(context)
+    return context['derived']
+
+
+class DerivedField(serializers.Field):
+    """
+    Read-only field backed by a registered DerivedData lookup.
+    The lookup name defaults to the field name.
+    """
+    def __init__(self, name=None, **kwargs):
+        self.derived_name = name
+        kwargs['source'] = '*'
+        kwargs['read_only'] = True
+        super().__init__(**kwargs)
+
+    def bind(self, field_name, parent):
+        if self.derived_name is None:
+            self.derived_name = field_name
+        super().bind(field_name, parent)
+
+    @property
+    def requires(self):
+        # Read by sparse fieldsets to load only the columns the lookup needs
+        return DerivedData.required_columns(self.derived_name)
+
+    def to_representation(self, obj):
+        return get_derived(self.context).get(self.derived_name, obj)
+
+
+class DerivedListSerializer(serializers.ListSerializer):
+    """
+    List serializer that primes every derived lookup used by the child
+    serializer with the whole page before any object is serialized.
+    """
+    def to_representation(self, data):
+        iterable = data.all() if isinstance(data, models.manager.BaseManager) else data
+        objs = list(iterable)
+
+        names = [
+            field.derived_name for field in self.child.fields.values()
+            if isinstance(field, DerivedField)
+        ]
+        if names:
+            get_derived(self.context).prime(names, objs)
+        return super().to_representation(objs)
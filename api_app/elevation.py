@@ -0,0 +1,284 @@
+import re
+import sqlite3
+from math import floor
+from pathlib import Path
+
+import numpy as np
+import requests
+from django.conf import settings
+
+from .geo import haversine
+
+# --- CONFIGURATION ---
+OPEN_ELEVATION_URL = 'https://api.open-elevation.com/api/v1/lookup'
+CACHE_PATH = Path(settings.BASE_DIR) / 'elevation_cache.sqlite3'
+COORD_PRECISION = 4            # Decimal places kept in cache keys (~10m)
+SAMPLE_SPACING_KM = 0.1        # One elevation sample every ~100m along a trail
+ASCENT_THRESHOLD_M = 3.0       # Climbs smaller than this are treated as DEM noise
+LOCATIONS_PER_REQUEST = 500
+DEM_WINDOW_PX = 256            # GeoTIFF reads are grouped into blocks of this many pixels square
+REQUEST_TIMEOUT = 20
+
+
+def rounded(lat, lon):
+    return (round(float(lat), COORD_PRECISION), round(float(lon), COORD_PRECISION))
+
+
+def sample_line(coords, spacing_km=SAMPLE_SPACING_KM):
+    """
+    Picks (lat, lon) sample points roughly spacing_km apart along a line of
+    (lon, lat) coords, always keeping both ends. Spacing is measured along
+    the line, so dense and sparse OSM ways are sampled evenly.
+    """
+    points = np.asarray(coords, dtype=float)
+    if len(points) == 0:
+        return []
+    if len(points) == 1:
+        return [(points[0, 1], points[0, 0])]
+
+    lons, lats = points[:, 0], points[:, 1]
+    along = np.concatenate([[0.0], np.cumsum(haversine(lats[:-1], lons[:-1], lats[1:], lons[1:]))])
+    buckets = np.floor(along / spacing_km)
+    keep = np.flatnonzero(np.diff(buckets, prepend=-1) > 0)
+    if keep[-1] != len(points) - 1:
+        keep = np.append(keep, len(points) - 1)
+    return [(lats[i], lons[i]) for i in keep]
+
+
+def cumulative_ascent(elevations, threshold=ASCENT_THRESHOLD_M):
+    """
+    Total climb along a profile (metres).
+    Uses a hysteresis threshold: a climb only counts once it rises
+    threshold metres above the lowest point since the last counted climb,
+    so DEM noise on flat ground doesn't add up.
+    """
+    known = [e for e in elevations if e is not None]
+    if not known:
+        return None
+
+    gain = 0.0
+    anchor = known[0]
+    for elevation in known[1:]:
+        if elevation - anchor >= threshold:
+            gain += elevation - anchor
+            anchor = elevation
+        elif elevation < anchor:
+            anchor = elevation
+    return gain
+
+
+class ElevationCache:
+    """Elevations keyed by rounded coordinates, kept in a small SQLite file across imports"""
+
+    def __init__(self, path=CACHE_PATH):
+        self.db = sqlite3.connect(str(path))
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS elevation ("
+            " lat REAL NOT NULL, lon REAL NOT NULL, elevation REAL,"
+            " PRIMARY KEY (lat, lon))"
+        )
+
+    def get_many(self, keys):
+        found = {}
+        keys = list(keys)
+        for start in range(0, len(keys), 400):
+            chunk = keys[start:start + 400]
+            clause = " OR ".join(["(lat = ? AND lon = ?)"] * len(chunk))
+            params = [value for key in chunk for value in key]
+            for lat, lon, elevation in self.db.execute(f"SELECT lat, lon, elevation FROM elevation WHERE {clause}", params):
+                found[(lat, lon)] = elevation
+        return found
+
+    def set_many(self, values):
+        with self.db:
+            self.db.executemany(
+                "INSERT OR REPLACE INTO elevation (lat, lon, elevation) VALUES (?, ?, ?)",
+                [(lat, lon, elevation) for (lat, lon), elevation in values.items()],
+            )
+
+
+class SRTMTiles:
+    """
+    Local SRTM .hgt tiles (1 or 3 arc-second), memory-mapped so only the
+    pages that are actually sampled get read from disk.
+    Tiles are named after their south-west corner, e.g. N53W002.hgt.
+    """
+    NAME = re.compile(r'([NS])(\d{2})([EW])(\d{3})\.hgt$', re.IGNORECASE)
+    VOID = -32768
+
+    def __init__(self, path):
+        path = Path(path)
+        files = [path] if path.is_file() else sorted(path.glob('*.hgt'))
+        self.tiles = {}
+        for file in files:
+            match = self.NAME.search(file.name)
+            if not match:
+                continue
+            lat = int(match.group(2)) * (1 if match.group(1).upper() == 'N' else -1)
+            lon = int(match.group(4)) * (1 if match.group(3).upper() == 'E' else -1)
+            self.tiles[(lat, lon)] = file
+        self._maps = {}
+        if not self.tiles:
+            raise ValueError(f"No SRTM .hgt tiles found at {path}")
+
+    def _tile(self, key):
+        if key not in self._maps:
+            file = self.tiles.get(key)
+            if file is None:
+                self._maps[key] = None
+            else:
+                size = int(round((file.stat().st_size // 2) ** 0.5))
+                self._maps[key] = np.memmap(file, dtype='>i2', mode='r', shape=(size, size))
+        return self._maps[key]
+
+    def sample(self, points):
+        """Bilinear elevation for each (lat, lon), or None outside the tiles / on voids"""
+        results = []
+        for lat, lon in points:
+            grid = self._tile((floor(lat), floor(lon)))
+            if grid is None:
+                results.append(None)
+                continue
+            size = grid.shape[0] - 1
+            # Row 0 is the northern edge of the tile
+            y = (floor(lat) + 1 - lat) * size
+            x = (lon - floor(lon)) * size
+            results.append(_bilinear(grid, x, y, self.VOID))
+        return results
+
+
+class GeoTIFFDEM:
+    """
+    A WGS84 (EPSG:4326) DEM GeoTIFF read through GDAL.
+    Points are grouped by DEM_WINDOW_PX block, and each block reads only
+    the pixel window around its own points. A batch of trails spread over
+    a large raster costs a few small reads, never one window spanning all
+    of them.
+    """
+
+    def __init__(self, path):
+        from django.contrib.gis.gdal import GDALRaster
+        self.raster = GDALRaster(str(path))
+        self.band = self.raster.bands[0]
+        self.nodata = self.band.nodata_value
+        origin_x, pixel_w, _, origin_y, _, pixel_h = self.raster.geotransform
+        self.origin = (origin_x, origin_y)
+        self.pixel = (pixel_w, pixel_h)
+
+    def sample(self, points):
+        """Bilinear elevation for each (lat, lon), or None outside the raster / on nodata"""
+        results = [None] * len(points)
+        blocks = {}
+        for i, (lat, lon) in enumerate(points):
+            # Pixel values describe pixel centres, half a pixel in from the corner
+            x = (lon - self.origin[0]) / self.pixel[0] - 0.5
+            y = (lat - self.origin[1]) / self.pixel[1] - 0.5
+            blocks.setdefault((floor(x / DEM_WINDOW_PX), floor(y / DEM_WINDOW_PX)), []).append((i, x, y))
+
+        for block in blocks.values():
+            xs = [x for _, x, _ in block]
+            ys = [y for _, _, y in block]
+            x0 = max(int(floor(min(xs))), 0)
+            y0 = max(int(floor(min(ys))), 0)
+            x1 = min(int(floor(max(xs))) + 2, self.raster.width)
+            y1 = min(int(floor(max(ys))) + 2, self.raster.height)
+            if x1 <= x0 or y1 <= y0:
+                continue
+
+            window = np.asarray(self.band.data(offset=(x0, y0), size=(x1 - x0, y1 - y0)))
+            for i, x, y in block:
+                results[i] = _bilinear(window, x - x0, y - y0, self.nodata)
+        return results
+
+
+def _bilinear(grid, x, y, nodata):
+    rows, cols = grid.shape
+    if not (0 <= x <= cols - 1 and 0 <= y <= rows - 1):
+        return None
+    c0, r0 = min(int(x), cols - 2), min(int(y), rows - 2)
+    dx, dy = x - c0, y - r0
+    corners = grid[r0:r0 + 2, c0:c0 + 2].astype(float)
+    if nodata is not None and (corners == nodata).any():
+        return None
+    top = corners[0, 0] * (1 - dx) + corners[0, 1] * dx
+    bottom = corners[1, 0] * (1 - dx) + corners[1, 1] * dx
+    return float(top * (1 - dy) + bottom * dy)
+
+
+def open_dem(path):
+    """Opens a local DEM: a .tif/.tiff GeoTIFF, a single .hgt tile or a folder of .hgt tiles"""
+    path = Path(path)
+    if path.suffix.lower() in ('.tif', '.tiff'):
+        return GeoTIFFDEM(path)
+    return SRTMTiles(path)
+
+
+class ElevationService:
+    """
+    Elevation lookups for the trail importer.
+    - Points from many trails are resolved together with lookup(), so the
+      API sees a few large requests instead of one per trail.
+    - Every result is cached by rounded coordinates, so re-imports and
+      overlapping trails don't ask twice.
+    - With a local DEM, no network is used at all.
+    Failed lookups stay None; they are never turned into 0.
+    """
+
+    def __init__(self, dem=None, cache=None, log=None):
+        self.dem = open_dem(dem) if dem else None
+        self.cache = cache or ElevationCache()
+        self.log = log or (lambda message: None)
+        self.known = {}
+
+    def _fetch(self, keys):
+        """Asks Open-Elevation for many points, LOCATIONS_PER_REQUEST at a time"""
+        results = {}
+        for start in range(0, len(keys), LOCATIONS_PER_REQUEST):
+            chunk = keys[start:start + LOCATIONS_PER_REQUEST]
+            locations = [{"latitude": lat, "longitude": lon} for lat, lon in chunk]
+            try:
+                response = requests.post(OPEN_ELEVATION_URL, json={'locations': locations}, timeout=REQUEST_TIMEOUT)
+                response.raise_for_status()
+                data = response.json()['results']
+            except (requests.RequestException, ValueError, KeyError) as e:
+                self.log(f"    Elevation lookup failed for {len(chunk)} points: {e}")
+                continue
+            for key, row in zip(chunk, data):
+                results[key] = row.get('elevation')
+        return results
+
+    def lookup(self, points):
+        """Resolves elevations for many (lat, lon) points at once"""
+        keys = {rounded(lat, lon) for lat, lon in points} - self.known.keys()
+        if not keys:
+            return
+
+        self.known.update(self.cache.get_many(keys))
+        missing = [key for key in keys if key not in self.known]
+        if not missing:
+            return
+
+        if self.dem:
+            fetched = dict(zip(missing, self.dem.sample(missing)))
+        else:
+            fetched = self._fetch(missing)
+
+        # Only real answers are cached, so failures are retried next import
+        self.cache.set_many({key: value for key, value in fetched.items() if value is not None})
+        self.known.update(fetched)
+
+    def elevation(self, lat, lon):
+        return self.known.get(rounded(lat, lon))
+
+    def ascent(self, profiles):
+        """
+        Cumulative ascent (m) over several sampled lines, or None if no
+        elevation at all could be found.
+        """
+        total, found = 0.0, False
+        for profile in profiles:
+            gain = cumulative_ascent([self.elevation(lat, lon) for lat, lon in profile])
+            if gain is not None:
+                total += gain
+                found = True
+        return round(total, 2) if found else None
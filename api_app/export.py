@@ -0,0 +1,103 @@
+import json
+
+from .models import Trail, CarPark, TransportLink
+
+# --- CONFIGURATION ---
+CHUNK_SIZE = 500            # Rows fetched from the database per round trip
+BUFFER_BYTES = 64 * 1024    # Features are grouped into ~64KB writes
+
+
+def _trail_geometry(row):
+    path = row.pop('path')
+    return path.json if path is not None else 'null'
+
+
+def _point_geometry(row):
+    lon, lat = row.pop('longitude'), row.pop('latitude')
+    return json.dumps({'type': 'Point', 'coordinates': [float(lon), float(lat)]})
+
+
+# dataset name -> (queryset, property fields, geometry fields, geometry builder)
+DATASETS = {
+    'trails': (
+        Trail.objects.all(),
+        ['name', 'region', 'difficulty', 'length', 'elevation_gain', 'estimated_duration', 'popularity'],
+        ['path'],
+        _trail_geometry,
+    ),
+    'carparks': (
+        CarPark.objects.all(),
+        ['trail_id', 'name', 'capacity', 'is_free', 'has_disabled_parking'],
+        ['latitude', 'longitude'],
+        _point_geometry,
+    ),
+    'transport': (
+        TransportLink.objects.all(),
+        ['trail_id', 'name', 'type'],
+        ['latitude', 'longitude'],
+        _point_geometry,
+    ),
+}
+FORMATS = {
+    'geojson': 'application/geo+json',
+    'ndjson': 'application/geo+json-seq',
+}
+
+
+def resolve_datasets(name):
+    """'all' or one dataset name -> list of names; raises KeyError if unknown"""
+    if name == 'all':
+        return list(DATASETS)
+    if name not in DATASETS:
+        raise KeyError(name)
+    return [name]
+
+
+def iter_features(dataset, chunk_size=CHUNK_SIZE):
+    """
+    One GeoJSON Feature string per row.
+    Rows are read with iterator(chunk_size), and geometry JSON comes
+    straight from GEOS, so no model instances or DRF serializers are built.
+    """
+    queryset, fields, geometry_fields, geometry = DATASETS[dataset]
+    rows = queryset.order_by('id').values('id', *fields, *geometry_fields).iterator(chunk_size=chunk_size)
+    for row in rows:
+        feature_id = row.pop('id')
+        geom = geometry(row)
+        row['layer'] = dataset
+        yield (
+            f'{{"type":"Feature","id":{feature_id},"geometry":{geom},'
+            f'"properties":{json.dumps(row, default=float)}}}'
+        )
+
+
+def iter_geojson(datasets, chunk_size=CHUNK_SIZE):
+    """A single FeatureCollection, written feature by feature"""
+    yield '{"type":"FeatureCollection","features":[\n'
+    first = True
+    for dataset in datasets:
+        for feature in iter_features(dataset, chunk_size):
+            yield feature if first else ',\n' + feature
+            first = False
+    yield '\n]}\n'
+
+
+def iter_ndjson(datasets, chunk_size=CHUNK_SIZE):
+    """Newline-delimited GeoJSON: one Feature per line"""
+    for dataset in datasets:
+        for feature in iter_features(dataset, chunk_size):
+            yield feature + '\n'
+
+
+def iter_export(datasets, fmt, chunk_size=CHUNK_SIZE):
+    """Export text grouped into ~BUFFER_BYTES pieces, so each write is a reasonable size"""
+    writer = iter_geojson if fmt == 'geojson' else iter_ndjson
+    buffer, size = [], 0
+    for piece in writer(datasets, chunk_size):
+        buffer.append(piece)
+        size += len(piece)
+        if size >= BUFFER_BYTES:
+            yield ''.join(buffer)
+            buffer, size = [], 0
+    if buffer:
+        yield ''.join(buffer)
@@ -0,0 +1,84 @@
+from rest_framework.exceptions import ValidationError
+from rest_framework.permissions import SAFE_METHODS
+
+from .planner import plan_queryset
+
+FIELDS_PARAM = 'fields'
+EXCLUDE_PARAM = 'exclude'
+
+
+def parse_field_list(raw):
+    return [name.strip() for name in raw.split(',') if name.strip()]
+
+
+def requested_fields(request, available):
+    """
+    Names of the serializer fields a read request asked for, or None for all.
+    ?fields=a,b keeps only those, ?exclude=c drops those (both may be given).
+    """
+    params = request.query_params
+    if FIELDS_PARAM not in params and EXCLUDE_PARAM not in params:
+        return None
+
+    keep = parse_field_list(params[FIELDS_PARAM]) if FIELDS_PARAM in params else list(available)
+    exclude = parse_field_list(params.get(EXCLUDE_PARAM, ''))
+    unknown = [name for name in keep + exclude if name not in available]
+    if unknown:
+        param = FIELDS_PARAM if unknown[0] in keep else EXCLUDE_PARAM
+        raise ValidationError({param: f"Unknown field(s): {', '.join(unknown)}. Choose from: {', '.join(available)}."})
+    return {name for name in keep if name not in exclude}
+
+
+class SparseFieldsetSerializerMixin:
+    """
+    Drops the fields the view didn't select (context['sparse_fields'] maps a
+    serializer class to the names to keep). Dropped fields are never
+    evaluated, so e.g. DerivedFields that aren't asked for never prime.
+    Fields that read more than their own column list them in
+    Meta.field_requires, or in a `requires` attribute on the field class,
+    so the query planner (api_app/planner.py) loads exactly those columns.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        keep = self.context.get('sparse_fields', {}).get(type(self))
+        if keep is not None:
+            for name in list(self.fields):
+                if name not in keep:
+                    self.fields.pop(name)
+
+
+class SparseFieldsetMixin:
+    """
+    Adds ?fields=a,b / ?exclude=c to a viewset's read requests.
+    - Unselected fields are dropped from the output and never evaluated.
+    - The queryset is planned from the remaining fields (see
+      api_app/planner.py): unused columns and relations aren't loaded, and
+      the ones that are cost a fixed number of queries per page.
+    The serializer needs SparseFieldsetSerializerMixin. Writes ignore both
+    parameters, so they always validate and return the full object.
+    """
+
+    def get_sparse_fields(self):
+        if not hasattr(self, '_sparse_fields'):
+            request = getattr(self, 'request', None)
+            self._sparse_fields = None
+            if request is not None and request.method in SAFE_METHODS:
+                available = list(self.get_serializer_class()().fields)
+                self._sparse_fields = requested_fields(request, available)
+        return self._sparse_fields
+
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        keep = self.get_sparse_fields()
+        if keep is not None:
+            context['sparse_fields'] = {self.get_serializer_class(): keep}
+        return context
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        request = getattr(self, 'request', None)
+        if request is None or request.method not in SAFE_METHODS:
+            return queryset
+        serializer = self.get_serializer_class()(context=self.get_serializer_context())
+        return plan_queryset(queryset, serializer)
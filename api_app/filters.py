@@ -0,0 +1,122 @@
+import re
+
+from django.contrib.gis.geos import Polygon
+from django.db import connections
+from django.db.models import Q
+from rest_framework.exceptions import ValidationError
+from rest_framework.filters import BaseFilterBackend, SearchFilter
+
+from .geoqueries import in_bbox
+
+
+class InBBoxFilter(BaseFilterBackend):
+    """
+    ?in_bbox=minx,miny,maxx,maxy (lon/lat, WGS84): only rows in the viewport.
+    The view says what to test with:
+    - bbox_filter_field: geometry column with a spatial index (default 'location')
+    - bbox_filter_envelope: prefix of precomputed <prefix>_west/_south/_east/_north
+      float columns, if the geometry isn't a point
+    Rows are narrowed through the spatial index first. With an envelope,
+    rows lying entirely inside the window are accepted from the four floats,
+    and only rows straddling an edge get an exact intersects test, so full
+    geometries are never decoded for rows outside the window.
+    """
+    bbox_param = 'in_bbox'
+
+    def get_bbox(self, request):
+        raw = request.query_params.get(self.bbox_param)
+        if not raw:
+            return None
+        try:
+            west, south, east, north = (float(value) for value in raw.split(','))
+        except ValueError:
+            raise ValidationError({self.bbox_param: "Expected minx,miny,maxx,maxy."})
+        if west > east or south > north:
+            raise ValidationError({self.bbox_param: "min values must not be greater than max values."})
+        return west, south, east, north
+
+    def filter_queryset(self, request, queryset, view):
+        bbox = self.get_bbox(request)
+        if bbox is None:
+            return queryset
+
+        field = getattr(view, 'bbox_filter_field', 'location')
+        queryset = in_bbox(queryset, bbox, field)
+
+        prefix = getattr(view, 'bbox_filter_envelope', None)
+        if not prefix:
+            return queryset  # The index's MBR test is exact for points
+
+        west, south, east, north = bbox
+        window = Polygon.from_bbox(bbox)
+        window.srid = 4326
+        inside = Q(**{
+            f'{prefix}_west__gte': west, f'{prefix}_east__lte': east,
+            f'{prefix}_south__gte': south, f'{prefix}_north__lte': north,
+        })
+        return queryset.filter(
+            **{
+                f'{prefix}_west__lte': east, f'{prefix}_east__gte': west,
+                f'{prefix}_south__lte': north, f'{prefix}_north__gte': south,
+            }
+        ).filter(inside | Q(**{f'{field}__intersects': window}))
+
+    def get_schema_operation_parameters(self, view):
+        return [{
+            'name': self.bbox_param,
+            'required': False,
+            'in': 'query',
+            'description': 'Viewport as minx,miny,maxx,maxy (lon/lat)',
+            'schema': {'type': 'string'},
+        }]
+
+
+# --- FULL-TEXT SEARCH ---
+FTS_TABLE = 'api_app_trail_fts'     # Created by migration 0014
+FTS_WEIGHTS = (10.0, 2.0)           # bm25 weight of name, region
+TOKEN = re.compile(r'\w+', re.UNICODE)
+
+
+def fts_query(text):
+    """
+    Search box text -> FTS5 query: every word must match, and each word
+    matches as a prefix ("mam to" finds "Mam Tor"). Punctuation is dropped,
+    so user input can never form FTS5 syntax.
+    """
+    return ' '.join(f'"{token}"*' for token in TOKEN.findall(text))
+
+
+def full_text_search(queryset, text):
+    """
+    Trails matching text through the FTS5 index, best match first.
+    The index is joined on rowid = id, so only matching rows are read, and
+    results are ranked with bm25 (name weighted above region).
+    """
+    query = fts_query(text)
+    if not query:
+        return queryset
+    weights = ', '.join(str(weight) for weight in FTS_WEIGHTS)
+    return queryset.extra(
+        tables=[FTS_TABLE],
+        where=[f'{FTS_TABLE}.rowid = {queryset.model._meta.db_table}.id', f'{FTS_TABLE} MATCH %s'],
+        params=[query],
+        select={'search_rank': f'bm25({FTS_TABLE}, {weights})'},
+        order_by=['search_rank'],
+    )
+
+
+class FullTextSearchFilter(SearchFilter):
+    """
+    Drop-in replacement for SearchFilter on trails (same ?search= param).
+    On SQLite it answers from the FTS5 index with ranked prefix matching
+    instead of LIKE '%term%' over every row; other databases fall back to
+    SearchFilter's LIKE over search_fields.
+    """
+
+    def filter_queryset(self, request, queryset, view):
+        text = request.query_params.get(self.search_param, '')
+        if not text.strip():
+            return queryset
+        if connections[queryset.db].vendor != 'sqlite':
+            return super().filter_queryset(request, queryset, view)
+        return full_text_search(queryset, text)
@@ -0,0 +1,47 @@
+import numpy as np
+from math import radians, cos, sin, asin, sqrt
+
+EARTH_RADIUS_KM = 6371
+
+
+def haversine_km(lat1, lon1, lat2, lon2):
+    """
+    Haversine distance between two points (km).
+    Plain-math version for single pairs, where NumPy's call overhead would
+    cost more than the calculation itself.
+    """
+    lon1, lat1, lon2, lat2 = map(radians, [lon1, lat1, lon2, lat2])
+    dlon = lon2 - lon1
+    dlat = lat2 - lat1
+    a = sin(dlat/2)**2 + cos(lat1) * cos(lat2) * sin(dlon/2)**2
+    return 2 * asin(sqrt(a)) * EARTH_RADIUS_KM
+
+
+def haversine(lat1, lon1, lat2, lon2):
+    """
+    Vectorized Haversine distance (km).
+    Accepts scalars or arrays and follows NumPy broadcasting, so it can
+    compare pairs element-wise or one point against many.
+    """
+    lat1, lon1, lat2, lon2 = (np.radians(np.asarray(v, dtype=float)) for v in (lat1, lon1, lat2, lon2))
+    dlat = lat2 - lat1
+    dlon = lon2 - lon1
+    a = np.sin(dlat / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin(dlon / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+
+def distances_from(lat, lon, lats, lons):
+    """Distance (km) from one point to each of many points, as an array"""
+    return haversine(lat, lon, lats, lons)
+
+
+def polyline_length(coords):
+    """
+    Length (km) of a line given as a sequence of (lon, lat) pairs, the
+    order GEOS and OpenStreetMap use. All segments are measured in one pass.
+    """
+    points = np.asarray(coords, dtype=float)
+    if len(points) < 2:
+        return 0.0
+    lons, lats = points[:, 0], points[:, 1]
+    return float(haversine(lats[:-1], lons[:-1], lats[1:], lons[1:]).sum())
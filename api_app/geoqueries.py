@@ -0,0 +1,67 @@
+from math import cos, radians
+
+from django.contrib.gis.geos import Polygon
+from django.db import connections
+from django.db.models.expressions import RawSQL
+
+from .geo import distances_from
+
+# --- CONFIGURATION ---
+KM_PER_DEGREE = 111.32
+
+
+def bbox_around(lat, lon, radius_km):
+    """(west, south, east, north) box that contains the circle of radius_km"""
+    dlat = radius_km / KM_PER_DEGREE
+    dlon = radius_km / (KM_PER_DEGREE * max(cos(radians(lat)), 0.01))
+    return lon - dlon, lat - dlat, lon + dlon, lat + dlat
+
+
+def in_bbox(queryset, bbox, field='location'):
+    """
+    Rows whose geometry field overlaps bbox, answered through the spatial index.
+    - SpatiaLite never uses its R*Tree implicitly: the index has to be
+      queried through the SpatialIndex virtual table, so the candidates
+      come from a ROWID subquery.
+    - Other spatial backends (PostGIS) use their index for bboverlaps.
+    """
+    connection = connections[queryset.db]
+    if getattr(connection.ops, 'spatialite', False):
+        model = queryset.model
+        column = model._meta.get_field(field).column
+        west, south, east, north = bbox
+        return queryset.filter(pk__in=RawSQL(
+            "SELECT ROWID FROM SpatialIndex WHERE f_table_name = %s AND f_geometry_column = %s "
+            "AND search_frame = BuildMbr(%s, %s, %s, %s, 4326)",
+            (model._meta.db_table, column, west, south, east, north),
+        ))
+
+    box = Polygon.from_bbox(bbox)
+    box.srid = 4326
+    return queryset.filter(**{f'{field}__bboverlaps': box})
+
+
+def nearby(queryset, lat, lon, radius_km, limit, field='location'):
+    """
+    Up to limit objects within radius_km of (lat, lon), nearest first,
+    as (object, distance_km) pairs.
+    - The index narrows the table to the bounding box of the circle.
+    - Only ids and points are read for those candidates; exact distances
+      are computed in one NumPy pass.
+    - Full objects are loaded for the winners only.
+    """
+    candidates = list(in_bbox(queryset, bbox_around(lat, lon, radius_km), field).values_list('pk', field))
+    if not candidates:
+        return []
+
+    distances = distances_from(
+        lat, lon,
+        [point.y for _, point in candidates],
+        [point.x for _, point in candidates],
+    )
+    ranked = sorted(
+        (dist, pk) for (pk, _), dist in zip(candidates, distances) if dist <= radius_km
+    )[:limit]
+
+    objects = queryset.in_bulk([pk for _, pk in ranked])
+    return [(objects[pk], float(dist)) for dist, pk in ranked if pk in objects]
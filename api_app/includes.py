@@ -0,0 +1,87 @@
+from collections import OrderedDict
+
+from rest_framework.exceptions import ValidationError
+from rest_framework.permissions import SAFE_METHODS
+
+from .fieldsets import parse_field_list
+
+INCLUDE_PARAM = 'include'
+INCLUDE_ACTIONS = ('list', 'retrieve')
+
+
+class IncludeSerializerMixin:
+    """
+    Replaces the relations the view was asked to include (context['include']
+    maps a serializer class to names) with full nested objects.
+    Meta.includable maps each includable relation to its serializer. The
+    nested serializers are planned like any other field, so each relation
+    is one prefetch for the whole page (see api_app/planner.py).
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        for name in self.context.get('include', {}).get(type(self), []):
+            self.fields[name] = self.Meta.includable[name](many=True, read_only=True)
+
+
+class IncludeMixin:
+    """
+    Adds ?include=a,b to a viewset's list and retrieve, e.g.
+    /api/trails/?include=reviews,car_parks,transport_links
+    - retrieve: the relations are embedded in the object as full objects.
+    - list: each row keeps the ids, and the objects are sent once each in a
+      top-level 'included' section ({relation: [objects]}), so rows that
+      share related objects don't repeat them.
+    With ?fields= / ?exclude= (SparseFieldsetMixin), a relation that is a
+    serializer field (car_parks) must be among the selected fields, or the
+    request is rejected rather than one parameter silently winning. One
+    that only exists when included (reviews) is always added.
+    The serializer needs IncludeSerializerMixin and Meta.includable.
+    """
+
+    def get_includes(self):
+        if not hasattr(self, '_includes'):
+            request = getattr(self, 'request', None)
+            self._includes = []
+            if request is not None and request.method in SAFE_METHODS and getattr(self, 'action', None) in INCLUDE_ACTIONS:
+                names = parse_field_list(request.query_params.get(INCLUDE_PARAM, ''))
+                includable = list(self.get_serializer_class().Meta.includable)
+                unknown = [name for name in names if name not in includable]
+                if unknown:
+                    raise ValidationError({INCLUDE_PARAM: f"Can't include: {', '.join(unknown)}. Choose from: {', '.join(includable)}."})
+                keep = self.get_sparse_fields() if hasattr(self, 'get_sparse_fields') else None
+                if keep is not None:
+                    fields = self.get_serializer_class()().fields
+                    dropped = [name for name in names if name in fields and name not in keep]
+                else:
+                    dropped = []
+                if dropped:
+                    raise ValidationError({INCLUDE_PARAM: f"Can't include fields that ?fields= / ?exclude= leave out: {', '.join(dropped)}."})
+                self._includes = list(dict.fromkeys(names))
+        return self._includes
+
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        if self.get_includes():
+            context['include'] = {self.get_serializer_class(): self.get_includes()}
+        return context
+
+    def list(self, request, *args, **kwargs):
+        response = super().list(request, *args, **kwargs)
+        includes = self.get_includes()
+        if not includes or response.status_code != 200:
+            return response
+
+        data = response.data
+        if not isinstance(data, dict):
+            data = response.data = OrderedDict([('results', data)])
+
+        included = {name: OrderedDict() for name in includes}
+        for row in data['results']:
+            for name in includes:
+                objects = row[name]
+                row[name] = [obj['id'] for obj in objects]
+                for obj in objects:
+                    included[name].setdefault(obj['id'], obj)
+        data['included'] = {name: list(objects.values()) for name, objects in included.items()}
+        return response
@@ -0,0 +1,71 @@
+from django.contrib.gis.geos import LineString, MultiLineString
+from rest_framework.exceptions import ValidationError
+
+# --- CONFIGURATION ---
+# Simplification tolerance (degrees) for each precomputed level of detail.
+# 0.001 deg is ~100m (overview maps), 0.0001 deg is ~10m (a single trail).
+TOLERANCES = {
+    'low': 0.001,
+    'medium': 0.0001,
+}
+DETAIL_FIELDS = {
+    'low': 'path_low',
+    'medium': 'path_medium',
+    'full': 'path',
+}
+# Web map zoom -> level: up to 10 is low, up to 13 is medium, closer is full
+ZOOM_LEVELS = [(10, 'low'), (13, 'medium')]
+
+
+def simplify(path, tolerance):
+    """Topology-preserving simplification that always gives back a MultiLineString"""
+    if path is None:
+        return None
+    simplified = path.simplify(tolerance, preserve_topology=True)
+    if isinstance(simplified, LineString):
+        simplified = MultiLineString([simplified])
+    simplified.srid = path.srid
+    return simplified
+
+
+def simplified_paths(path):
+    """Every precomputed level of a trail path, keyed by model field name"""
+    return {DETAIL_FIELDS[level]: simplify(path, tolerance) for level, tolerance in TOLERANCES.items()}
+
+
+def detail_for_zoom(zoom):
+    for max_zoom, level in ZOOM_LEVELS:
+        if zoom <= max_zoom:
+            return level
+    return 'full'
+
+
+def detail_from_request(request, default):
+    """
+    Picks the path level for a request.
+    - ?detail=low|medium|full wins
+    - otherwise ?zoom=<web map zoom> is mapped through ZOOM_LEVELS
+    - otherwise the view's default
+    """
+    params = getattr(request, 'query_params', {}) if request is not None else {}
+
+    detail = params.get('detail')
+    if detail:
+        if detail not in DETAIL_FIELDS:
+            raise ValidationError({'detail': f"Must be one of: {', '.join(DETAIL_FIELDS)}."})
+        return detail
+
+    zoom = params.get('zoom')
+    if zoom:
+        try:
+            zoom = float(zoom)
+        except ValueError:
+            raise ValidationError({'zoom': "Must be a number."})
+        return detail_for_zoom(zoom)
+
+    return default
+
+
+def unused_path_fields(detail):
+    """Path columns a response at this level never reads, so they can be deferred"""
+    return [field for level, field in DETAIL_FIELDS.items() if level != detail]
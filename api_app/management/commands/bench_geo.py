@@ -0,0 +1,75 @@
+import random
+import time
+from math import radians, cos, sin, asin, sqrt
+from django.core.management.base import BaseCommand
+from api_app import geo
+
+class Command(BaseCommand):
+    help = 'Micro-benchmarks the NumPy geodesic kernels against the previous scalar Haversine loops'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--vertices', type=int, default=50000, help='Vertices in the synthetic trail (default 50000)')
+        parser.add_argument('--points', type=int, default=100000, help='Points for the one-to-many benchmark (default 100000)')
+        parser.add_argument('--repeat', type=int, default=5)
+
+    def scalar_length(self, points):
+        """The previous import_trails.haversine_length loop"""
+        if len(points) < 2: return 0.0
+        total_km = 0.0
+        R = 6371
+        for i in range(len(points) - 1):
+            lon1, lat1 = points[i]
+            lon2, lat2 = points[i+1]
+            lon1, lat1, lon2, lat2 = map(radians, [lon1, lat1, lon2, lat2])
+            dlon = lon2 - lon1
+            dlat = lat2 - lat1
+            a = sin(dlat/2)**2 + cos(lat1) * cos(lat2) * sin(dlon/2)**2
+            c = 2 * asin(sqrt(a))
+            total_km += c * R
+        return total_km
+
+    def best_of(self, repeat, func, *args):
+        best, result = float('inf'), None
+        for _ in range(repeat):
+            start = time.perf_counter()
+            result = func(*args)
+            best = min(best, time.perf_counter() - start)
+        return best, result
+
+    def report(self, label, scalar_s, vector_s, max_diff):
+        """max_diff: largest disagreement between the two implementations' results (km)"""
+        self.stdout.write(f"{label}")
+        self.stdout.write(f"  Scalar: {scalar_s * 1000:.2f} ms")
+        self.stdout.write(f"  NumPy:  {vector_s * 1000:.2f} ms")
+        self.stdout.write(self.style.SUCCESS(f"  Speed-up: {scalar_s / vector_s:.1f}x (max difference {max_diff:.2e} km)"))
+
+    def handle(self, *args, **options):
+        rng = random.Random(3011)
+        repeat = options['repeat']
+
+        # 1. Polyline length: a random walk around the Peak District
+        lon, lat = -1.8, 53.35
+        coords = []
+        for _ in range(options['vertices']):
+            lon += rng.uniform(-0.0005, 0.0005)
+            lat += rng.uniform(-0.0005, 0.0005)
+            coords.append((lon, lat))
+
+        scalar_s, scalar_len = self.best_of(repeat, self.scalar_length, coords)
+        vector_s, vector_len = self.best_of(repeat, geo.polyline_length, coords)
+        self.report(f"Polyline length ({len(coords)} vertices, {vector_len:.1f} km)", scalar_s, vector_s, abs(scalar_len - vector_len))
+
+        # 2. One-to-many distance
+        lats = [rng.uniform(53.15, 54.00) for _ in range(options['points'])]
+        lons = [rng.uniform(-2.10, -1.30) for _ in range(options['points'])]
+
+        def scalar_many():
+            return [geo.haversine_km(53.4, -1.7, la, lo) for la, lo in zip(lats, lons)]
+
+        def vector_many():
+            return geo.distances_from(53.4, -1.7, lats, lons)
+
+        scalar_s, scalar_d = self.best_of(repeat, scalar_many)
+        vector_s, vector_d = self.best_of(repeat, vector_many)
+        max_diff = max(abs(a - b) for a, b in zip(scalar_d, vector_d))
+        self.report(f"One-to-many distance ({len(lats)} points)", scalar_s, vector_s, max_diff)
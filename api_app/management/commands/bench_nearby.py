@@ -0,0 +1,64 @@
+import random
+import time
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from api_app.models import Trail, make_point
+from api_app.geo import distances_from
+from api_app.geoqueries import nearby
+
+class Command(BaseCommand):
+    help = 'Benchmarks /nearby through the spatial index against a full scan as the table grows (rolled back afterwards)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', default='1000,10000,100000', help='Comma-separated row counts (default 1000,10000,100000)')
+        parser.add_argument('--queries', type=int, default=50, help='Queries timed per size (default 50)')
+        parser.add_argument('--radius', type=float, default=2.0, help='Search radius in km (default 2)')
+
+    def random_point(self, rng):
+        # The import bounding box (Peak District / Leeds)
+        return rng.uniform(53.15, 54.00), rng.uniform(-2.10, -1.30)
+
+    def full_scan(self, lat, lon, radius, limit):
+        """The old way: every row's coordinates, filtered in Python"""
+        rows = list(Trail.objects.values_list('pk', 'latitude', 'longitude'))
+        distances = distances_from(lat, lon, [float(r[1]) for r in rows], [float(r[2]) for r in rows])
+        ranked = sorted((d, r[0]) for r, d in zip(rows, distances) if d <= radius)[:limit]
+        return list(Trail.objects.in_bulk([pk for _, pk in ranked]).values())
+
+    def time_queries(self, func, points, radius):
+        start = time.perf_counter()
+        for lat, lon in points:
+            func(lat, lon, radius, 20)
+        return (time.perf_counter() - start) / len(points) * 1000
+
+    def handle(self, *args, **options):
+        rng = random.Random(3011)
+        sizes = sorted(int(size) for size in options['sizes'].split(','))
+        points = [self.random_point(rng) for _ in range(options['queries'])]
+        radius = options['radius']
+
+        def indexed(lat, lon, radius, limit):
+            return nearby(Trail.objects.all(), lat, lon, radius, limit)
+
+        self.stdout.write(f"{'rows':>8}  {'index ms':>9}  {'scan ms':>9}")
+        with transaction.atomic():
+            inserted = Trail.objects.count()
+            for size in sizes:
+                new_rows = []
+                for i in range(inserted, size):
+                    lat, lon = self.random_point(rng)
+                    new_rows.append(Trail(
+                        name=f"Bench {i}", latitude=round(lat, 6), longitude=round(lon, 6),
+                        location=make_point(lat, lon),
+                    ))
+                Trail.objects.bulk_create(new_rows, batch_size=1000)
+                inserted = max(inserted, size)
+
+                index_ms = self.time_queries(indexed, points, radius)
+                scan_ms = self.time_queries(self.full_scan, points, radius)
+                self.stdout.write(f"{inserted:>8}  {index_ms:>9.2f}  {scan_ms:>9.2f}")
+
+            # Leave the database exactly as it was
+            transaction.set_rollback(True)
+
+        self.stdout.write(self.style.SUCCESS("Done (benchmark rows rolled back)."))
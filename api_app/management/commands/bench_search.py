@@ -0,0 +1,63 @@
+import random
+import time
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.db.models import Q
+from api_app.models import Trail
+from api_app.filters import full_text_search
+
+WORDS = ['Mam', 'Tor', 'Kinder', 'Scout', 'Stanage', 'Edge', 'Ladybower', 'Reservoir', 'Bleaklow',
+         'Hathersage', 'Castleton', 'Dovedale', 'Ilkley', 'Moor', 'Otley', 'Chevin', 'Roundhay',
+         'Meanwood', 'Valley', 'Golden', 'Acre', 'Eccup', 'Harewood', 'Pike', 'Ridge', 'Beck']
+SUFFIXES = ['Walk', 'Trail', 'Way', 'Loop', 'Circuit', 'Circular']
+REGIONS = ['Peak District', 'Leeds & Yorkshire']
+
+class Command(BaseCommand):
+    help = 'Benchmarks FTS5 trail search against the LIKE-based SearchFilter (rows rolled back afterwards)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=100000, help='Trails in the table while timing (default 100000)')
+        parser.add_argument('--repeat', type=int, default=20, help='Runs per search term (default 20)')
+
+    def like_search(self, text):
+        """What SearchFilter compiles to: every term LIKE '%term%' over name or region"""
+        queryset = Trail.objects.all()
+        for term in text.split():
+            queryset = queryset.filter(Q(name__icontains=term) | Q(region__icontains=term))
+        return queryset
+
+    def time_search(self, build, text, repeat):
+        start = time.perf_counter()
+        for _ in range(repeat):
+            results = list(build(text).values_list('id', flat=True))
+        return (time.perf_counter() - start) / repeat * 1000, len(results)
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'sqlite':
+            raise CommandError('The FTS5 index only exists on SQLite.')
+
+        rng = random.Random(3011)
+        terms = ['mam', 'mam to', 'kinder sc', 'reservoir loop', 'golden acre', 'zzz']
+
+        with transaction.atomic():
+            existing = Trail.objects.count()
+            rows = [
+                Trail(
+                    name=f"{' '.join(rng.sample(WORDS, 2))} {rng.choice(SUFFIXES)}",
+                    region=rng.choice(REGIONS), latitude=53.4, longitude=-1.8,
+                )
+                for _ in range(max(options['rows'] - existing, 0))
+            ]
+            Trail.objects.bulk_create(rows, batch_size=2000)
+            self.stdout.write(f"{Trail.objects.count()} trails\n")
+
+            self.stdout.write(f"{'search':<16} {'LIKE ms':>9} {'FTS5 ms':>9} {'speed-up':>9}")
+            for text in terms:
+                like_ms, _ = self.time_search(self.like_search, text, options['repeat'])
+                fts_ms, _ = self.time_search(lambda t: full_text_search(Trail.objects.all(), t), text, options['repeat'])
+                self.stdout.write(f"{text:<16} {like_ms:>9.2f} {fts_ms:>9.2f} {like_ms / fts_ms:>8.1f}x")
+
+            # Leave the database exactly as it was
+            transaction.set_rollback(True)
+
+        self.stdout.write(self.style.SUCCESS("Done (benchmark rows rolled back)."))
@@ -0,0 +1,79 @@
+import random
+import time
+from django.core.management.base import BaseCommand
+from api_app.geo import haversine_km
+from api_app.spatial import GridIndex
+
+# Same area import_services searches: Peak District / Leeds
+LAT_RANGE = (53.15, 54.00)
+LON_RANGE = (-2.10, -1.30)
+SEARCH_RADIUS_KM = 1.0
+
+class Command(BaseCommand):
+    help = 'Benchmarks the trail spatial index against the old linear nearest-trail scan (synthetic data, no database)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--trails', type=int, default=10000)
+        parser.add_argument('--stops', type=int, default=200000)
+        parser.add_argument('--linear-sample', type=int, default=500, help='Stops to time with the linear scan (it is too slow to run on all of them)')
+        parser.add_argument('--seed', type=int, default=3011)
+
+    def random_points(self, rng, count):
+        return [(rng.uniform(*LAT_RANGE), rng.uniform(*LON_RANGE)) for _ in range(count)]
+
+    def linear_nearest(self, lat, lon, trails):
+        """The previous import_services.get_nearest_trail: pre-check then Haversine on every trail"""
+        closest, min_dist = None, float('inf')
+        for trail_id, t_lat, t_lon in trails:
+            if abs(t_lat - lat) > 0.05: continue
+            if abs(t_lon - lon) > 0.08: continue
+            dist = haversine_km(lat, lon, t_lat, t_lon)
+            if dist < min_dist:
+                closest, min_dist = trail_id, dist
+        return closest, min_dist
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        trails = [(i, lat, lon) for i, (lat, lon) in enumerate(self.random_points(rng, options['trails']), start=1)]
+        stops = self.random_points(rng, options['stops'])
+        sample = stops[:options['linear_sample']]
+
+        self.stdout.write(f"Trails: {len(trails)}  Stops: {len(stops)}")
+
+        # 1. Build
+        start = time.perf_counter()
+        index = GridIndex(trails)
+        build_s = time.perf_counter() - start
+        self.stdout.write(f"  Index build: {build_s * 1000:.1f} ms")
+
+        # 2. Index over every stop
+        start = time.perf_counter()
+        linked = 0
+        for lat, lon in stops:
+            if index.nearest(lat, lon, max_km=SEARCH_RADIUS_KM):
+                linked += 1
+        index_s = time.perf_counter() - start
+        per_stop_index = index_s / len(stops)
+        self.stdout.write(f"  Index nearest: {index_s:.2f} s total, {per_stop_index * 1e6:.1f} us/stop ({linked} linked)")
+
+        # 3. Linear scan over a sample, checking both agree
+        start = time.perf_counter()
+        mismatches = 0
+        for lat, lon in sample:
+            trail_id, dist = self.linear_nearest(lat, lon, trails)
+            expected = trail_id if dist <= SEARCH_RADIUS_KM else None
+            found = index.nearest(lat, lon, max_km=SEARCH_RADIUS_KM)
+            if (found[0][1] if found else None) != expected:
+                mismatches += 1
+        linear_s = time.perf_counter() - start
+        per_stop_linear = linear_s / max(len(sample), 1)
+        self.stdout.write(
+            f"  Linear scan: {per_stop_linear * 1e6:.1f} us/stop "
+            f"(~{per_stop_linear * len(stops):.0f} s projected for all stops)"
+        )
+
+        self.stdout.write(self.style.SUCCESS(f"  Speed-up: {per_stop_linear / per_stop_index:.0f}x"))
+        if mismatches:
+            self.stdout.write(self.style.ERROR(f"  {mismatches}/{len(sample)} sampled stops linked differently!"))
+        else:
+            self.stdout.write(self.style.SUCCESS(f"  All {len(sample)} sampled stops linked to the same trail."))
@@ -0,0 +1,54 @@
+from django.core.cache import caches
+from django.core.management.base import BaseCommand, CommandError
+from api_app.sqlitecache import SQLiteCache
+
+class Command(BaseCommand):
+    help = 'Shows hit ratio, evictions and size of the shared cache (SQLite or Redis)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--reset', action='store_true', help='Zero the hit/miss/eviction counters afterwards')
+
+    def sqlite_stats(self):
+        stats = self.cache.stats()
+        if self.reset:
+            self.cache.reset_stats()
+        return stats
+
+    def redis_stats(self):
+        """Server-wide counters from INFO, so they include every worker and host"""
+        client = self.cache._cache.get_client(write=True)
+        info = client.info()
+        lookups = info['keyspace_hits'] + info['keyspace_misses']
+        if self.reset:
+            client.config_resetstat()
+        return {
+            'hits': info['keyspace_hits'],
+            'misses': info['keyspace_misses'],
+            'hit_ratio': info['keyspace_hits'] / lookups if lookups else None,
+            'evictions': info['evicted_keys'],
+            'entries': client.dbsize(),
+            'size_bytes': info['used_memory'],
+        }
+
+    def handle(self, *args, **options):
+        self.reset = options['reset']
+        # The backend itself, not the django.core.cache.cache proxy
+        cache = self.cache = caches['default']
+        backend = type(cache).__name__
+        if isinstance(cache, SQLiteCache):
+            stats = self.sqlite_stats()
+        elif backend == 'RedisCache':
+            stats = self.redis_stats()
+        else:
+            raise CommandError(f'{backend} does not keep stats; use api_app.sqlitecache.SQLiteCache or REDIS_URL.')
+
+        ratio = 'n/a' if stats['hit_ratio'] is None else f"{stats['hit_ratio']:.1%}"
+        self.stdout.write(f"Backend:    {backend}")
+        self.stdout.write(f"Hits:       {stats['hits']}")
+        self.stdout.write(f"Misses:     {stats['misses']}")
+        self.stdout.write(f"Hit ratio:  {ratio}")
+        self.stdout.write(f"Evictions:  {stats['evictions']}")
+        self.stdout.write(f"Entries:    {stats['entries']}")
+        self.stdout.write(f"Size:       {stats['size_bytes'] / 1024:.1f} KiB")
+        if self.reset:
+            self.stdout.write(self.style.SUCCESS('Counters reset.'))
@@ -1,6 +1,8 @@
 from django.core.management.base import BaseCommand
 from django.db import connection
 from api_app.models import Trail
+from api_app.dataversion import bump_data_version
+from api_app.clustering import rebuild_clusters
 
 class Command(BaseCommand):
     help = 'Clears all trails and resets ID counter'
@@ -8,6 +10,8 @@ class Command(BaseCommand):
     def handle(self, *args, **kwargs):
         # 1. Delete all trails
         count, _ = Trail.objects.all().delete()
+        bump_data_version()
+        rebuild_clusters()
         self.stdout.write(f'Deleted {count} trails.')
 
         # 2. Reset the ID counter (SQLite specific)
@@ -1,6 +1,8 @@
 from django.core.management.base import BaseCommand
 from django.db import connection
 from api_app.models import TransportLink
+from api_app.dataversion import bump_data_version
+from api_app.clustering import rebuild_clusters
 
 class Command(BaseCommand):
     help = 'Deletes all Transport Links and resets the ID counter to 1'
@@ -8,6 +10,8 @@ class Command(BaseCommand):
     def handle(self, *args, **kwargs):
         # 1. Delete all rows
         count, _ = TransportLink.objects.all().delete()
+        bump_data_version()
+        rebuild_clusters()
         
         # 2. Reset ID counter
         table_name = 'api_app_transportlink'
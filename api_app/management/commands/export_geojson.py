@@ -0,0 +1,30 @@
+import sys
+from django.core.management.base import BaseCommand, CommandError
+from api_app.export import DATASETS, FORMATS, CHUNK_SIZE, iter_export, resolve_datasets
+
+class Command(BaseCommand):
+    help = 'Streams trails, car parks and/or transport links to a GeoJSON or NDJSON file'
+
+    def add_arguments(self, parser):
+        parser.add_argument('dataset', nargs='?', default='all', choices=['all', *DATASETS], help='What to export (default all)')
+        parser.add_argument('--format', default='geojson', choices=list(FORMATS), help='FeatureCollection (geojson) or one feature per line (ndjson)')
+        parser.add_argument('--output', '-o', help='File to write (default: stdout)')
+        parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE, help=f'Rows fetched per database round trip (default {CHUNK_SIZE})')
+
+    def handle(self, *args, **options):
+        datasets = resolve_datasets(options['dataset'])
+        chunks = iter_export(datasets, options['format'], options['chunk_size'])
+
+        if not options['output']:
+            for chunk in chunks:
+                sys.stdout.write(chunk)
+            return
+
+        try:
+            with open(options['output'], 'w', encoding='utf-8') as f:
+                for chunk in chunks:
+                    f.write(chunk)
+        except OSError as e:
+            raise CommandError(f"Could not write {options['output']}: {e}")
+
+        self.stdout.write(self.style.SUCCESS(f"Exported {', '.join(datasets)} to {options['output']}"))
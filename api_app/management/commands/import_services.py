@@ -1,90 +1,105 @@
-import requests
-import time
-from math import radians, cos, sin, asin, sqrt
-from django.core.management.base import BaseCommand
-from api_app.models import Trail, TransportLink, CarPark
+import hashlib
+from itertools import chain
+from pathlib import Path
+from django.db.models import Q
+from api_app.models import Trail, TransportLink, CarPark, make_point
+from api_app.overpass import (
+    OverpassImportCommand, OverpassError, ImportState, read_elements, file_digest,
+    MALFORMED_ELEMENT_ERRORS,
+)
+from api_app.spatial import GridIndex
+from api_app.bulk import BulkUpserter
+from api_app.dataversion import bump_data_version
+from api_app.clustering import rebuild_clusters
 
 # --- CONFIGURATION ---
 SEARCH_RADIUS_KM = 1.0  # Max distance to link a stop/park to a trail
 BBOX = "(53.15, -2.10, 54.00, -1.30)" # Peak District / Leeds Area
 
-class Command(BaseCommand):
+class Command(OverpassImportCommand):
     help = 'Imports Car Parks and Transport links using optimized nearest-neighbor search'
+    # Using kumi.systems mirror because it is much faster for heavy queries
+    # 120s timeout for large datasets
+    overpass_url = "https://overpass.kumi.systems/api/interpreter"
+    overpass_timeout = 120
 
-    def haversine(self, lat1, lon1, lat2, lon2):
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500, help='Rows written per bulk insert/update transaction (default 500)')
+        parser.add_argument('--from-file', nargs='+', help='Import from saved Overpass JSON dumps (.json or .json.gz) instead of downloading')
+        parser.add_argument('--cached', action='store_true', help='Reuse the last saved Overpass responses instead of downloading')
+        parser.add_argument('--incremental', action='store_true', help='Only process elements that changed since the last run, and delete ones that disappeared')
+
+    def get_nearest_trail(self, lat, lon, trail_index):
         """
-        Standard Haversine Formula for distance between two points
+        Nearest Neighbor Search using the grid index.
+        Only the grid cells around the point are checked, so each lookup costs
+        the same no matter how many trails are loaded.
+        Returns (trail_id, distance_km), or (None, inf) if nothing is in range.
         """
-        lon1, lat1, lon2, lat2 = map(radians, [lon1, lat1, lon2, lat2])
-        dlon = lon2 - lon1 
-        dlat = lat2 - lat1 
-        a = sin(dlat/2)**2 + cos(lat1) * cos(lat2) * sin(dlon/2)**2
-        c = 2 * asin(sqrt(a)) 
-        return c * 6371 
-
-    def get_nearest_trail(self, lat, lon, all_trails):
+        nearest = trail_index.nearest(lat, lon, max_km=SEARCH_RADIUS_KM)
+        if not nearest:
+            return None, float('inf')
+        dist, trail_id = nearest[0]
+        return trail_id, dist
+
+    def load_trail_index(self):
+        """Builds the spatial index ONCE per import from trail id/lat/lon only"""
+        trail_index = GridIndex.from_queryset(Trail.objects.all())
+        self.stdout.write(f"  > Indexed {len(trail_index)} trails for comparison.")
+        return trail_index
+
+    def trail_fingerprint(self):
         """
-        Optimized Nearest Neighbor Search.
-        Uses a 'Pre-Check' to skip heavy math for trails that are obviously too far.
+        Hash of every trail's id and position. Stops are linked to the nearest
+        trail, so if this changed an incremental run has to relink everything.
         """
-        closest_trail = None
-        min_dist = float('inf')
+        sha = hashlib.sha1()
+        for row in Trail.objects.order_by('id').values_list('id', 'latitude', 'longitude').iterator():
+            sha.update(repr(row).encode())
+        return sha.hexdigest()
 
-        # OPTIMIZATION: 
-        # 0.05 degrees is approx 5.5km. If a trail is further than this in pure 
-        # lat/lon difference, we don't even bother calculating the precise Haversine distance.
-        lat_threshold = 0.05 
-        lon_threshold = 0.08 
+    def fetch_sources(self, query):
+        """Returns the raw Overpass responses to import from"""
+        if self.options['from_file']:
+            return [Path(path) for path in self.options['from_file']]
 
-        for trail in all_trails:
+        self.stdout.write("  > Downloading data...")
+        return [self.download(query, cached=self.options['cached'])]
 
-            t_lat = float(trail.latitude)
-            t_lon = float(trail.longitude)
+    def open_sources(self, name, model, query):
+        """
+        Fetches the sources for one step and loads its incremental state.
+        Returns (elements, state, digests), or None if there is nothing to do.
+        """
+        try:
+            sources = self.fetch_sources(query)
+        except OverpassError as e:
+            self.stdout.write(self.style.ERROR(f"  > Download Failed: {e}"))
+            return None
 
-            # 1. Cheap Pre-Check
-            if abs(t_lat - lat) > lat_threshold: continue
-            if abs(t_lon - lon) > lon_threshold: continue
+        state = ImportState(name, self.options['incremental'], context=self.trail_context, model=model)
+        digests = [file_digest(source) for source in sources]
+        if state.source_unchanged(digests):
+            self.stdout.write(self.style.SUCCESS("  > No upstream changes since the last import."))
+            return None
 
-            # 2. Expensive Check (Trigonometry)
-            dist = self.haversine(lat, lon, t_lat, t_lon)
-            
-            if dist < min_dist:
-                min_dist = dist
-                closest_trail = trail
-        
-        return closest_trail, min_dist
+        elements = chain.from_iterable(read_elements(source) for source in sources)
+        return elements, state, digests
 
-    def fetch_overpass_data(self, query):
-        """
-        Robust Fetcher: Uses a faster mirror, retries on failure, and handles rate limits.
-        """
-        # Using kumi.systems mirror because it is much faster for heavy queries
-        url = "https://overpass.kumi.systems/api/interpreter"
-        headers = {
-            'User-Agent': 'LeedsHikingApp/1.0',
-            'Referer': 'http://localhost:8000/'
-        }
-        
-        self.stdout.write("  > Downloading data...")
-        
-        for attempt in range(3):
-            try:
-                # 120s timeout for large datasets
-                resp = requests.get(url, headers=headers, params={'data': query}, timeout=120)
-                
-                if resp.status_code == 429:
-                    self.stdout.write(self.style.WARNING(f"    Rate limited. Waiting 15s... (Attempt {attempt+1})"))
-                    time.sleep(15)
-                    continue
-                
-                resp.raise_for_status()
-                return resp.json()
-                
-            except Exception as e:
-                self.stdout.write(self.style.WARNING(f"    Attempt {attempt+1} failed: {e}"))
-                time.sleep(5)
-                
-        return None
+    def finish_state(self, model, label, state, digests, key_fields):
+        """Deletes rows whose elements disappeared upstream and saves the state"""
+        removed = state.removed_keys()
+        for start in range(0, len(removed), self.batch_size):
+            # One DELETE per chunk: (name = ? AND trail_id = ?) OR (...) ...
+            match = Q()
+            for key in removed[start:start + self.batch_size]:
+                match |= Q(**dict(zip(key_fields, key)))
+            model.objects.filter(match).delete()
+        if removed:
+            self.stdout.write(f"  > Removed {len(removed)} {label} that disappeared upstream.")
+        if state.skipped:
+            self.stdout.write(f"  > Skipped {state.skipped} unchanged {label}.")
+        state.save(digests)
     
     def is_public_parking(self, tags):
         """
@@ -113,9 +128,7 @@ class Command(BaseCommand):
     def import_carparks(self):
         self.stdout.write(self.style.SUCCESS("\n--- STEP 1: CAR PARKS ---"))
         
-        # Load all trails into memory ONCE
-        all_trails = list(Trail.objects.all())
-        self.stdout.write(f"  > Loaded {len(all_trails)} trails for comparison.")
+        trail_index = self.load_trail_index()
         
         # Fetch Data
         query = f"""
@@ -126,92 +139,137 @@ class Command(BaseCommand):
             );
             out center;
         """
-        data = self.fetch_overpass_data(query)
-        if not data: return
-
-        elements = data.get('elements', [])
-        total = len(elements)
-        self.stdout.write(f"  > Downloaded {total} potential car parks. Processing...")
+        opened = self.open_sources('carparks', CarPark, query)
+        if not opened: return
+        elements, state, digests = opened
 
+        # Pipeline: stream -> public parking only -> skip unchanged -> link & save
         count = 0
         saved = 0
+        malformed = self.malformed_elements()
+        writer = BulkUpserter(
+            CarPark,
+            key_fields=['name', 'trail_id'],
+            update_fields=['latitude', 'longitude', 'location', 'capacity', 'is_free', 'has_disabled_parking'],
+            batch_size=self.batch_size,
+        )
 
         for element in elements:
-            tags = element.get('tags', {})
-
-            # Check for public parking
-            if not self.is_public_parking(tags):
-                continue
+            # A malformed element is skipped and counted, never queued
+            try:
+                tags = element.get('tags') or {}
+                if tags.get('amenity') != 'parking' or not self.is_public_parking(tags): continue
+                if state.unchanged(element): continue
+                state.record(element, None)
 
-            count += 1
-            if count % 50 == 0:
-                self.stdout.write(f"    Processing {count}/{total}...", ending='\r')
+                count += 1
+                if count % 50 == 0:
+                    self.stdout.write(f"    Processing {count}...", ending='\r')
 
-            # Get Coords
-            lat = element.get('lat') or element.get('center', {}).get('lat')
-            lon = element.get('lon') or element.get('center', {}).get('lon')
-            if not lat or not lon: continue
+                carpark = self.parse_carpark(element, tags, trail_index)
+            except MALFORMED_ELEMENT_ERRORS as e:
+                malformed.skip(element, e)
+                continue
 
-            # Find Trail
-            trail, dist = self.get_nearest_trail(lat, lon, all_trails)
-            
-            if trail and dist <= SEARCH_RADIUS_KM:
-                
-                # Parse name
-                name = tags.get('name', 'Unnamed Car Park')
-                
-                # Parse capacity
-                cap_str = tags.get('capacity')
-                if cap_str and cap_str.isdigit():
-                    capacity = int(cap_str)
-                else:
-                    capacity = None
-                
-                # Parse is_free
-                fee_tag = tags.get('fee')
-                
-                if fee_tag:
-                    # 'no' means no fee (Free)
-                    if fee_tag.lower() == 'no':
-                        is_free = True
-                    else:
-                        # 'yes', 'interval', 'permissive' -> Not Free
-                        is_free = False
-                else:
-                    is_free = None # Unknown
-
-                # Parse disabled parking
-                raw_disabled = tags.get('disabled_parking') or tags.get('capacity:disabled')
-                
-                if raw_disabled:
-                    # If explicitly marked 'no', '0', or 'none' -> False
-                    if raw_disabled.lower() in ['no', '0', 'none']:
-                        has_disabled = False
-                    else:
-                        has_disabled = True
-                else:
-                    has_disabled = None
-
-                # Save
-                CarPark.objects.update_or_create(
-                    name=name,
-                    trail=trail,
-                    defaults={
-                        'latitude': lat,
-                        'longitude': lon,
-                        'capacity': capacity,
-                        'is_free': is_free,
-                        'has_disabled_parking': has_disabled,
-                    }
-                )
+            if carpark:
+                # Save (queued, written in batches)
+                writer.add(**carpark)
+                state.record(element, [carpark['name'], carpark['trail_id']])
                 saved += 1
-                
+
+        self.stdout.write(f"  > Processed {count} public car parks.")
+        malformed.report()
+        self.report_writes("  > Wrote car parks", writer.finish())
+        self.finish_state(CarPark, "car parks", state, digests, ['name', 'trail_id'])
         self.stdout.write(self.style.SUCCESS(f"  > DONE! Linked {saved} Car Parks."))
 
+    def parse_carpark(self, element, tags, trail_index):
+        """CarPark fields for one parking element, or None if it has no position or nearby trail"""
+        # Get Coords
+        center = element.get('center') or {}
+        lat = element.get('lat') or center.get('lat')
+        lon = element.get('lon') or center.get('lon')
+        if not lat or not lon: return None
+
+        # Find Trail
+        trail_id, dist = self.get_nearest_trail(lat, lon, trail_index)
+        
+        if not trail_id or dist > SEARCH_RADIUS_KM: return None
+
+        # Parse name
+        name = tags.get('name', 'Unnamed Car Park')
+        
+        # Parse capacity
+        cap_str = tags.get('capacity')
+        if cap_str and cap_str.isdigit():
+            capacity = int(cap_str)
+        else:
+            capacity = None
+        
+        # Parse is_free
+        fee_tag = tags.get('fee')
+        
+        if fee_tag:
+            # 'no' means no fee (Free)
+            if fee_tag.lower() == 'no':
+                is_free = True
+            else:
+                # 'yes', 'interval', 'permissive' -> Not Free
+                is_free = False
+        else:
+            is_free = None # Unknown
+
+        # Parse disabled parking
+        raw_disabled = tags.get('disabled_parking') or tags.get('capacity:disabled')
+        
+        if raw_disabled:
+            # If explicitly marked 'no', '0', or 'none' -> False
+            if raw_disabled.lower() in ['no', '0', 'none']:
+                has_disabled = False
+            else:
+                has_disabled = True
+        else:
+            has_disabled = None
+
+        return {
+            'name': name,
+            'trail_id': trail_id,
+            'latitude': lat,
+            'longitude': lon,
+            'location': make_point(lat, lon),
+            'capacity': capacity,
+            'is_free': is_free,
+            'has_disabled_parking': has_disabled,
+        }
+
+    def parse_stop(self, element, trail_index):
+        """TransportLink fields for one stop or station, or None if it isn't linked"""
+        lat = element.get('lat')
+        lon = element.get('lon')
+        if not lat or not lon: return None
+
+        tags = element.get('tags') or {}
+        if tags.get('railway') == 'station': t_type = 'Train'
+        elif tags.get('highway') == 'bus_stop': t_type = 'Bus'
+        else: return None
+
+        # Find Trail
+        trail_id, dist = self.get_nearest_trail(lat, lon, trail_index)
+        if not trail_id or dist > SEARCH_RADIUS_KM: return None
+
+        return {
+            'name': tags.get('name', f"{t_type} Stop"),
+            'trail_id': trail_id,
+            'type': t_type,
+            'latitude': lat,
+            'longitude': lon,
+            'location': make_point(lat, lon),
+        }
+
     def import_transport(self):
         self.stdout.write(self.style.SUCCESS("\n--- STEP 2: TRANSPORT LINKS ---"))
         
-        all_trails = list(Trail.objects.all())
+        trail_index = self.load_trail_index()
         
         query = f"""
             [out:json][timeout:180];
@@ -222,50 +280,52 @@ class Command(BaseCommand):
             out body;
         """
 
-        data = self.fetch_overpass_data(query)
-        if not data: return
-
-        elements = data.get('elements', [])
-        total = len(elements)
-        self.stdout.write(f"  > Downloaded {total} transport stops. Processing...")
+        opened = self.open_sources('transport', TransportLink, query)
+        if not opened: return
+        elements, state, digests = opened
 
         count = 0
         saved = 0
+        malformed = self.malformed_elements()
+        writer = BulkUpserter(
+            TransportLink,
+            key_fields=['name', 'trail_id', 'type'],
+            update_fields=['latitude', 'longitude', 'location'],
+            batch_size=self.batch_size,
+        )
         
         for element in elements:
-            count += 1
-            if count % 100 == 0:
-                self.stdout.write(f"    Processing {count}/{total}...", ending='\r')
-
-            lat = element.get('lat')
-            lon = element.get('lon')
-            if not lat: continue
-
-            tags = element.get('tags', {})
-            if tags.get('railway') == 'station': t_type = 'Train'
-            elif tags.get('highway') == 'bus_stop': t_type = 'Bus'
-            else: continue
-
-            # Find Trail
-            trail, dist = self.get_nearest_trail(lat, lon, all_trails)
-
-            if trail and dist <= SEARCH_RADIUS_KM:
-                name = tags.get('name', f"{t_type} Stop")
-                
-                TransportLink.objects.update_or_create(
-                    name=name,
-                    trail=trail,
-                    type=t_type,
-                    defaults={
-                        'latitude': lat,
-                        'longitude': lon,
-                    }
-                )
+            # A malformed element is skipped and counted, never queued
+            try:
+                if state.unchanged(element): continue
+                state.record(element, None)
+
+                count += 1
+                if count % 100 == 0:
+                    self.stdout.write(f"    Processing {count}...", ending='\r')
+
+                stop = self.parse_stop(element, trail_index)
+            except MALFORMED_ELEMENT_ERRORS as e:
+                malformed.skip(element, e)
+                continue
+
+            if stop:
+                writer.add(**stop)
+                state.record(element, [stop['name'], stop['trail_id'], stop['type']])
                 saved += 1
-        
+
+        self.stdout.write(f"  > Processed {count} transport stops.")
+        malformed.report()
+        self.report_writes("  > Wrote transport links", writer.finish())
+        self.finish_state(TransportLink, "transport links", state, digests, ['name', 'trail_id', 'type'])
         self.stdout.write(self.style.SUCCESS(f"  > DONE! Linked {saved} Transport Links."))
 
     def handle(self, *args, **kwargs):
+        self.batch_size = kwargs['batch_size']
+        self.options = kwargs
+        self.trail_context = self.trail_fingerprint()
         self.import_carparks()
         self.import_transport()
+        bump_data_version()
+        rebuild_clusters()
         self.stdout.write(self.style.SUCCESS("\nAll services imported successfully!"))
\ No newline at end of file
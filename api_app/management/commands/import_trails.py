@@ -1,32 +1,34 @@
-import requests
-from math import radians, cos, sin, asin, sqrt, ceil
-from django.core.management.base import BaseCommand
-from api_app.models import Trail
+import os
+import time
+from math import ceil
+from pathlib import Path
+from api_app.models import Trail, make_point, envelope_fields
+from api_app.geo import polyline_length
+from api_app.elevation import ElevationService, sample_line
+from api_app.bulk import BulkUpserter
+from api_app.pool import pooled_map
+from api_app.lod import simplified_paths
+from api_app.dataversion import bump_data_version
+from api_app.clustering import rebuild_clusters
+from api_app.overpass import (
+    OverpassImportCommand, OverpassError, ImportState, read_elements, file_digest,
+    MALFORMED_ELEMENT_ERRORS,
+)
 from django.contrib.gis.geos import LineString, MultiLineString
 
 # --- CONFIGURATION ---
 FETCH_ELEVATION = True 
 SKIP_EXTREME_TRAILS = True
 MAX_TRAIL_LENGTH = 60
+ELEVATION_BATCH = 25  # Trails whose sample points are looked up together
+TRAIL_FIELDS = ['latitude', 'longitude', 'location', 'path', 'path_low', 'path_medium',
+                'bbox_west', 'bbox_south', 'bbox_east', 'bbox_north', 'length', 'elevation_gain', 'region',
+                'difficulty', 'estimated_duration', 'popularity']
 
-class Command(BaseCommand):
+class Command(OverpassImportCommand):
     help = 'Imports trails with Difficulty and Duration estimates'
-
-    def haversine_length(self, points):
-        """Calculates length in km"""
-        if len(points) < 2: return 0.0
-        total_km = 0.0
-        R = 6371 
-        for i in range(len(points) - 1):
-            lon1, lat1 = points[i]
-            lon2, lat2 = points[i+1]
-            lon1, lat1, lon2, lat2 = map(radians, [lon1, lat1, lon2, lat2])
-            dlon = lon2 - lon1
-            dlat = lat2 - lat1
-            a = sin(dlat/2)**2 + cos(lat1) * cos(lat2) * sin(dlon/2)**2
-            c = 2 * asin(sqrt(a))
-            total_km += c * R
-        return total_km
+    overpass_url = "http://overpass-api.de/api/interpreter"
+    overpass_timeout = 300
 
     def calculate_metrics(self, length_km, elevation_gain_m):
         """
@@ -61,30 +63,173 @@ class Command(BaseCommand):
 
         return difficulty, duration_str
 
-    def calculate_elevation(self, points):
-        """Gets rough elevation gain"""
-        if not FETCH_ELEVATION or not points: return 0.0
-        sampled = points[::50] 
-        if not sampled: return 0.0
-        
-        locations = [{"latitude": lat, "longitude": lon} for lon, lat in sampled]
-        try:
-            url = 'https://api.open-elevation.com/api/v1/lookup'
-            response = requests.post(url, json={'locations': locations}, timeout=2)
-            data = response.json()
-            elevs = [r['elevation'] for r in data['results']]
-            return round(max(elevs) - min(elevs), 2)
-        except:
-            return 0.0
+    def calculate_elevation(self, profiles):
+        """
+        Cumulative ascent (m) along the trail's sampled lines.
+        Returns None when elevation is off or couldn't be found, so an
+        unknown gain is never stored as a flat 0.
+        """
+        if not FETCH_ELEVATION or self.elevation is None: return None
+        return self.elevation.ascent(profiles)
 
     def get_region_name(self, latitude):
         if latitude < 53.65: return "Peak District"
         else: return "Leeds & Yorkshire"
 
+    def add_arguments(self, parser):
+        parser.add_argument('--from-file', help='Import from a saved Overpass JSON dump (.json or .json.gz) instead of downloading')
+        parser.add_argument('--cached', action='store_true', help='Reuse the last saved Overpass response for this query instead of downloading')
+        parser.add_argument('--incremental', action='store_true', help='Only process trails whose OSM elements changed since the last run, and delete ones that disappeared')
+        parser.add_argument('--workers', type=int, default=1, help='Build trail geometry in N worker processes (default 1, no pool; 0 = one per CPU)')
+        parser.add_argument('--batch-size', type=int, default=500, help='Trails written per bulk INSERT/UPDATE (default 500)')
+        parser.add_argument('--dem', help='Sample elevation from a local DEM (GeoTIFF in EPSG:4326, an SRTM .hgt tile or a folder of them) instead of Open-Elevation')
+
+    def fetch_source(self, query, options):
+        """Returns the path of the raw Overpass response to import from"""
+        if options['from_file']:
+            return Path(options['from_file'])
+        return self.download(query, cached=options['cached'])
+
+    def changed_candidates(self, elements, state):
+        """
+        Filters out footpaths, bridleways and roads before any geometry work,
+        then elements unchanged since the last run.
+        """
+        for element in elements:
+            try:
+                tags = element.get('tags') or {}
+                name = tags.get('name', 'Unknown')
+
+                if "Public Footpath" in name or "Bridleway" in name: continue
+                if tags.get('highway') in ['residential', 'service', 'primary']: continue
+                if state.unchanged(element): continue
+            except MALFORMED_ELEMENT_ERRORS as e:
+                self.malformed.skip(element, e)
+                continue
+
+            yield element
+
+    def build_trail(self, element):
+        """
+        Turns one Overpass element into Trail fields.
+        Returns None if the element has no usable geometry or fails a filter.
+        """
+        tags = element.get('tags') or {}
+        name = tags.get('name', 'Unknown')
+
+        # --- Geometry Collection ---
+        lines_list = [] 
+        
+        if element['type'] == 'relation' and 'members' in element:
+            for member in element['members']:
+                if member.get('type') == 'way' and 'geometry' in member:
+                    pts = [(pt['lon'], pt['lat']) for pt in member['geometry']]
+                    if len(pts) >= 2:
+                        lines_list.append(LineString(pts))
+        elif element['type'] == 'way' and 'geometry' in element:
+            pts = [(pt['lon'], pt['lat']) for pt in element['geometry']]
+            if len(pts) >= 2:
+                lines_list.append(LineString(pts))
+        
+        if not lines_list: return None
+
+        # --- Stitching ---
+        raw_geom = MultiLineString(lines_list)
+        try:
+            merged_geom = raw_geom.unary_union
+        except:
+            merged_geom = raw_geom 
+
+        if isinstance(merged_geom, LineString):
+            final_geom = MultiLineString([merged_geom])
+        elif isinstance(merged_geom, MultiLineString):
+            final_geom = merged_geom
+        else:
+            final_geom = raw_geom
+
+        # --- Stats Calculation ---
+        total_len = 0.0
+        for line in final_geom:
+            total_len += polyline_length(line.coords)
+
+        # FILTER 1: Too short?
+        if total_len < 1.5: return None
+        
+        # FILTER 2: Too long?
+        if SKIP_EXTREME_TRAILS and total_len > MAX_TRAIL_LENGTH:
+            return None
+
+        centroid = final_geom.centroid
+        detected_region = self.get_region_name(centroid.y)
+
+        return {
+            'name': name,
+            'latitude': centroid.y,
+            'longitude': centroid.x,
+            'location': make_point(centroid.y, centroid.x),
+            'path': final_geom,
+            **simplified_paths(final_geom),
+            **envelope_fields(final_geom),
+            'length': round(total_len, 2),
+            'region': detected_region, 
+            'popularity': 0.0,
+        }
+
+    def prepare(self, element):
+        """
+        The CPU-heavy half of an import, run in the worker pool with --workers:
+        geometry, union, simplification, length and elevation sample points.
+        Returns (trail fields, sample profiles), None if filtered out, or the
+        error as a string if the element is malformed (it has to cross back
+        from the worker, so it is a value rather than an exception).
+        """
+        try:
+            trail = self.build_trail(element)
+            if not trail: return None
+            return trail, [sample_line(line.coords) for line in trail['path']]
+        except MALFORMED_ELEMENT_ERRORS as e:
+            return f"{type(e).__name__}: {e}"
+
+    def finish_batch(self, batch):
+        """
+        Adds elevation, difficulty and duration to a batch of prepared trails.
+        Every trail's sample points go to the elevation service in one
+        lookup, so the API sees a few large requests instead of one per trail.
+        """
+        started = time.perf_counter()
+        if FETCH_ELEVATION and self.elevation is not None:
+            self.elevation.lookup(point for _, trail_profiles in batch for line in trail_profiles for point in line)
+        self.elevation_seconds += time.perf_counter() - started
+
+        trails = []
+        for trail, trail_profiles in batch:
+            gain = self.calculate_elevation(trail_profiles)
+
+            # --- CALCULATE DIFFICULTY ---
+            # Unknown gain is estimated from distance alone but stored as unknown
+            difficulty, duration = self.calculate_metrics(trail['length'], gain or 0.0)
+            trail['elevation_gain'] = gain
+            trail['difficulty'] = difficulty
+            trail['estimated_duration'] = duration
+            trails.append(trail)
+        return trails
+
+    def save_batch(self, batch, writer):
+        for trail in self.finish_batch(batch):
+            writer.add(**trail)
+            gain = 'unknown' if trail['elevation_gain'] is None else f"{trail['elevation_gain']:.0f}m"
+            self.stdout.write(f"  + {trail['name']} ({trail['length']}km, {gain} ascent) - {trail['difficulty']} [{trail['estimated_duration']}]")
+        return len(batch)
+
+    def report_throughput(self, elements, workers, seconds, stats):
+        rate = round(elements / seconds, 1) if seconds else None
+        self.stdout.write(f"  Processed {elements} elements in {seconds:.2f}s ({rate} elements/s, {workers} worker{'s' if workers != 1 else ''})")
+        self.stdout.write(f"  Elevation lookups: {self.elevation_seconds:.2f}s")
+        self.report_writes("  Writes", stats)
+
     def handle(self, *args, **kwargs):
         self.stdout.write("Fetching trails...")
 
-        overpass_url = "http://overpass-api.de/api/interpreter"
         bbox = "(53.15, -2.10, 54.00, -1.30)"
         keywords = "Walk|Trail|Way|Loop|Circuit|Circular|Reservoir|Edge|Pike|Tor"
         
@@ -98,97 +243,70 @@ class Command(BaseCommand):
         """
 
         try:
-            resp = requests.get(overpass_url, params={'data': query})
-            resp.raise_for_status()
-            data = resp.json()
-        except Exception as e:
+            source = self.fetch_source(query, kwargs)
+        except OverpassError as e:
             self.stdout.write(self.style.ERROR(f"Download Failed: {e}"))
             return
 
-        elements = data.get('elements', [])
+        state = ImportState('trails', kwargs['incremental'], model=Trail)
+        sources = [file_digest(source)]
+        if state.source_unchanged(sources):
+            self.stdout.write(self.style.SUCCESS('No upstream changes since the last import.'))
+            return
+
+        self.elevation = None
+        if FETCH_ELEVATION:
+            try:
+                self.elevation = ElevationService(
+                    dem=kwargs['dem'],
+                    log=lambda message: self.stdout.write(self.style.WARNING(message)),
+                )
+            except (OSError, ValueError) as e:
+                self.stdout.write(self.style.ERROR(f"Could not open DEM: {e}"))
+                return
+
+        workers = kwargs['workers'] or os.cpu_count() or 1
+        writer = BulkUpserter(Trail, ['name'], TRAIL_FIELDS, batch_size=kwargs['batch_size'])
+        self.elevation_seconds = 0.0
+        started = time.perf_counter()
+
+        # Pipeline: stream -> filter -> skip unchanged -> geometry & stats (worker pool)
+        #           -> elevation (batched) -> single writer (bulk batches)
+        # Malformed elements are skipped and counted, never queued
+        self.malformed = self.malformed_elements()
+        changed = self.changed_candidates(read_elements(source), state)
         count = 0
+        processed = 0
+        batch = []
         
-        for element in elements:
-            tags = element.get('tags', {})
-            name = tags.get('name', 'Unknown')
-
-            if "Public Footpath" in name or "Bridleway" in name: continue
-            if tags.get('highway') in ['residential', 'service', 'primary']: continue
-
-            # --- Geometry Collection ---
-            lines_list = [] 
-            all_points = []
-            
-            if element['type'] == 'relation' and 'members' in element:
-                for member in element['members']:
-                    if member.get('type') == 'way' and 'geometry' in member:
-                        pts = [(pt['lon'], pt['lat']) for pt in member['geometry']]
-                        if len(pts) >= 2:
-                            lines_list.append(LineString(pts))
-                            all_points.extend(pts)
-            elif element['type'] == 'way' and 'geometry' in element:
-                pts = [(pt['lon'], pt['lat']) for pt in element['geometry']]
-                if len(pts) >= 2:
-                    lines_list.append(LineString(pts))
-                    all_points.extend(pts)
-            
-            if not lines_list: continue
-
-            # --- Stitching ---
-            raw_geom = MultiLineString(lines_list)
-            try:
-                merged_geom = raw_geom.unary_union
-            except:
-                merged_geom = raw_geom 
-
-            if isinstance(merged_geom, LineString):
-                final_geom = MultiLineString([merged_geom])
-            elif isinstance(merged_geom, MultiLineString):
-                final_geom = merged_geom
-            else:
-                final_geom = raw_geom
-
-            # --- Stats Calculation ---
-            total_len = 0.0
-            for line in final_geom:
-                total_len += self.haversine_length(line.coords)
-
-            # FILTER 1: Too short?
-            if total_len < 1.5: continue
-            
-            # FILTER 2: Too long?
-            if SKIP_EXTREME_TRAILS and total_len > MAX_TRAIL_LENGTH:
-                continue
+        for element, prepared in pooled_map(self, 'prepare', changed, workers):
+            processed += 1
+            if isinstance(prepared, str):
+                self.malformed.skip(element, prepared)
+                prepared = None
+            state.record(element, prepared[0]['name'] if prepared else None)
+            if not prepared: continue
 
-            gain = self.calculate_elevation(all_points)
-            
-            # --- CALCULATE DIFFICULTY ---
-            difficulty, duration = self.calculate_metrics(total_len, gain)
+            batch.append(prepared)
+            if len(batch) >= ELEVATION_BATCH:
+                count += self.save_batch(batch, writer)
+                batch = []
 
-            centroid = final_geom.centroid
-            detected_region = self.get_region_name(centroid.y)
+        if batch:
+            count += self.save_batch(batch, writer)
+        stats = writer.finish()
+        self.report_throughput(processed, workers, time.perf_counter() - started, stats)
 
-            try:
-                Trail.objects.update_or_create(
-                    name=name,
-                    defaults={
-                        'latitude': centroid.y,
-                        'longitude': centroid.x,
-                        'path': final_geom,
-                        'length': round(total_len, 2),
-                        'elevation_gain': gain,
-                        'region': detected_region, 
-                        
-                        # NEW FIELDS
-                        'difficulty': difficulty,
-                        'estimated_duration': duration,
-                        
-                        'popularity': 0.0,
-                    }
-                )
-                count += 1
-                self.stdout.write(f"  + {name} ({round(total_len, 2)}km) - {difficulty} [{duration}]")
-            except Exception as e:
-                pass
+        removed = state.removed_keys()
+        if removed:
+            deleted, _ = Trail.objects.filter(name__in=removed).delete()
+            self.stdout.write(f"  - Removed {len(removed)} trails that disappeared upstream ({deleted} rows incl. linked services).")
+        state.save(sources)
+        if count or removed:
+            bump_data_version()
+            rebuild_clusters()
 
-        self.stdout.write(self.style.SUCCESS(f'Done! Imported {count} trails.'))
\ No newline at end of file
+        if state.skipped:
+            self.stdout.write(f"  Skipped {state.skipped} unchanged trails.")
+        self.malformed.report()
+        self.stdout.write(self.style.SUCCESS(f'Done! Imported {count} trails.'))
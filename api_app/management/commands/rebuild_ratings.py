@@ -0,0 +1,9 @@
+from django.core.management.base import BaseCommand
+from api_app.ratings import rebuild_ratings
+
+class Command(BaseCommand):
+    help = 'Recomputes every trail\'s rating average, count and histogram from its reviews'
+
+    def handle(self, *args, **kwargs):
+        updated = rebuild_ratings()
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt rating aggregates for {updated} trails.'))
@@ -0,0 +1,55 @@
+import time
+from django.core.management.base import BaseCommand
+from api_app import weather
+
+class Command(BaseCommand):
+    help = 'Keeps trail weather warm in the cache so API requests never call Open-Meteo'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help='Run a single refresh cycle and exit (for cron / scheduled tasks)')
+        parser.add_argument('--interval', type=int, default=300, help='Seconds between refresh cycles (default 300)')
+        parser.add_argument('--force', action='store_true', help='Refresh every cell, even ones that are still fresh')
+        parser.add_argument('--stats', action='store_true', help='Print hit ratio and refresh lag metrics and exit')
+
+    def print_stats(self):
+        metrics = weather.get_metrics()
+        self.stdout.write(
+            f"  Lookups: {metrics['lookups']} (fresh {metrics['fresh']}, stale {metrics['stale']}, "
+            f"miss {metrics['miss']}, failed {metrics['failed']}, over budget {metrics['over_budget']})"
+        )
+        self.stdout.write(f"  Hit ratio: {metrics['hit_ratio']}  Fresh ratio: {metrics['fresh_ratio']}")
+        self.stdout.write(f"  Circuit breaker: {metrics['breaker']['state']}")
+
+        last = metrics['last_refresh']
+        if not last:
+            self.stdout.write(self.style.WARNING("  No refresh has run yet."))
+            return
+        since = round(time.time() - last['finished_at'])
+        self.stdout.write(f"  Last refresh: {since}s ago, took {last['duration_seconds']}s")
+        self.stdout.write(f"  Refresh lag (oldest reading at start of cycle): {last['max_age_seconds']}s")
+
+    def handle(self, *args, **options):
+        if options['stats']:
+            self.print_stats()
+            return
+
+        force = options['force']
+        while True:
+            report = weather.refresh_cells(force=force)
+            force = False
+
+            message = (
+                f"Refreshed {report['refreshed']}/{report['due']} due cells "
+                f"of {report['cells']} in {report['duration_seconds']}s "
+                f"(lag {report['max_age_seconds']}s)"
+            )
+            if report['skipped']:
+                self.stdout.write(self.style.WARNING(f"{message} - circuit breaker open, skipped fetching"))
+            elif report['failed']:
+                self.stdout.write(self.style.WARNING(f"{message} - {report['failed']} failed"))
+            else:
+                self.stdout.write(self.style.SUCCESS(message))
+
+            if options['once']:
+                return
+            time.sleep(options['interval'])
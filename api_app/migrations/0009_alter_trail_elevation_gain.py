@@ -0,0 +1,18 @@
+# Generated by Django 5.2.11 on 2026-10-17 10:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api_app', '0008_traillogbook'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='trail',
+            name='elevation_gain',
+            field=models.FloatField(blank=True, null=True),
+        ),
+    ]
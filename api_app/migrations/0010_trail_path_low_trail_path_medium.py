@@ -0,0 +1,48 @@
+# Generated by Django 5.2.11 on 2026-10-17 11:02
+
+import django.contrib.gis.db.models.fields
+from django.contrib.gis.geos import LineString, MultiLineString
+from django.db import migrations
+
+from ._backfill import backfill
+
+# Frozen copy of api_app.lod.TOLERANCES at the time of this migration
+TOLERANCES = {
+    'path_low': 0.001,
+    'path_medium': 0.0001,
+}
+
+
+def simplify(trail):
+    for field, tolerance in TOLERANCES.items():
+        simplified = trail.path.simplify(tolerance, preserve_topology=True)
+        if isinstance(simplified, LineString):
+            simplified = MultiLineString([simplified])
+        simplified.srid = trail.path.srid
+        setattr(trail, field, simplified)
+
+
+def backfill_simplified_paths(apps, schema_editor):
+    Trail = apps.get_model('api_app', 'Trail')
+    backfill(Trail.objects.exclude(path=None), list(TOLERANCES), simplify, only=['path'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api_app', '0009_alter_trail_elevation_gain'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='trail',
+            name='path_low',
+            field=django.contrib.gis.db.models.fields.MultiLineStringField(blank=True, null=True, srid=4326),
+        ),
+        migrations.AddField(
+            model_name='trail',
+            name='path_medium',
+            field=django.contrib.gis.db.models.fields.MultiLineStringField(blank=True, null=True, srid=4326),
+        ),
+        migrations.RunPython(backfill_simplified_paths, migrations.RunPython.noop),
+    ]
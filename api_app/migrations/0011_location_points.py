@@ -0,0 +1,44 @@
+# Generated by Django 5.2.11 on 2026-10-17 12:20
+
+import django.contrib.gis.db.models.fields
+from django.contrib.gis.geos import Point
+from django.db import migrations
+
+from ._backfill import backfill
+
+
+def set_location(row):
+    row.location = Point(float(row.longitude), float(row.latitude), srid=4326)
+
+
+def backfill_locations(apps, schema_editor):
+    for model_name in ['Trail', 'CarPark', 'TransportLink']:
+        model = apps.get_model('api_app', model_name)
+        rows = model.objects.exclude(latitude=None).exclude(longitude=None)
+        backfill(rows, ['location'], set_location, only=['latitude', 'longitude'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api_app', '0010_trail_path_low_trail_path_medium'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='trail',
+            name='location',
+            field=django.contrib.gis.db.models.fields.PointField(blank=True, null=True, srid=4326),
+        ),
+        migrations.AddField(
+            model_name='carpark',
+            name='location',
+            field=django.contrib.gis.db.models.fields.PointField(blank=True, null=True, srid=4326),
+        ),
+        migrations.AddField(
+            model_name='transportlink',
+            name='location',
+            field=django.contrib.gis.db.models.fields.PointField(blank=True, null=True, srid=4326),
+        ),
+        migrations.RunPython(backfill_locations, migrations.RunPython.noop),
+    ]
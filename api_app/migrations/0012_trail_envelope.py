@@ -0,0 +1,48 @@
+# Generated by Django 5.2.11 on 2026-10-17 13:05
+
+from django.db import migrations, models
+
+from ._backfill import backfill
+
+ENVELOPE_FIELDS = ['bbox_west', 'bbox_south', 'bbox_east', 'bbox_north']
+
+
+def set_envelope(trail):
+    for field, value in zip(ENVELOPE_FIELDS, trail.path.extent):
+        setattr(trail, field, value)
+
+
+def backfill_envelopes(apps, schema_editor):
+    Trail = apps.get_model('api_app', 'Trail')
+    backfill(Trail.objects.exclude(path=None), ENVELOPE_FIELDS, set_envelope, only=['path'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api_app', '0011_location_points'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='trail',
+            name='bbox_west',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='trail',
+            name='bbox_south',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='trail',
+            name='bbox_east',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='trail',
+            name='bbox_north',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.RunPython(backfill_envelopes, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,77 @@
+# Generated by Django 5.2.11 on 2026-10-17 13:48
+
+from django.db import migrations, models
+from django.db.models import Count, Q, Sum
+
+
+def backfill_ratings(apps, schema_editor):
+    Trail = apps.get_model('api_app', 'Trail')
+    Review = apps.get_model('api_app', 'Review')
+    rows = Review.objects.exclude(rating=None).values('trail').annotate(
+        count=Count('id'),
+        total=Sum('rating'),
+        **{f'hist_{value}': Count('id', filter=Q(rating=value)) for value in range(6)},
+    )
+    for row in rows:
+        Trail.objects.filter(pk=row['trail']).update(
+            rating_count=row['count'],
+            rating_sum=row['total'],
+            rating_avg=row['total'] / row['count'],
+            **{f'rating_hist_{value}': row[f'hist_{value}'] for value in range(6)},
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api_app', '0012_trail_envelope'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='trail',
+            name='rating_avg',
+            field=models.FloatField(blank=True, db_index=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='trail',
+            name='rating_count',
+            field=models.IntegerField(db_index=True, default=0),
+        ),
+        migrations.AddField(
+            model_name='trail',
+            name='rating_sum',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='trail',
+            name='rating_hist_0',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='trail',
+            name='rating_hist_1',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='trail',
+            name='rating_hist_2',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='trail',
+            name='rating_hist_3',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='trail',
+            name='rating_hist_4',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='trail',
+            name='rating_hist_5',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.RunPython(backfill_ratings, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,64 @@
+from django.db import migrations
+
+# External-content FTS5 index over Trail.name and Trail.region.
+# The triggers keep it in step with every write path (save(), bulk_create,
+# bulk_update, raw deletes), so nothing in Python has to remember to.
+# NOTE: SQLite drops triggers with their table, and Django rebuilds
+# api_app_trail that way for most AlterField/RemoveField operations.
+# Migrations that do so must re-run CREATE_FTS's triggers afterwards;
+# api_app/checks.py fails migrate if they are missing.
+CREATE_FTS = [
+    """
+    CREATE VIRTUAL TABLE api_app_trail_fts USING fts5(
+        name, region,
+        content='api_app_trail', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2',
+        prefix='2 3'
+    )
+    """,
+    """
+    CREATE TRIGGER api_app_trail_fts_insert AFTER INSERT ON api_app_trail BEGIN
+        INSERT INTO api_app_trail_fts(rowid, name, region) VALUES (new.id, new.name, new.region);
+    END
+    """,
+    """
+    CREATE TRIGGER api_app_trail_fts_delete AFTER DELETE ON api_app_trail BEGIN
+        INSERT INTO api_app_trail_fts(api_app_trail_fts, rowid, name, region) VALUES ('delete', old.id, old.name, old.region);
+    END
+    """,
+    """
+    CREATE TRIGGER api_app_trail_fts_update AFTER UPDATE OF name, region ON api_app_trail BEGIN
+        INSERT INTO api_app_trail_fts(api_app_trail_fts, rowid, name, region) VALUES ('delete', old.id, old.name, old.region);
+        INSERT INTO api_app_trail_fts(rowid, name, region) VALUES (new.id, new.name, new.region);
+    END
+    """,
+    "INSERT INTO api_app_trail_fts(api_app_trail_fts) VALUES ('rebuild')",
+]
+
+DROP_FTS = [
+    "DROP TRIGGER IF EXISTS api_app_trail_fts_update",
+    "DROP TRIGGER IF EXISTS api_app_trail_fts_delete",
+    "DROP TRIGGER IF EXISTS api_app_trail_fts_insert",
+    "DROP TABLE IF EXISTS api_app_trail_fts",
+]
+
+
+def run_on_sqlite(statements):
+    def run(apps, schema_editor):
+        # Other databases keep the plain LIKE search
+        if schema_editor.connection.vendor != 'sqlite':
+            return
+        for statement in statements:
+            schema_editor.execute(statement)
+    return run
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api_app', '0013_trail_rating_aggregates'),
+    ]
+
+    operations = [
+        migrations.RunPython(run_on_sqlite(CREATE_FTS), run_on_sqlite(DROP_FTS)),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.2.11 on 2026-10-17 18:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api_app', '0015_review_keyset_indexes'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='trail',
+            index=models.Index(fields=['name', 'id'], name='trail_name_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='trail',
+            index=models.Index(fields=['length', 'id'], name='trail_length_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='trail',
+            index=models.Index(fields=['elevation_gain', 'id'], name='trail_elevation_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='trail',
+            index=models.Index(fields=['popularity', 'id'], name='trail_popularity_id_idx'),
+        ),
+    ]
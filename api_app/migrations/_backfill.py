@@ -0,0 +1,19 @@
+# Shared by data migrations. The leading underscore keeps the migration
+# loader from treating this module as a migration.
+
+
+def backfill(queryset, fields, update, only=(), batch_size=200):
+    """
+    Sets fields on every row of queryset with update(obj), batch_size rows
+    per bulk_update. Rows are loaded with only('id', *only).
+    The ids are read up front and each slice is fetched separately, because
+    SQLite doesn't isolate a running SELECT from UPDATEs to the same table
+    on the same connection.
+    """
+    model = queryset.model
+    ids = list(queryset.values_list('id', flat=True))
+    for start in range(0, len(ids), batch_size):
+        batch = list(model.objects.filter(id__in=ids[start:start + batch_size]).only('id', *only))
+        for obj in batch:
+            update(obj)
+        model.objects.bulk_update(batch, fields)
@@ -1,13 +1,36 @@
 from django.contrib.gis.db import models
 from django.core.validators import MaxValueValidator, MinValueValidator
 from django.contrib.auth.models import User
+from django.contrib.gis.geos import Point
+from .lod import simplified_paths
 
 # Create your models here.
 
+RATING_VALUES = range(0, 6)  # Review.rating is 0-5
+
+
+def rating_hist_field(value):
+    return f'rating_hist_{value}'
+
+def make_point(latitude, longitude):
+    """WGS84 Point for a lat/lon pair (None if either is missing)"""
+    if latitude is None or longitude is None:
+        return None
+    return Point(float(longitude), float(latitude), srid=4326)
+
+
+def envelope_fields(path):
+    """Trail bbox_* columns for a path (all None if there is no path)"""
+    if path is None:
+        return {'bbox_west': None, 'bbox_south': None, 'bbox_east': None, 'bbox_north': None}
+    west, south, east, north = path.extent
+    return {'bbox_west': west, 'bbox_south': south, 'bbox_east': east, 'bbox_north': north}
+
+
 class Trail(models.Model):
 
     name = models.CharField(max_length=100)
-    elevation_gain = models.FloatField(default=0.0)
+    elevation_gain = models.FloatField(null=True, blank=True)
     length = models.FloatField(default=0.0)
 
     region = models.CharField(
@@ -31,25 +54,78 @@ class Trail(models.Model):
         default=0.0
     )
 
+    # Indexed copy of latitude/longitude, so radius queries can use the R*Tree
+    location = models.PointField(null=True, blank=True)
+
     path = models.MultiLineStringField(null=True)
+    # Precomputed simplified copies of path (see api_app/lod.py)
+    path_low = models.MultiLineStringField(null=True, blank=True)
+    path_medium = models.MultiLineStringField(null=True, blank=True)
+
+    # Precomputed envelope of path, so viewport filters can accept or reject
+    # most rows from four floats without decoding the geometry
+    bbox_west = models.FloatField(null=True, blank=True)
+    bbox_south = models.FloatField(null=True, blank=True)
+    bbox_east = models.FloatField(null=True, blank=True)
+    bbox_north = models.FloatField(null=True, blank=True)
 
     difficulty = models.CharField(max_length=50, default="Moderate")
     estimated_duration = models.CharField(max_length=50, default="0h")
 
+    # Review aggregates, kept up to date by api_app/ratings.py
+    # (rebuild with `manage.py rebuild_ratings`)
+    rating_avg = models.FloatField(null=True, blank=True, db_index=True)
+    rating_count = models.IntegerField(default=0, db_index=True)
+    rating_sum = models.IntegerField(default=0)
+    rating_hist_0 = models.IntegerField(default=0)
+    rating_hist_1 = models.IntegerField(default=0)
+    rating_hist_2 = models.IntegerField(default=0)
+    rating_hist_3 = models.IntegerField(default=0)
+    rating_hist_4 = models.IntegerField(default=0)
+    rating_hist_5 = models.IntegerField(default=0)
+
+    class Meta:
+        # (column, id) for keyset paging on each ?ordering= choice
+        # (the rating columns carry their own db_index)
+        indexes = [
+            models.Index(fields=['name', 'id'], name='trail_name_id_idx'),
+            models.Index(fields=['length', 'id'], name='trail_length_id_idx'),
+            models.Index(fields=['elevation_gain', 'id'], name='trail_elevation_id_idx'),
+            models.Index(fields=['popularity', 'id'], name='trail_popularity_id_idx'),
+        ]
+
     def __str__(self):
         return self.name
 
+    @property
+    def rating_histogram(self):
+        """Number of reviews per rating, e.g. {'0': 0, ..., '5': 12}"""
+        return {str(value): getattr(self, rating_hist_field(value)) for value in RATING_VALUES}
+
+    def update_simplified_paths(self):
+        for field, geom in simplified_paths(self.path).items():
+            setattr(self, field, geom)
+
+    def save(self, *args, **kwargs):
+        # Keep the derived geometry columns in step (bulk writes set them explicitly)
+        self.update_simplified_paths()
+        self.location = make_point(self.latitude, self.longitude)
+        for field, value in envelope_fields(self.path).items():
+            setattr(self, field, value)
+        super().save(*args, **kwargs)
+
 class Review(models.Model):
 
     trail = models.ForeignKey(Trail, on_delete=models.CASCADE, related_name='reviews')
     title = models.CharField(max_length=100)
     user = models.ForeignKey(User, on_delete=models.CASCADE)
     content = models.TextField()
-    created_on = models.DateTimeField(auto_now_add=True)
+    created_on = models.DateTimeField(auto_now_add=True, db_index=True)  # Indexed for keyset paging
     rating = models.IntegerField(
         validators=[MinValueValidator(0), MaxValueValidator(5)],
         null=True,
-        blank=True
+        blank=True,
+        db_index=True
     )
 
 class TransportLink(models.Model):
@@ -77,6 +153,12 @@ class TransportLink(models.Model):
         validators=[MinValueValidator(-180), MaxValueValidator(180)]
     )
 
+    location = models.PointField(null=True, blank=True)
+
+    def save(self, *args, **kwargs):
+        self.location = make_point(self.latitude, self.longitude)
+        super().save(*args, **kwargs)
+
 class CarPark(models.Model):
 
     trail = models.ForeignKey(Trail, on_delete=models.CASCADE, related_name='car_parks')
@@ -100,6 +182,12 @@ class CarPark(models.Model):
         help_text="Number of spaces", 
         null=True,
         blank=True)
+
+    location = models.PointField(null=True, blank=True)
+
+    def save(self, *args, **kwargs):
+        self.location = make_point(self.latitude, self.longitude)
+        super().save(*args, **kwargs)
     
 class TrailLogBook(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE)
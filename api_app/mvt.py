@@ -0,0 +1,145 @@
+import struct
+
+# Minimal Mapbox Vector Tile (v2.1) encoder.
+# Writes the protobuf wire format by hand, so no protobuf dependency is
+# needed. Spec: https://github.com/mapbox/vector-tile-spec/tree/master/2.1
+
+POINT = 1
+LINESTRING = 2
+
+_MOVE_TO = 1
+_LINE_TO = 2
+
+
+def _varint(value):
+    out = bytearray()
+    while True:
+        bits = value & 0x7F
+        value >>= 7
+        if value:
+            out.append(bits | 0x80)
+        else:
+            out.append(bits)
+            return bytes(out)
+
+
+def _zigzag(value):
+    return (value << 1) ^ (value >> 63)
+
+
+def _field(number, wire_type):
+    return _varint((number << 3) | wire_type)
+
+
+def _length_delimited(number, payload):
+    return _field(number, 2) + _varint(len(payload)) + payload
+
+
+def _packed(number, values):
+    return _length_delimited(number, b''.join(_varint(v) for v in values))
+
+
+def _command(command_id, count):
+    return (command_id & 0x7) | (count << 3)
+
+
+def _encode_value(value):
+    """A Layer.Value message: string, bool, sint or double"""
+    if isinstance(value, bool):
+        return _field(7, 0) + _varint(int(value))
+    if isinstance(value, int):
+        return _field(6, 0) + _varint(_zigzag(value))
+    if isinstance(value, float):
+        return _field(3, 1) + struct.pack('<d', value)
+    return _length_delimited(1, str(value).encode('utf-8'))
+
+
+def point_geometry(points):
+    """Command stream for a (multi)point; points are integer tile coordinates"""
+    if not points:
+        return []
+    commands = [_command(_MOVE_TO, len(points))]
+    cx = cy = 0
+    for x, y in points:
+        commands += [_zigzag(x - cx), _zigzag(y - cy)]
+        cx, cy = x, y
+    return commands
+
+
+def line_geometry(lines):
+    """
+    Command stream for a (multi)linestring; lines are lists of integer tile
+    coordinates. Repeated points are dropped and lines left with fewer
+    than two points are skipped.
+    """
+    commands = []
+    cx = cy = 0
+    for line in lines:
+        deduped = [line[0]] if line else []
+        for point in line[1:]:
+            if point != deduped[-1]:
+                deduped.append(point)
+        if len(deduped) < 2:
+            continue
+
+        x, y = deduped[0]
+        commands += [_command(_MOVE_TO, 1), _zigzag(x - cx), _zigzag(y - cy)]
+        cx, cy = x, y
+        commands.append(_command(_LINE_TO, len(deduped) - 1))
+        for x, y in deduped[1:]:
+            commands += [_zigzag(x - cx), _zigzag(y - cy)]
+            cx, cy = x, y
+    return commands
+
+
+class Layer:
+    """One named layer of a tile. Property keys and values are de-duplicated per layer, as the spec asks."""
+
+    def __init__(self, name, extent=4096):
+        self.name = name
+        self.extent = extent
+        self.keys = {}
+        self.values = {}
+        self.features = []
+
+    def _index(self, table, item):
+        if item not in table:
+            table[item] = len(table)
+        return table[item]
+
+    def add_feature(self, geom_type, geometry, properties=None, feature_id=None):
+        if not geometry:
+            return
+        tags = []
+        for key, value in (properties or {}).items():
+            if value is None:
+                continue
+            tags.append(self._index(self.keys, key))
+            # type() keeps True and 1 (or 1 and 1.0) apart in the value table
+            tags.append(self._index(self.values, (type(value).__name__, value)))
+
+        feature = b''
+        if feature_id is not None:
+            feature += _field(1, 0) + _varint(feature_id)
+        if tags:
+            feature += _packed(2, tags)
+        feature += _field(3, 0) + _varint(geom_type)
+        feature += _packed(4, geometry)
+        self.features.append(feature)
+
+    def encode(self):
+        layer = _field(15, 0) + _varint(2)
+        layer += _length_delimited(1, self.name.encode('utf-8'))
+        for feature in self.features:
+            layer += _length_delimited(2, feature)
+        for key in self.keys:
+            layer += _length_delimited(3, key.encode('utf-8'))
+        for _, value in self.values:
+            layer += _length_delimited(4, _encode_value(value))
+        layer += _field(5, 0) + _varint(self.extent)
+        return layer
+
+
+def encode_tile(layers):
+    """Serialises layers into a tile; empty layers are left out"""
+    return b''.join(_length_delimited(3, layer.encode()) for layer in layers if layer.features)
@@ -0,0 +1,350 @@
+import ctypes
+import gzip
+import hashlib
+import json
+import os
+import tempfile
+import time
+from pathlib import Path
+
+import ijson
+import requests
+import urllib3
+from django.conf import settings
+from django.contrib.gis.geos import GEOSException
+from django.core.management.base import BaseCommand
+from django.db.models import Count, Max
+
+# --- CONFIGURATION ---
+CACHE_DIR = Path(settings.BASE_DIR) / 'overpass_cache'
+DOWNLOAD_CHUNK = 1024 * 1024  # Bytes written to disk per read while downloading
+
+HEADERS = {
+    'User-Agent': 'LeedsHikingApp/1.0',
+    'Referer': 'http://localhost:8000/'
+}
+
+
+# What parsing a malformed element raises (missing or null tags, center
+# or type/id, wrong types, geometry GEOS rejects). Imports skip and count
+# the element instead of aborting the run.
+MALFORMED_ELEMENT_ERRORS = (
+    AttributeError, IndexError, KeyError, TypeError, ValueError, GEOSException, ctypes.ArgumentError,
+)
+
+
+def element_label(element):
+    """'way/123' for log lines, even if the element is too broken to have one"""
+    try:
+        return f"{element['type']}/{element['id']}"
+    except (KeyError, TypeError):
+        return 'element without type/id'
+
+
+class MalformedElements:
+    """
+    Counts and logs the elements an import skipped because they couldn't be
+    parsed, so one broken element never aborts the run:
+        except MALFORMED_ELEMENT_ERRORS as e:
+            malformed.skip(element, e)
+    """
+
+    def __init__(self, log):
+        self.log = log
+        self.count = 0
+
+    def skip(self, element, error):
+        """error: the exception, or a description of one"""
+        self.count += 1
+        if isinstance(error, Exception):
+            error = f"{type(error).__name__}: {error}"
+        self.log(f"    ! Skipped malformed {element_label(element)}: {error}")
+
+    def report(self):
+        if self.count:
+            self.log(f"  > Skipped {self.count} malformed elements.")
+
+
+class OverpassError(Exception):
+    """Raised when Overpass can't be reached after every retry"""
+
+
+def read_elements(path):
+    """
+    Streams elements out of a saved Overpass [out:json] response (.json or .json.gz).
+    Parsed incrementally with ijson, so memory use doesn't depend on file size.
+    """
+    path = Path(path)
+    opener = gzip.open if path.suffix == '.gz' else open
+    with opener(path, 'rb') as f:
+        yield from ijson.items(f, 'elements.item', use_float=True)
+
+
+def file_digest(path):
+    """sha256 of a file, read in chunks"""
+    sha = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(DOWNLOAD_CHUNK), b''):
+            sha.update(chunk)
+    return sha.hexdigest()
+
+
+class ResponseCache:
+    """
+    Content-addressed on-disk store of raw Overpass responses.
+    - objects/<sha256 of body>.json: each distinct response, stored once
+    - queries/<sha256 of url + query>: which object a query last returned
+    Identical responses share one file, and the object name doubles as a
+    cheap "has anything changed upstream?" check.
+    """
+
+    def __init__(self, root=CACHE_DIR):
+        self.root = Path(root)
+        self.objects = self.root / 'objects'
+        self.queries = self.root / 'queries'
+
+    def _query_ref(self, url, query):
+        digest = hashlib.sha256(f"{url}\n{query}".encode()).hexdigest()
+        return self.queries / digest
+
+    def lookup(self, url, query):
+        """Path of the last response saved for this query, or None"""
+        ref = self._query_ref(url, query)
+        if not ref.exists():
+            return None
+        path = self.objects / f"{ref.read_text().strip()}.json"
+        return path if path.exists() else None
+
+    def store(self, url, query, chunks):
+        """Writes a response body (iterable of bytes) to disk while hashing it"""
+        self.objects.mkdir(parents=True, exist_ok=True)
+        self.queries.mkdir(parents=True, exist_ok=True)
+
+        sha = hashlib.sha256()
+        fd, tmp_path = tempfile.mkstemp(dir=self.objects, suffix='.part')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                for chunk in chunks:
+                    sha.update(chunk)
+                    f.write(chunk)
+            digest = sha.hexdigest()
+            path = self.objects / f"{digest}.json"
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+        ref = self._query_ref(url, query)
+        previous = ref.read_text().strip() if ref.exists() else None
+        ref.write_text(digest)
+        if previous and previous != digest:
+            self._discard_if_unreferenced(previous)
+        return path
+
+    def _discard_if_unreferenced(self, digest):
+        for ref in self.queries.iterdir():
+            if ref.read_text().strip() == digest:
+                return
+        (self.objects / f"{digest}.json").unlink(missing_ok=True)
+
+
+class OverpassClient:
+    """
+    Fetches Overpass [out:json] responses into the on-disk response cache.
+    The body is streamed to disk in chunks and then parsed incrementally
+    with read_elements(), so only the element currently being processed is
+    ever held in memory, and every run can be replayed offline.
+    """
+
+    def __init__(self, url, timeout=120, attempts=3, log=None, cache=None):
+        self.url = url
+        self.timeout = timeout
+        self.attempts = attempts
+        self.log = log or (lambda message: None)
+        self.cache = cache or ResponseCache()
+
+    def _request(self, query):
+        return requests.get(self.url, headers=HEADERS, params={'data': query},
+                            timeout=self.timeout, stream=True)
+
+    def _with_retries(self, query, consume):
+        """
+        Runs consume(response) with retries (longer wait when rate limited).
+        Raises OverpassError once every attempt has failed.
+        """
+        for attempt in range(1, self.attempts + 1):
+            try:
+                with self._request(query) as resp:
+                    if resp.status_code == 429:
+                        self.log(f"    Rate limited. Waiting 15s... (Attempt {attempt})")
+                        time.sleep(15)
+                        continue
+                    resp.raise_for_status()
+                    return consume(resp)
+            except (requests.RequestException, urllib3.exceptions.HTTPError) as e:
+                self.log(f"    Attempt {attempt} failed: {e}")
+                time.sleep(5)
+        raise OverpassError(f"Overpass request failed after {self.attempts} attempts")
+
+    def fetch(self, query, use_cached=False):
+        """
+        Saves the response for query into the cache and returns its path.
+        With use_cached, the last saved response is reused without any request.
+        """
+        if use_cached:
+            path = self.cache.lookup(self.url, query)
+            if path:
+                self.log(f"    Using cached response {path.name}")
+                return path
+            self.log("    No cached response for this query, downloading...")
+
+        return self._with_retries(
+            query,
+            lambda resp: self.cache.store(self.url, query, resp.iter_content(DOWNLOAD_CHUNK)),
+        )
+
+
+class ImportState:
+    """
+    Remembers every Overpass element from the previous import run, so an
+    incremental run only touches what changed.
+    - Each element is fingerprinted (hash of its JSON, which covers tags,
+      geometry and version), and unchanged ones are skipped.
+    - The rows each element produced are remembered by natural key, so rows
+      whose element vanished upstream can be deleted.
+    - context: anything else the results depend on (e.g. the trail set for
+      nearest-trail linking). If it changed, nothing is skipped this run.
+    - model: the table the import writes. Its row count and max id are
+      saved with the state, so after clear_* or a database reset nothing
+      is skipped and the table is filled again.
+    """
+
+    def __init__(self, name, incremental, context=None, model=None, root=CACHE_DIR):
+        self.path = Path(root) / 'state' / f"{name}.json"
+        self.incremental = incremental
+        self.context = context
+        self.model = model
+        self.current = {}
+        self.pending = {}
+        self.skipped = 0
+
+        previous = {}
+        if incremental and self.path.exists():
+            previous = json.loads(self.path.read_text())
+        self.previous = previous.get('elements', {})
+        self.sources = previous.get('sources')
+        # Elements can only be skipped if whatever they were linked against is the same
+        self.can_skip = (
+            bool(self.previous)
+            and previous.get('context') == context
+            and previous.get('table') == self.table_fingerprint()
+        )
+
+    def table_fingerprint(self):
+        """[row count, max id] of the imported table, or None without a model"""
+        if self.model is None:
+            return None
+        stats = self.model.objects.aggregate(rows=Count('id'), last=Max('id'))
+        return [stats['rows'], stats['last']]
+
+    @staticmethod
+    def element_id(element):
+        return f"{element['type']}/{element['id']}"
+
+    @staticmethod
+    def fingerprint(element):
+        encoded = json.dumps(element, sort_keys=True, separators=(',', ':')).encode()
+        return hashlib.sha1(encoded).hexdigest()
+
+    def unchanged(self, element):
+        """True (and carries the element over) if it matches the previous run"""
+        element_id = self.element_id(element)
+        fingerprint = self.fingerprint(element)
+        previous = self.previous.get(element_id)
+
+        if self.can_skip and previous and previous[0] == fingerprint:
+            self.current[element_id] = previous
+            self.skipped += 1
+            return True
+
+        self.pending[element_id] = fingerprint
+        return False
+
+    def record(self, element, key):
+        """Remembers the row key an element produced (None if it was filtered out)"""
+        element_id = self.element_id(element)
+        fingerprint = (
+            self.pending.pop(element_id, None)
+            or self.current.get(element_id, [None])[0]
+            or self.fingerprint(element)
+        )
+        self.current[element_id] = [fingerprint, key]
+
+    def removed_keys(self):
+        """
+        Row keys from the previous run that nothing produces any more: the
+        element vanished upstream, its key changed (a trail rename, a service
+        relinked to another trail) or it is now filtered out (key None).
+        A key another live element still maps to is kept.
+        """
+        if not self.incremental:
+            return []
+        live = {json.dumps(entry[1]) for entry in self.current.values() if entry[1] is not None}
+        removed, seen = [], set()
+        for element_id, (_, key) in self.previous.items():
+            if key is None:
+                continue
+            encoded = json.dumps(key)
+            current_key = self.current.get(element_id, [None, None])[1]
+            if json.dumps(current_key) == encoded or encoded in live or encoded in seen:
+                continue
+            seen.add(encoded)
+            removed.append(key)
+        return removed
+
+    def source_unchanged(self, sources):
+        """True if the raw responses are byte-identical to the previous run's"""
+        return self.incremental and self.can_skip and self.sources == sources
+
+    def save(self, sources=None):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.path.with_suffix('.part')
+        tmp_path.write_text(json.dumps({
+            'context': self.context,
+            'table': self.table_fingerprint(),
+            'sources': sources,
+            'elements': self.current,
+        }))
+        os.replace(tmp_path, self.path)
+
+
+class OverpassImportCommand(BaseCommand):
+    """
+    Base for the management commands that import Overpass responses.
+    Subclasses set overpass_url and overpass_timeout.
+    """
+    overpass_url = None
+    overpass_timeout = 120
+
+    def warn(self, message):
+        self.stdout.write(self.style.WARNING(message))
+
+    def download(self, query, cached=False):
+        """
+        Returns the path of the raw Overpass response to query.
+        Downloads are streamed to the on-disk response cache, so they never
+        sit in memory and can be replayed later with --cached.
+        """
+        client = OverpassClient(self.overpass_url, timeout=self.overpass_timeout, log=self.warn)
+        return client.fetch(query, use_cached=cached)
+
+    def malformed_elements(self):
+        return MalformedElements(log=self.warn)
+
+    def report_writes(self, label, stats):
+        """label, then a BulkUpserter's finish() stats on one line"""
+        self.stdout.write(
+            f"{label}: {stats['created']} created, {stats['updated']} updated "
+            f"in {stats['seconds']}s ({stats['rows_per_second']} rows/s)"
+        )
@@ -0,0 +1,287 @@
+import base64
+import datetime
+import decimal
+import hashlib
+import json
+from collections import OrderedDict
+
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.db.models import F, Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+from .dataversion import get_data_versions
+
+# --- CONFIGURATION ---
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+COUNT_CACHE_TTL = 60 * 5        # How stale a cached total may be (seconds)
+
+
+def _json_default(value):
+    # Full precision: keyset equality on created_on needs the microseconds
+    if isinstance(value, (datetime.datetime, datetime.date)):
+        return value.isoformat()
+    if isinstance(value, decimal.Decimal):
+        return str(value)
+    raise TypeError(f"Can't put {type(value).__name__} in a cursor")
+
+
+class KeysetPagination(BasePagination):
+    """
+    Cursor pagination that seeks with WHERE on the ordering columns instead
+    of OFFSET, so page 1000 costs the same as page 1.
+    - Ordering comes from ?ordering= (OrderingFilter), else the view's
+      keyset_ordering, else 'id'. The primary key is appended as a
+      tie-breaker, so ordering on non-unique columns (rating_avg,
+      created_on) never skips or repeats rows. NULLs sort first ascending
+      and last descending, as SQLite stores them in the index.
+    - Cursors are opaque (base64 JSON) and only valid for the ordering they
+      were made with.
+    - Orderings that aren't model columns (the search rank) can't be
+      seeked on, so those cursors hold an offset instead.
+    - count is exact on the first page and carried inside the cursor after
+      that, so later pages never run COUNT(*). Views that declare
+      cache_scopes (CachedResponseMixin) also share it for COUNT_CACHE_TTL
+      per query and version of those scopes. Other views (e.g. the logbook)
+      change without a version bump, so they always count.
+    - ?page_size= up to max_page_size. A view can set page_size and
+      max_page_size to change its defaults and cap.
+    """
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'page_size'
+    page_size = api_settings.PAGE_SIZE or DEFAULT_PAGE_SIZE
+    max_page_size = MAX_PAGE_SIZE
+    invalid_cursor_message = 'Invalid cursor'
+
+    # --- Request parameters ---
+
+    def get_page_size(self, request, view):
+        default = getattr(view, 'page_size', self.page_size)
+        cap = getattr(view, 'max_page_size', self.max_page_size)
+        raw = request.query_params.get(self.page_size_query_param)
+        try:
+            size = int(raw) if raw else default
+        except ValueError:
+            size = default
+        return max(1, min(size, cap))
+
+    def encode_cursor(self, payload):
+        payload = dict(payload, o=self.ordering)
+        if self.count is not None:
+            payload['c'] = self.count
+        token = json.dumps(payload, default=_json_default, separators=(',', ':'))
+        token = base64.urlsafe_b64encode(token.encode()).decode().rstrip('=')
+        return replace_query_param(self.base_url, self.cursor_query_param, token)
+
+    def decode_cursor(self, request):
+        token = request.query_params.get(self.cursor_query_param)
+        if not token:
+            return None
+        try:
+            payload = json.loads(base64.urlsafe_b64decode(token + '=' * (-len(token) % 4)))
+        except (TypeError, ValueError):
+            raise NotFound(self.invalid_cursor_message)
+        if not isinstance(payload, dict) or payload.get('o') != self.ordering:
+            raise NotFound(self.invalid_cursor_message)
+        return payload
+
+    def cursor_position(self, queryset, fields, cursor):
+        """The cursor's ordering values, converted by their model fields (NotFound if forged)"""
+        values = cursor.get('v')
+        if not isinstance(values, list) or len(values) != len(fields):
+            raise NotFound(self.invalid_cursor_message)
+        position = []
+        for (name, _, nullable), value in zip(fields, values):
+            if value is None:
+                if not nullable:
+                    raise NotFound(self.invalid_cursor_message)
+                position.append(None)
+                continue
+            if isinstance(value, (list, dict)):
+                raise NotFound(self.invalid_cursor_message)
+            try:
+                field = queryset.model._meta.get_field(name)
+                position.append(field.get_prep_value(field.to_python(value)))
+            except (TypeError, ValueError, ValidationError):
+                raise NotFound(self.invalid_cursor_message)
+        return position
+
+    # --- Ordering ---
+
+    def get_ordering(self, queryset, view):
+        """['-rating_avg', '-id'] style list, tie-breaker included"""
+        query = queryset.query
+        ordering = list(query.extra_order_by or query.order_by) or list(getattr(view, 'keyset_ordering', ['id']))
+        ordering = [str(term) for term in ordering]
+        pk = queryset.model._meta.pk.name
+        if not any(term.lstrip('-') in (pk, 'pk') for term in ordering):
+            ordering.append('-' + pk if ordering[-1].startswith('-') else pk)
+        return ordering
+
+    def keyset_fields(self, queryset):
+        """[(name, descending, nullable)], or None if a term isn't a model column"""
+        fields = []
+        meta = queryset.model._meta
+        for term in self.ordering:
+            name = term.lstrip('-')
+            name = meta.pk.name if name == 'pk' else name
+            try:
+                field = meta.get_field(name)
+            except Exception:
+                return None
+            if not getattr(field, 'concrete', False) or field.is_relation:
+                return None
+            fields.append((name, term.startswith('-'), field.null))
+        return fields
+
+    @staticmethod
+    def order_expressions(fields, reverse=False):
+        expressions = []
+        for name, descending, nullable in fields:
+            if descending != reverse:
+                expressions.append(F(name).desc(nulls_last=True) if nullable else F(name).desc())
+            else:
+                expressions.append(F(name).asc(nulls_first=True) if nullable else F(name).asc())
+        return expressions
+
+    @staticmethod
+    def seek_filter(fields, values, reverse=False):
+        """Rows strictly after values in the (possibly reversed) ordering"""
+        condition = Q(pk__in=[])
+        equal = Q()
+        for (name, descending, nullable), value in zip(fields, values):
+            descending = descending != reverse
+            if value is None:
+                after = Q(**{f'{name}__isnull': False}) if not descending else None
+                same = Q(**{f'{name}__isnull': True})
+            else:
+                after = Q(**{f'{name}__lt' if descending else f'{name}__gt': value})
+                if descending and nullable:
+                    after |= Q(**{f'{name}__isnull': True})
+                same = Q(**{name: value})
+            if after is not None:
+                condition |= equal & after
+            equal &= same
+        return condition
+
+    # --- Paging ---
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.base_url = remove_query_param(request.build_absolute_uri(), self.cursor_query_param)
+        self.page_size = self.get_page_size(request, view)
+        self.ordering = self.get_ordering(queryset, view)
+        cursor = self.decode_cursor(request)
+        self.count = cursor.get('c') if cursor else None
+        if self.count is None:
+            self.count = self.get_count(queryset, getattr(view, 'cache_scopes', ()))
+
+        fields = self.keyset_fields(queryset)
+        if fields is None:
+            return self.paginate_by_offset(queryset, cursor)
+        return self.paginate_by_keyset(queryset, fields, cursor)
+
+    def paginate_by_keyset(self, queryset, fields, cursor):
+        reverse = bool(cursor) and cursor.get('d') == 'prev'
+        loaded, deferring = queryset.query.deferred_loading
+        if loaded and not deferring:
+            # Sparse fieldsets may have left the ordering columns out of only()
+            queryset = queryset.only(*loaded, *(name for name, _, _ in fields))
+        queryset = queryset.order_by(*self.order_expressions(fields, reverse))
+        if cursor:
+            position = self.cursor_position(queryset, fields, cursor)
+            queryset = queryset.filter(self.seek_filter(fields, position, reverse))
+
+        rows = list(queryset[:self.page_size + 1])
+        has_more = len(rows) > self.page_size
+        rows = rows[:self.page_size]
+        if reverse:
+            rows.reverse()
+
+        def position(row):
+            return [getattr(row, name) for name, _, _ in fields]
+
+        self.next_link = self.previous_link = None
+        if rows and (has_more or reverse):
+            self.next_link = self.encode_cursor({'v': position(rows[-1]), 'd': 'next'})
+        if rows and cursor and (has_more or not reverse):
+            self.previous_link = self.encode_cursor({'v': position(rows[0]), 'd': 'prev'})
+        return rows
+
+    def paginate_by_offset(self, queryset, cursor):
+        offset = cursor.get('p', 0) if cursor else 0
+        if not isinstance(offset, int) or offset < 0:
+            raise NotFound(self.invalid_cursor_message)
+        if queryset.query.extra_order_by:
+            # Keep the extra ordering (e.g. search_rank) and make it total
+            pk_column = f'{queryset.model._meta.db_table}.{queryset.model._meta.pk.column}'
+            queryset = queryset.extra(order_by=[*queryset.query.extra_order_by, pk_column])
+
+        rows = list(queryset[offset:offset + self.page_size + 1])
+        self.next_link = self.previous_link = None
+        if len(rows) > self.page_size:
+            self.next_link = self.encode_cursor({'p': offset + self.page_size})
+        if offset:
+            self.previous_link = self.encode_cursor({'p': max(offset - self.page_size, 0)})
+        return rows[:self.page_size]
+
+    def get_count(self, queryset, scopes=()):
+        """
+        Exact COUNT(*). With scopes (the data versions the rows depend on),
+        it is shared by every first page of the same query until one changes.
+        """
+        if not scopes:
+            return queryset.count()
+        sql, params = queryset.query.sql_with_params()
+        # str(), not repr(): geometry params print as WKT rather than an address
+        versions = get_data_versions(scopes)
+        key_source = '\n'.join([sql, *map(str, params), *(versions[scope]['version'] for scope in scopes)])
+        key = f"count_{hashlib.sha1(key_source.encode()).hexdigest()[:20]}"
+        count = cache.get(key)
+        if count is None:
+            count = queryset.count()
+            cache.set(key, count, COUNT_CACHE_TTL)
+        return count
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([
+            ('count', self.count),
+            ('next', self.next_link),
+            ('previous', self.previous_link),
+            ('results', data),
+        ]))
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['count', 'results'],
+            'properties': {
+                'count': {'type': 'integer', 'example': 123},
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'previous': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
+
+    def get_schema_operation_parameters(self, view):
+        return [
+            {
+                'name': self.cursor_query_param,
+                'required': False,
+                'in': 'query',
+                'description': 'The pagination cursor value.',
+                'schema': {'type': 'string'},
+            },
+            {
+                'name': self.page_size_query_param,
+                'required': False,
+                'in': 'query',
+                'description': f'Number of results to return per page (max {self.max_page_size}).',
+                'schema': {'type': 'integer'},
+            },
+        ]
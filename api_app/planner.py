@@ -0,0 +1,127 @@
+from django.core.exceptions import FieldDoesNotExist
+from django.db.models import Prefetch
+from rest_framework import serializers
+from rest_framework.relations import ManyRelatedField, PrimaryKeyRelatedField
+
+
+class QueryPlan:
+    """
+    What a serializer reads from its queryset:
+    - columns: for only() (None = unknown, load the whole row)
+    - joins: select_related paths for values read through foreign keys
+    - prefetches: {lookup: Prefetch} for reverse and many-to-many relations
+    """
+
+    def __init__(self):
+        self.columns = set()
+        self.joins = set()
+        self.prefetches = {}
+
+    def add_columns(self, columns, prefix=''):
+        if self.columns is not None:
+            self.columns.update(prefix + column for column in columns)
+
+    def merge(self, other, prefix=''):
+        """Adds another plan's needs, read through the relation prefix ('trail__')"""
+        if other.columns is None:
+            self.columns = None
+        else:
+            self.add_columns(other.columns, prefix)
+        self.joins.update(prefix + join for join in other.joins)
+        for lookup, prefetch in other.prefetches.items():
+            self.prefetches[prefix + lookup] = Prefetch(prefix + lookup, queryset=prefetch.queryset)
+
+    def apply(self, queryset):
+        if self.joins:
+            queryset = queryset.select_related(*sorted(self.joins))
+        if self.prefetches:
+            queryset = queryset.prefetch_related(*(self.prefetches[lookup] for lookup in sorted(self.prefetches)))
+        if self.columns is not None:
+            queryset = queryset.only(queryset.model._meta.pk.name, *sorted(self.columns))
+        return queryset
+
+
+def related_queryset(model_field, plan):
+    """Prefetch queryset for a reverse FK / many-to-many, keeping the column the join matches on"""
+    queryset = plan.apply(model_field.related_model._default_manager.all())
+    if plan.columns is not None and model_field.one_to_many:
+        queryset = queryset.only(*queryset.query.deferred_loading[0], model_field.field.name)
+    return queryset
+
+
+def plan_field(serializer, name, field):
+    """QueryPlan for one serializer field, or None if its columns can't be worked out"""
+    plan = QueryPlan()
+
+    declared = getattr(getattr(serializer, 'Meta', None), 'field_requires', {}).get(name)
+    if declared is None:
+        declared = getattr(field, 'requires', None)
+    if declared is not None:
+        plan.add_columns(declared)
+        return plan
+    if field.source == '*':
+        return None
+
+    # Walk forward foreign keys in the source ('user.username' -> user)
+    model = serializer.Meta.model
+    path = []
+    for position, attr in enumerate(field.source_attrs):
+        try:
+            model_field = model._meta.get_field(attr)
+        except FieldDoesNotExist:
+            return None  # A property or method: unknown columns
+        last = position == len(field.source_attrs) - 1
+        if not last and not (model_field.many_to_one or model_field.one_to_one):
+            return None
+        path.append(attr)
+        if not last:
+            model = model_field.related_model
+
+    lookup = '__'.join(path)
+    joined = '__'.join(path[:-1])
+    if joined:
+        plan.joins.add(joined)
+
+    if model_field.one_to_many or model_field.many_to_many:
+        child = field.child if isinstance(field, serializers.ListSerializer) else None
+        if isinstance(child, serializers.ModelSerializer):
+            child_plan = plan_serializer(child)
+        elif isinstance(field, ManyRelatedField) and isinstance(field.child_relation, PrimaryKeyRelatedField):
+            child_plan = QueryPlan()  # Only the primary keys are read
+        else:
+            child_plan = QueryPlan()
+            child_plan.columns = None
+        plan.prefetches[lookup] = Prefetch(lookup, queryset=related_queryset(model_field, child_plan))
+    elif isinstance(field, serializers.ModelSerializer):
+        # Nested object through a foreign key: one join, then its own needs
+        plan.joins.add(lookup)
+        plan.add_columns([lookup])
+        plan.merge(plan_serializer(field), prefix=lookup + '__')
+    elif not model_field.concrete:
+        return None
+    else:
+        plan.add_columns([lookup])
+    return plan
+
+
+def plan_serializer(serializer):
+    """
+    QueryPlan for every field a (possibly sparse) serializer will output.
+    Nested serializers are planned recursively: a nested object through a
+    foreign key becomes a join, a nested list a Prefetch whose queryset is
+    planned the same way, so a page costs the same number of queries
+    whatever its size.
+    """
+    plan = QueryPlan()
+    for name, field in serializer.fields.items():
+        field_plan = plan_field(serializer, name, field)
+        if field_plan is None:
+            plan.columns = None
+            continue
+        plan.merge(field_plan)
+    return plan
+
+
+def plan_queryset(queryset, serializer):
+    """Narrows queryset to what serializer reads: only(), select_related, prefetch_related"""
+    return plan_serializer(serializer).apply(queryset)
@@ -0,0 +1,50 @@
+import importlib
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+
+# Nothing Django-specific is imported at module level: on platforms that
+# spawn workers (Windows), this module is imported before django.setup().
+
+_commands = {}
+
+
+def _init_worker():
+    import django
+    django.setup()
+
+
+def _call_command_method(module, method, item):
+    """Runs Command().<method>(item) from a management command module, one instance per worker"""
+    if module not in _commands:
+        _commands[module] = importlib.import_module(module).Command()
+    return getattr(_commands[module], method)(item)
+
+
+def pooled_map(command, method, items, workers, window_per_worker=4):
+    """
+    Like map(getattr(command, method), items), fanned out to a process pool.
+    - Results come back in input order as (item, result) pairs, so the
+      caller stays the single writer.
+    - At most workers * window_per_worker items are in flight, so a
+      streamed input is never read into memory all at once.
+    - workers <= 1 runs in-process with no pool at all.
+    """
+    if workers <= 1:
+        func = getattr(command, method)
+        for item in items:
+            yield item, func(item)
+        return
+
+    func = partial(_call_command_method, type(command).__module__, method)
+    window = workers * window_per_worker
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker) as executor:
+        pending = deque()
+        for item in items:
+            pending.append((item, executor.submit(func, item)))
+            if len(pending) >= window:
+                item, future = pending.popleft()
+                yield item, future.result()
+        while pending:
+            item, future = pending.popleft()
+            yield item, future.result()
@@ -0,0 +1,69 @@
+from django.db import transaction
+from django.db.models import Count, F, FloatField, Q, Sum
+from django.db.models.functions import Cast, NullIf
+
+from .models import Trail, Review, RATING_VALUES, rating_hist_field
+from .dataversion import bump_data_version
+
+
+def apply_rating_change(trail_id, old=None, new=None):
+    """
+    Moves one review's rating in a trail's stored aggregates.
+    old/new are the rating before and after (None = no rating), so create is
+    (None, r), delete is (r, None) and an edit is (r1, r2).
+    Counters are changed with F() expressions in UPDATEs, so concurrent
+    reviews can't overwrite each other's increments. Run it inside the same
+    transaction as the review write.
+    """
+    if old == new:
+        return
+
+    changes = {}
+    if old is not None:
+        changes[rating_hist_field(old)] = F(rating_hist_field(old)) - 1
+    if new is not None:
+        changes[rating_hist_field(new)] = F(rating_hist_field(new)) + 1
+    changes['rating_count'] = F('rating_count') + (int(new is not None) - int(old is not None))
+    changes['rating_sum'] = F('rating_sum') + ((new or 0) - (old or 0))
+
+    trails = Trail.objects.filter(pk=trail_id)
+    trails.update(**changes)
+    # The average needs the new sum and count, so it is a second UPDATE
+    trails.update(rating_avg=_average())
+
+
+def _average():
+    return Cast(F('rating_sum'), FloatField()) / NullIf(F('rating_count'), 0)
+
+
+def rebuild_ratings(batch_size=500):
+    """
+    Recomputes every trail's aggregates from Review in one grouped query.
+    Returns the number of trails updated.
+    """
+    aggregates = {
+        row['trail']: row
+        for row in Review.objects.exclude(rating=None).values('trail').annotate(
+            count=Count('id'),
+            total=Sum('rating'),
+            **{f'hist_{value}': Count('id', filter=Q(rating=value)) for value in RATING_VALUES},
+        )
+    }
+
+    fields = ['rating_count', 'rating_sum', 'rating_avg'] + [rating_hist_field(v) for v in RATING_VALUES]
+    updated = 0
+    with transaction.atomic():
+        ids = list(Trail.objects.values_list('id', flat=True))
+        for start in range(0, len(ids), batch_size):
+            batch = []
+            for trail_id in ids[start:start + batch_size]:
+                row = aggregates.get(trail_id, {})
+                trail = Trail(id=trail_id, rating_count=row.get('count', 0), rating_sum=row.get('total') or 0)
+                trail.rating_avg = trail.rating_sum / trail.rating_count if trail.rating_count else None
+                for value in RATING_VALUES:
+                    setattr(trail, rating_hist_field(value), row.get(f'hist_{value}', 0))
+                batch.append(trail)
+            Trail.objects.bulk_update(batch, fields)
+            updated += len(batch)
+    bump_data_version('reviews')
+    return updated
@@ -0,0 +1,69 @@
+import hashlib
+from django.core.cache import cache
+from django.utils.http import http_date, parse_http_date_safe, quote_etag
+from rest_framework import status
+from rest_framework.response import Response
+
+from .dataversion import get_data_versions
+
+# --- CONFIGURATION ---
+RESPONSE_CACHE_TTL = 60 * 60 * 24
+
+
+class CachedResponseMixin:
+    """
+    Read-through cache for a read-only viewset's list and retrieve.
+    - Entries are keyed by path, query string, renderer and the versions of
+      cache_scopes (see api_app/dataversion.py), so bumping a version
+      invalidates every response built from that data at once.
+    - Responses carry an ETag (the same key) and Last-Modified (the newest
+      scope change).
+    - If-None-Match / If-Modified-Since are answered with 304 from the
+      versions alone, before any queryset is built.
+    cache_timeout bounds how long an entry can be served. Keep it short
+    for anything computed at request time (e.g. weather age).
+    """
+    cache_scopes = ('data',)
+    cache_timeout = RESPONSE_CACHE_TTL
+
+    def list(self, request, *args, **kwargs):
+        return self.cached_response(super().list, request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.cached_response(super().retrieve, request, *args, **kwargs)
+
+    def response_etag(self, request, versions):
+        renderer = getattr(request, 'accepted_renderer', None)
+        parts = [
+            request.get_full_path(),
+            getattr(renderer, 'format', ''),
+            *(f"{scope}:{versions[scope]['version']}" for scope in self.cache_scopes),
+        ]
+        return hashlib.sha1('\n'.join(parts).encode()).hexdigest()[:20]
+
+    def not_modified(self, request, etag, last_modified):
+        if_none_match = request.headers.get('If-None-Match')
+        if if_none_match:
+            return quote_etag(etag) in [tag.strip() for tag in if_none_match.split(',')] or if_none_match.strip() == '*'
+        since = parse_http_date_safe(request.headers.get('If-Modified-Since', ''))
+        return since is not None and int(last_modified) <= since
+
+    def cached_response(self, handler, request, *args, **kwargs):
+        versions = get_data_versions(self.cache_scopes)
+        etag = self.response_etag(request, versions)
+        last_modified = max(state['changed_at'] for state in versions.values())
+        headers = {'ETag': quote_etag(etag), 'Last-Modified': http_date(last_modified)}
+
+        if self.not_modified(request, etag, last_modified):
+            return Response(status=status.HTTP_304_NOT_MODIFIED, headers=headers)
+
+        key = f"response_{etag}"
+        data = cache.get(key)
+        if data is None:
+            response = handler(request, *args, **kwargs)
+            if response.status_code != status.HTTP_200_OK:
+                return response
+            data = response.data
+            cache.set(key, data, self.cache_timeout)
+
+        return Response(data, headers=headers)
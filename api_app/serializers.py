@@ -1,10 +1,13 @@
 from rest_framework import serializers
-from .models import Trail, Review, TransportLink, CarPark, TrailLogBook
-import requests
-from django.core.cache import cache
+from .models import Trail, Review, TransportLink, CarPark, TrailLogBook, RATING_VALUES, rating_hist_field
+from .derived import DerivedData, DerivedField, DerivedListSerializer
+from .weather import WeatherProvider
+from .lod import DETAIL_FIELDS
+from .fieldsets import SparseFieldsetSerializerMixin
+from .includes import IncludeSerializerMixin
 
 # --- REVIEW SERIALIZER ---
-class ReviewSerializer(serializers.ModelSerializer):
+class ReviewSerializer(SparseFieldsetSerializerMixin, serializers.ModelSerializer):
     """
     Serializer for User Reviews.
     - user: ReadOnlyField ensures the username is displayed, but cannot be edited.
@@ -15,11 +18,11 @@ class ReviewSerializer(serializers.ModelSerializer):
     class Meta:
         model = Review
         fields = ['id', 'title', 'trail', 'user', 'rating', 'content', 'created_on']
-        read_only_fields = ['created_at'] # Timestamp is auto-generated
+        read_only_fields = ['created_on'] # Timestamp is auto-generated
 
 
 # --- TRANSPORT SERIALIZER ---
-class TransportSerializer(serializers.ModelSerializer):
+class TransportSerializer(SparseFieldsetSerializerMixin, serializers.ModelSerializer):
     """
     Serializer for Public Transport links (Bus/Train).
     - Returns simple coordinates (lat/lon) for map pins.
@@ -30,7 +33,7 @@ class TransportSerializer(serializers.ModelSerializer):
 
 
 # --- CAR PARK SERIALIZER ---
-class CarParkSerializer(serializers.ModelSerializer):
+class CarParkSerializer(SparseFieldsetSerializerMixin, serializers.ModelSerializer):
     """
     Serializer for Car Parks.
     - Includes capacity and 'is_free' boolean for filtering.
@@ -39,70 +42,116 @@ class CarParkSerializer(serializers.ModelSerializer):
         model = CarPark
         fields = ['id', 'trail', 'name', 'capacity', 'is_free', 'latitude', 'longitude', 'has_disabled_parking']
 
-class TrailSerializer(serializers.ModelSerializer):
+# --- TRAIL DERIVED DATA ---
+# Computed once per trail per request and shared by every field that needs it.
 
-    safety_score = serializers.SerializerMethodField()
-    current_weather = serializers.SerializerMethodField()
+def weather_provider(derived):
+    # One provider per request, shared by the whole page
+    if 'weather_provider' not in derived.context:
+        derived.context['weather_provider'] = WeatherProvider()
+    return derived.context['weather_provider']
+
+
+@DerivedData.register(
+    'current_weather',
+    prime=lambda trails, derived: weather_provider(derived).prime(trails),
+    requires=['latitude', 'longitude'],
+)
+def trail_current_weather(trail, derived):
+    return weather_provider(derived).get(trail)
+
+
+@DerivedData.register('safety_score', depends_on=['current_weather'], requires=[])
+def trail_safety_score(trail, derived):
+    weather = derived.get('current_weather', trail)
+    if not weather:
+        return None  # No data, no score
+
+    score = 100
+
+    # --- 1. Extract Data safely ---
+    # Use .get() to avoid crashing if a key is missing
+    temp = weather.get('temperature', 10)   # Default to 10°C if missing
+    wind = weather.get('windspeed', 0)      # Default to 0 if missing
+    code = weather.get('weathercode', 0)    # WMO code (0 = Clear sky)
+
+    # --- 2. Penalties based on Weather Code ---
+    # WMO Codes: https://open-meteo.com/en/docs
+
+    if 51 <= code <= 67: score -= 25  # Rain/Drizzle
+    elif 80 <= code <= 82: score -= 30  # Heavy Showers
+    elif 71 <= code <= 77: score -= 40  # Snow
+    elif code >= 95: score -= 50      # Thunderstorm
+
+    # --- 3. Penalties based on Conditions ---
+    if wind > 30: score -= 30    # Strong wind (>30 km/h)
+    elif wind > 20: score -= 15  # Moderate wind
+
+    if temp < 5: score -= 20     # Cold
+    if temp > 30: score -= 20    # Too Hot
+
+    return max(score, 0)
+
+
+# --- TRAIL PATH ---
+class TrailPathField(serializers.Field):
+    """
+    Read-only trail path at the level of detail chosen by the view
+    (context['path_detail']: low, medium or full; full if not set).
+    Falls back to the full path for trails whose simplified copies
+    haven't been computed yet.
+    """
+    requires = list(DETAIL_FIELDS.values())  # The view defers the levels it won't use
+    def __init__(self, **kwargs):
+        kwargs['source'] = '*'
+        kwargs['read_only'] = True
+        super().__init__(**kwargs)
+
+    def to_representation(self, trail):
+        detail = self.context.get('path_detail', 'full')
+        geom = getattr(trail, DETAIL_FIELDS[detail])
+        if geom is None:
+            geom = trail.path
+        return str(geom) if geom is not None else None
+
+
+# --- TRAIL SERIALIZER ---
+class TrailSerializer(IncludeSerializerMixin, SparseFieldsetSerializerMixin, serializers.ModelSerializer):
+    """
+    Serializer for Trails.
+    - path: simplified to the requested level of detail (see api_app/lod.py).
+    - rating_avg / rating_count / rating_histogram: stored review aggregates,
+      so no per-trail query over Review is needed.
+    - current_weather / safety_score: DerivedFields, so the weather for the
+      whole page is primed once and each trail's lookup is shared by both.
+    - ?fields= / ?exclude= drop fields; dropped fields are never computed.
+    - ?include= turns reviews / car_parks / transport_links into full objects.
+    """
+    path = TrailPathField()
+    rating_histogram = serializers.ReadOnlyField()
+    safety_score = DerivedField()
+    current_weather = DerivedField()
 
     class Meta:
         model = Trail
+        list_serializer_class = DerivedListSerializer
         fields = [
             'id', 'name', 'region', 'difficulty', 'length', 'elevation_gain', 
-            'popularity', 'path', 'car_parks', 'transport_links', 'safety_score',
+            'popularity', 'rating_avg', 'rating_count', 'rating_histogram',
+            'path', 'car_parks', 'transport_links', 'safety_score',
             'current_weather'
         ]
-
-    def get_current_weather(self, obj):
-        cache_key = f"weather_trail_{obj.id}"
-        cached_weather = cache.get(cache_key)
-
-        if cached_weather:
-            return cached_weather
-
-        # If not in cache, fetch it
-        url = f"https://api.open-meteo.com/v1/forecast?latitude={obj.latitude}&longitude={obj.longitude}&current_weather=true"
-        try:
-            response = requests.get(url, timeout=3)
-            if response.status_code == 200:
-                data = response.json().get('current_weather')
-                # Save to cache for 3600 seconds (1 hour)
-                cache.set(cache_key, data, 3600)
-                return data
-        except:
-            pass
-        return None
-
-    def get_safety_score(self, obj):
-            weather = self.get_current_weather(obj)
-            if not weather:
-                return None  # No data, no score
-                
-            score = 100
-            
-            # --- 1. Extract Data safely ---
-            # Use .get() to avoid crashing if a key is missing
-            temp = weather.get('temperature', 10)   # Default to 10°C if missing
-            wind = weather.get('windspeed', 0)      # Default to 0 if missing
-            code = weather.get('weathercode', 0)    # WMO code (0 = Clear sky)
-
-            # --- 2. Penalties based on Weather Code ---
-            # WMO Codes: https://open-meteo.com/en/docs
-            
-            if 51 <= code <= 67: score -= 25  # Rain/Drizzle
-            elif 80 <= code <= 82: score -= 30  # Heavy Showers
-            elif 71 <= code <= 77: score -= 40  # Snow
-            elif code >= 95: score -= 50      # Thunderstorm
-
-            # --- 3. Penalties based on Conditions ---
-            if wind > 30: score -= 30    # Strong wind (>30 km/h)
-            elif wind > 20: score -= 15  # Moderate wind
-            
-            if temp < 5: score -= 20     # Cold
-            if temp > 30: score -= 20    # Too Hot
-
-            return max(score, 0)
-
-class TrailLogBookSerializer(serializers.ModelSerializer):
+        read_only_fields = ['rating_avg', 'rating_count']
+        field_requires = {
+            'rating_histogram': [rating_hist_field(value) for value in RATING_VALUES],
+        }
+        includable = {
+            'reviews': ReviewSerializer,
+            'car_parks': CarParkSerializer,
+            'transport_links': TransportSerializer,
+        }
+
+class TrailLogBookSerializer(SparseFieldsetSerializerMixin, serializers.ModelSerializer):
     user = serializers.ReadOnlyField(source='user.username')
     trail_name = serializers.ReadOnlyField(source='trail.name') # Shows name instead of just ID
 
@@ -0,0 +1,119 @@
+import heapq
+from math import radians, cos, floor, ceil
+from .geo import haversine_km, distances_from
+
+KM_PER_DEGREE_LAT = 111.32
+
+
+class GridIndex:
+    """
+    Grid-hash spatial index over (id, lat, lon) points.
+    - Points are bucketed into square cells of cell_degrees, built once.
+    - radius(): only visits the cells overlapping the search circle.
+    - nearest(): searches outwards ring by ring and stops as soon as no
+      unvisited cell can hold anything closer than what it already has.
+    Both are constant time for evenly spread data, regardless of how many
+    points are indexed.
+    """
+
+    def __init__(self, points, cell_degrees=0.01):
+        self.cell_degrees = cell_degrees
+        self.cells = {}
+        self.size = 0
+
+        for point_id, lat, lon in points:
+            lat, lon = float(lat), float(lon)
+            self.cells.setdefault(self._cell(lat, lon), []).append((point_id, lat, lon))
+            self.size += 1
+
+        if self.cells:
+            rows = [i for i, _ in self.cells]
+            cols = [j for _, j in self.cells]
+            self._extent = (min(rows), max(rows), min(cols), max(cols))
+
+    @classmethod
+    def from_queryset(cls, queryset, cell_degrees=0.01):
+        """Builds an index from a model queryset, loading only id/lat/lon"""
+        return cls(queryset.values_list('id', 'latitude', 'longitude').iterator(), cell_degrees)
+
+    def __len__(self):
+        return self.size
+
+    def _cell(self, lat, lon):
+        return (floor(lat / self.cell_degrees), floor(lon / self.cell_degrees))
+
+    def _cell_sides_km(self, lat):
+        """(north-south, east-west) size of one cell in km at this latitude"""
+        ns = self.cell_degrees * KM_PER_DEGREE_LAT
+        ew = ns * max(cos(radians(lat)), 1e-6)
+        return ns, ew
+
+    def _ring(self, centre, r):
+        """Cells exactly r steps (Chebyshev distance) from centre"""
+        ci, cj = centre
+        if r == 0:
+            yield centre
+            return
+        for j in range(cj - r, cj + r + 1):
+            yield (ci - r, j)
+            yield (ci + r, j)
+        for i in range(ci - r + 1, ci + r):
+            yield (i, cj - r)
+            yield (i, cj + r)
+
+    def radius(self, lat, lon, radius_km):
+        """All points within radius_km, as a list of (distance_km, id) sorted by distance"""
+        lat, lon = float(lat), float(lon)
+        ci, cj = self._cell(lat, lon)
+        ns, ew = self._cell_sides_km(lat)
+        di = ceil(radius_km / ns)
+        dj = ceil(radius_km / ew)
+
+        candidates = []
+        for i in range(ci - di, ci + di + 1):
+            for j in range(cj - dj, cj + dj + 1):
+                candidates.extend(self.cells.get((i, j), ()))
+        if not candidates:
+            return []
+
+        ids, lats, lons = zip(*candidates)
+        dists = distances_from(lat, lon, lats, lons)
+        return sorted((float(d), point_id) for d, point_id in zip(dists, ids) if d <= radius_km)
+
+    def nearest(self, lat, lon, k=1, max_km=None):
+        """
+        The k closest points as a list of (distance_km, id) sorted by distance.
+        With max_km, points further away are ignored and the search stops early.
+        """
+        if not self.cells:
+            return []
+
+        lat, lon = float(lat), float(lon)
+        centre = self._cell(lat, lon)
+        step_km = min(self._cell_sides_km(lat))
+
+        # Furthest ring that can still contain points
+        min_i, max_i, min_j, max_j = self._extent
+        last_ring = max(abs(centre[0] - min_i), abs(centre[0] - max_i),
+                        abs(centre[1] - min_j), abs(centre[1] - max_j))
+
+        best = []  # max-heap of (-distance, id), at most k long
+        for r in range(last_ring + 1):
+            for cell in self._ring(centre, r):
+                for point_id, p_lat, p_lon in self.cells.get(cell, ()):
+                    dist = haversine_km(lat, lon, p_lat, p_lon)
+                    if max_km is not None and dist > max_km:
+                        continue
+                    if len(best) < k:
+                        heapq.heappush(best, (-dist, point_id))
+                    elif dist < -best[0][0]:
+                        heapq.heapreplace(best, (-dist, point_id))
+
+            # Anything in rings beyond r is at least this far away
+            bound = r * step_km
+            if len(best) == k and -best[0][0] <= bound:
+                break
+            if max_km is not None and bound > max_km:
+                break
+
+        return sorted((-neg_dist, point_id) for neg_dist, point_id in best)
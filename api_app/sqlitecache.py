@@ -0,0 +1,248 @@
+import os
+import pickle
+import sqlite3
+import threading
+import time
+
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+
+# --- CONFIGURATION ---
+BUSY_TIMEOUT = 5                # Seconds a writer waits for another worker's lock
+ACCESS_RESOLUTION = 10          # Only rewrite an entry's LRU timestamp this often (seconds)
+STATS_FLUSH_EVERY = 200         # Operations between writes of the hit/miss counters
+STATS_FLUSH_SECONDS = 5
+MAX_KEYS_PER_QUERY = 500       # Stay under SQLite's bound-parameter limit
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS cache (
+    key TEXT PRIMARY KEY,
+    value BLOB NOT NULL,
+    expires REAL,
+    accessed REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS cache_accessed ON cache (accessed);
+CREATE TABLE IF NOT EXISTS cache_stats (
+    name TEXT PRIMARY KEY,
+    count INTEGER NOT NULL
+);
+"""
+
+STAT_NAMES = ('hits', 'misses', 'evictions')
+
+
+class SQLiteCache(BaseCache):
+    """
+    Cache backend in a single SQLite file, shared by every process on a host
+    (gunicorn workers, refresh_weather, management commands).
+    - WAL mode, so readers never block each other or the writer.
+    - LRU eviction: once MAX_ENTRIES is passed, expired rows go first, then
+      the least recently read ones (1 / CULL_FREQUENCY of the table).
+    - Hit, miss and eviction counts are kept across workers in the same file
+      (see stats() and the cache_stats command).
+    Configure with LOCATION = path to the database file.
+    """
+
+    def __init__(self, location, params):
+        super().__init__(params)
+        self.path = str(location)
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._pending = dict.fromkeys(STAT_NAMES, 0)
+        self._pending_ops = 0
+        self._flushed_at = time.monotonic()
+
+    # --- Connection ---
+
+    def _connection(self):
+        """One connection per thread, reopened after a fork"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=BUSY_TIMEOUT, isolation_level=None, check_same_thread=False)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            conn.executescript(SCHEMA)
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    # --- Stats ---
+
+    def _record(self, name, count=1):
+        with self._lock:
+            self._pending[name] += count
+            self._pending_ops += count
+            due = (
+                self._pending_ops >= STATS_FLUSH_EVERY
+                or time.monotonic() - self._flushed_at >= STATS_FLUSH_SECONDS
+            )
+        if due:
+            self.flush_stats()
+
+    def flush_stats(self):
+        """Adds this process's unsaved counts to the shared totals"""
+        with self._lock:
+            pending = {name: count for name, count in self._pending.items() if count}
+            self._pending = dict.fromkeys(STAT_NAMES, 0)
+            self._pending_ops = 0
+            self._flushed_at = time.monotonic()
+        if pending:
+            self._connection().executemany(
+                'INSERT INTO cache_stats (name, count) VALUES (?, ?) '
+                'ON CONFLICT (name) DO UPDATE SET count = count + excluded.count',
+                pending.items(),
+            )
+
+    def stats(self):
+        """Totals across every process: hits, misses, hit_ratio, evictions, entries, size_bytes"""
+        self.flush_stats()
+        conn = self._connection()
+        totals = dict.fromkeys(STAT_NAMES, 0)
+        totals.update(conn.execute('SELECT name, count FROM cache_stats'))
+        lookups = totals['hits'] + totals['misses']
+        totals['hit_ratio'] = totals['hits'] / lookups if lookups else None
+        totals['entries'], totals['size_bytes'] = conn.execute(
+            'SELECT COUNT(*), COALESCE(SUM(LENGTH(value)), 0) FROM cache'
+        ).fetchone()
+        return totals
+
+    def reset_stats(self):
+        with self._lock:
+            self._pending = dict.fromkeys(STAT_NAMES, 0)
+            self._pending_ops = 0
+        self._connection().execute('DELETE FROM cache_stats')
+
+    # --- Reads ---
+
+    def _read(self, keys):
+        """{key: value} for the live entries among keys, touching their LRU time"""
+        if not keys:
+            return {}
+        conn = self._connection()
+        now = time.time()
+        rows = []
+        for start in range(0, len(keys), MAX_KEYS_PER_QUERY):
+            chunk = keys[start:start + MAX_KEYS_PER_QUERY]
+            rows += conn.execute(
+                f"SELECT key, value, expires, accessed FROM cache WHERE key IN ({','.join('?' * len(chunk))})", chunk
+            ).fetchall()
+
+        found, expired, stale = {}, [], []
+        for key, value, expires, accessed in rows:
+            if expires is not None and expires <= now:
+                expired.append(key)
+                continue
+            found[key] = pickle.loads(value)
+            if accessed < now - ACCESS_RESOLUTION:
+                stale.append(key)
+
+        if expired:
+            conn.executemany('DELETE FROM cache WHERE key = ? AND expires <= ?', [(key, now) for key in expired])
+        if stale:
+            conn.executemany('UPDATE cache SET accessed = ? WHERE key = ?', [(now, key) for key in stale])
+
+        self._record('hits', len(found))
+        self._record('misses', len(keys) - len(found))
+        return found
+
+    def get(self, key, default=None, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        return self._read([key]).get(key, default)
+
+    def get_many(self, keys, version=None):
+        keys = {self.make_and_validate_key(key, version=version): key for key in keys}
+        return {keys[key]: value for key, value in self._read(list(keys)).items()}
+
+    def has_key(self, key, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        row = self._connection().execute(
+            'SELECT 1 FROM cache WHERE key = ? AND (expires IS NULL OR expires > ?)', (key, time.time())
+        ).fetchone()
+        return row is not None
+
+    # --- Writes ---
+
+    def _write(self, entries, timeout, mode='REPLACE'):
+        """Writes [(key, value)] in one transaction. mode='IGNORE' keeps live entries (add)"""
+        conn = self._connection()
+        now = time.time()
+        expires = self.get_backend_timeout(timeout)
+        rows = [(key, pickle.dumps(value, pickle.HIGHEST_PROTOCOL), expires, now) for key, value in entries]
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            if mode == 'IGNORE':
+                # An expired entry doesn't count as present
+                conn.executemany('DELETE FROM cache WHERE key = ? AND expires <= ?', [(row[0], now) for row in rows])
+            cursor = conn.executemany(f'INSERT OR {mode} INTO cache (key, value, expires, accessed) VALUES (?, ?, ?, ?)', rows)
+            written = cursor.rowcount
+            self._cull(conn, now)
+            conn.execute('COMMIT')
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+        return written
+
+    def _cull(self, conn, now):
+        (count,) = conn.execute('SELECT COUNT(*) FROM cache').fetchone()
+        if count <= self._max_entries:
+            return
+        evicted = conn.execute('DELETE FROM cache WHERE expires <= ?', (now,)).rowcount
+        count -= evicted
+        if count > self._max_entries:
+            excess = count - self._max_entries + self._max_entries // self._cull_frequency
+            evicted += conn.execute(
+                'DELETE FROM cache WHERE key IN (SELECT key FROM cache ORDER BY accessed LIMIT ?)', (excess,)
+            ).rowcount
+        self._record('evictions', evicted)
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        self._write([(key, value)], timeout)
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None):
+        entries = [(self.make_and_validate_key(key, version=version), value) for key, value in data.items()]
+        if entries:
+            self._write(entries, timeout)
+        return []
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        return self._write([(key, value)], timeout, mode='IGNORE') == 1
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        now = time.time()
+        return self._connection().execute(
+            'UPDATE cache SET expires = ?, accessed = ? WHERE key = ? AND (expires IS NULL OR expires > ?)',
+            (self.get_backend_timeout(timeout), now, key, now),
+        ).rowcount == 1
+
+    def incr(self, key, delta=1, version=None):
+        """Atomic across workers: the read and write share one write lock"""
+        key = self.make_and_validate_key(key, version=version)
+        conn = self._connection()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            row = conn.execute(
+                'SELECT value FROM cache WHERE key = ? AND (expires IS NULL OR expires > ?)', (key, time.time())
+            ).fetchone()
+            if row is None:
+                raise ValueError("Key '%s' not found" % key)
+            value = pickle.loads(row[0]) + delta
+            conn.execute('UPDATE cache SET value = ? WHERE key = ?', (pickle.dumps(value, pickle.HIGHEST_PROTOCOL), key))
+            conn.execute('COMMIT')
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+        return value
+
+    def delete(self, key, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        return self._connection().execute('DELETE FROM cache WHERE key = ?', (key,)).rowcount == 1
+
+    def delete_many(self, keys, version=None):
+        keys = [(self.make_and_validate_key(key, version=version),) for key in keys]
+        if keys:
+            self._connection().executemany('DELETE FROM cache WHERE key = ?', keys)
+
+    def clear(self):
+        self._connection().execute('DELETE FROM cache')
@@ -0,0 +1,39 @@
+from django.core.cache import cache
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+# --- CONFIGURATION ---
+PAGE_SIZES = (2, 10)    # Page sizes compared; the fixture needs at least the larger
+
+
+def list_endpoints():
+    """(url, basename) for every viewset registered on the API router"""
+    from .urls import router
+    return [(f'/api/{prefix}/', basename) for prefix, _, basename in router.registry]
+
+
+class QueryCountAssertionsMixin:
+    """
+    TestCase mixin that catches N+1 queries on list endpoints.
+    assertQueriesIndependentOfPageSize(url) requests the same list at each
+    of PAGE_SIZES and fails if the number of queries differs, i.e. if
+    something is still loaded once per row. Each request starts from an
+    empty cache, so response and count caching can't hide queries.
+    """
+
+    def count_list_queries(self, url, page_size, **params):
+        cache.clear()
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url, {'page_size': page_size, **params})
+        self.assertEqual(response.status_code, 200, f"{url} returned {response.status_code}")
+        rows = len(response.json()['results'])
+        self.assertEqual(rows, page_size, f"{url} needs at least {page_size} rows to compare page sizes (got {rows})")
+        return queries
+
+    def assertQueriesIndependentOfPageSize(self, url, sizes=PAGE_SIZES, **params):
+        captured = {size: self.count_list_queries(url, size, **params) for size in sizes}
+        counts = {size: len(queries) for size, queries in captured.items()}
+        if len(set(counts.values())) > 1:
+            largest = captured[max(sizes)]
+            sql = '\n'.join(f"  {query['sql']}" for query in largest.captured_queries)
+            self.fail(f"{url}: query count grows with page size {counts}\nQueries at page_size={max(sizes)}:\n{sql}")
@@ -1,3 +1,851 @@
-from django.test import TestCase
+import base64
+import datetime
+import importlib
+import io
+import json
+import os
+import struct
+import tempfile
+import threading
+import time
+from types import SimpleNamespace
+from urllib.parse import parse_qs, urlparse
+from unittest import mock
 
-# Create your tests here.
+import numpy as np
+import requests
+from django.contrib.auth.models import User
+from django.core.cache import cache, caches
+from django.core.management import call_command
+from django.contrib.gis.gdal import GDALRaster
+from django.contrib.gis.geos import LineString, MultiLineString
+from django.db import connection
+from django.db.models import Avg, Count, Q
+from django.test import SimpleTestCase, TestCase, override_settings
+from rest_framework.exceptions import ValidationError
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+from rest_framework.throttling import ScopedRateThrottle
+
+from .models import Trail, Review, TransportLink, CarPark, TrailLogBook, RATING_VALUES
+from .overpass import ImportState, MalformedElements
+from .management.commands import import_trails
+from . import clustering, elevation, mvt, sqlitecache, weather
+from .dataversion import bump_data_version
+from .views import TrailViewSet
+from .checks import missing_fts_triggers
+from .testing import PAGE_SIZES, QueryCountAssertionsMixin, list_endpoints
+
+TEST_CACHES = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+
+
+def make_trail(i, **fields):
+    lon, lat = -1.8 + i * 0.01, 53.3 + i * 0.01
+    return Trail.objects.create(
+        name=f'Trail {i}', region='Peak District', latitude=lat, longitude=lon,
+        path=MultiLineString(LineString((lon, lat), (lon + 0.01, lat + 0.01)), srid=4326), **fields,
+    )
+
+
+@override_settings(CACHES=TEST_CACHES)
+class ListQueryCountTests(QueryCountAssertionsMixin, TestCase):
+    """Every list endpoint must cost the same number of queries for any page size"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('hiker', password='boots')
+        rows = max(PAGE_SIZES) + 2
+        for i in range(rows):
+            trail = make_trail(i)
+            lat, lon = trail.latitude, trail.longitude
+            CarPark.objects.create(trail=trail, name=f'Car park {i}', latitude=lat, longitude=lon)
+            TransportLink.objects.create(trail=trail, name=f'Stop {i}', type='BUS', latitude=lat, longitude=lon)
+            Review.objects.create(trail=trail, user=cls.user, title='Good', content='Nice views', rating=4)
+            TrailLogBook.objects.create(
+                user=cls.user, trail=trail, date_hiked=datetime.date(2026, 5, 1),
+                duration_minutes=90, weather='Sunny',
+            )
+
+    def setUp(self):
+        self.client.force_login(self.user)
+
+    def test_list_endpoints(self):
+        for url, _ in list_endpoints():
+            with self.subTest(url=url):
+                self.assertQueriesIndependentOfPageSize(url)
+
+    def test_sparse_and_ordered_lists(self):
+        self.assertQueriesIndependentOfPageSize('/api/trails/', fields='id,name,car_parks')
+        self.assertQueriesIndependentOfPageSize('/api/reviews/', ordering='-rating')
+
+    def test_included_relations(self):
+        include = 'reviews,car_parks,transport_links'
+        self.assertQueriesIndependentOfPageSize('/api/trails/', include=include)
+
+        data = self.client.get('/api/trails/', {'include': include, 'page_size': 3}).json()
+        self.assertEqual(len(data['included']['car_parks']), 3)
+        self.assertEqual(data['results'][0]['reviews'], [data['included']['reviews'][0]['id']])
+
+
+@override_settings(CACHES=TEST_CACHES)
+class KeysetPaginationTests(TestCase):
+    """Seek paging must visit every row once, in order, both ways, and reject forged cursors"""
+
+    RATINGS = [4.5, None, 3.0, None, 4.5, 2.0, None]
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.trails = [make_trail(i, rating_avg=rating) for i, rating in enumerate(cls.RATINGS)]
+
+    def expected(self, descending):
+        rated = sorted((t.rating_avg, t.id) for t in self.trails if t.rating_avg is not None)
+        unrated = sorted((None, t.id) for t in self.trails if t.rating_avg is None)
+        rows = unrated + rated  # NULLs first ascending, last descending
+        return [id for _, id in (reversed(rows) if descending else rows)]
+
+    def walk(self, url, params):
+        """ids going forward through every page, then back again from the last one"""
+        forward, backward = [], []
+        data = self.client.get(url, params).json()
+        forward += [row['id'] for row in data['results']]
+        while data['next']:
+            data = self.client.get(data['next']).json()
+            forward += [row['id'] for row in data['results']]
+        while data['previous']:
+            data = self.client.get(data['previous']).json()
+            backward = [row['id'] for row in data['results']] + backward
+        return forward, backward
+
+    def test_null_ratings_both_directions(self):
+        for ordering in ('rating_avg', '-rating_avg'):
+            with self.subTest(ordering=ordering):
+                expected = self.expected(ordering.startswith('-'))
+                forward, backward = self.walk('/api/trails/', {'ordering': ordering, 'page_size': 2, 'fields': 'id'})
+                self.assertEqual(forward, expected)
+                self.assertEqual(backward, expected[:len(backward)])
+                self.assertEqual(len(backward), len(expected) - 1)  # All but the last page (odd row count)
+
+    def tampered(self, params, values):
+        next_link = self.client.get('/api/trails/', {'page_size': 2, **params}).json()['next']
+        token = parse_qs(urlparse(next_link).query)['cursor'][0]
+        payload = json.loads(base64.urlsafe_b64decode(token + '=' * (-len(token) % 4)))
+        payload['v'] = values
+        token = base64.urlsafe_b64encode(json.dumps(payload).encode()).decode()
+        return self.client.get('/api/trails/', {'page_size': 2, 'cursor': token, **params})
+
+    def test_tampered_cursor(self):
+        for params, values in [
+            ({}, ['abc']),
+            ({}, [{'id': 1}]),
+            ({}, [[1]]),
+            ({}, [None]),
+            ({'ordering': '-rating_avg'}, ['high', 1]),
+            ({'ordering': 'name'}, ['Trail 1', 'x']),
+        ]:
+            with self.subTest(params=params, values=values):
+                self.assertEqual(self.tampered(params, values).status_code, 404)
+
+    def test_logbook_count_follows_writes(self):
+        self.client.force_login(User.objects.create_user('walker', password='boots'))
+        count = lambda: self.client.get('/api/logbook/').json()['count']
+        self.assertEqual(count(), 0)
+        created = self.client.post('/api/logbook/', {
+            'trail': self.trails[0].id, 'date_hiked': '2026-05-01', 'duration_minutes': 90, 'weather': 'Sunny',
+        }).json()
+        self.assertEqual(count(), 1)
+        self.client.delete(f"/api/logbook/{created['id']}/")
+        self.assertEqual(count(), 0)
+
+
+@override_settings(CACHES=TEST_CACHES)
+class TrailSearchTests(TestCase):
+    """The FTS5 index must follow every trail write through its triggers"""
+
+    def search(self, text):
+        return [row['name'] for row in self.client.get('/api/trails/', {'search': text, 'fields': 'name'}).json()['results']]
+
+    def test_triggers_exist(self):
+        self.assertEqual(missing_fts_triggers(connection), [])
+
+    def test_create_rename_delete(self):
+        trail = make_trail(0)
+        self.assertEqual(self.search('trail'), ['Trail 0'])
+
+        trail.name = 'Mam Tor Ridge'
+        trail.save()
+        self.assertEqual(self.search('trail'), [])
+        self.assertEqual(self.search('mam tor'), ['Mam Tor Ridge'])
+
+        Trail.objects.filter(pk=trail.pk).delete()
+        self.assertEqual(self.search('mam tor'), [])
+
+
+@override_settings(CACHES=TEST_CACHES)
+class ResponseCacheTests(TestCase):
+    """Cached reads and conditional GETs cost no queries until the data version moves"""
+
+    url = '/api/carparks/'
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.trail = make_trail(0)
+        CarPark.objects.create(trail=cls.trail, name='Car park 0', latitude=53.3, longitude=-1.8)
+
+    def setUp(self):
+        cache.clear()
+        self.first = self.client.get(self.url)
+
+    def test_repeat_is_served_from_cache(self):
+        self.assertEqual(self.first.status_code, 200)
+        with self.assertNumQueries(0):
+            repeat = self.client.get(self.url)
+        self.assertEqual(repeat['ETag'], self.first['ETag'])
+        self.assertEqual(repeat.json(), self.first.json())
+        self.assertNotEqual(self.client.get(self.url, {'page_size': 1})['ETag'], self.first['ETag'])
+
+    def test_if_none_match(self):
+        with self.assertNumQueries(0):
+            response = self.client.get(self.url, HTTP_IF_NONE_MATCH=self.first['ETag'])
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], self.first['ETag'])
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH='"other"').status_code, 200)
+
+    def test_if_modified_since(self):
+        with self.assertNumQueries(0):
+            response = self.client.get(self.url, HTTP_IF_MODIFIED_SINCE=self.first['Last-Modified'])
+        self.assertEqual(response.status_code, 304)
+
+    def test_bump_invalidates(self):
+        CarPark.objects.create(trail=self.trail, name='Car park 1', latitude=53.31, longitude=-1.79)
+        self.assertEqual(self.client.get(self.url).json()['count'], 1)  # Still the cached response
+
+        bump_data_version()
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=self.first['ETag'])
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], self.first['ETag'])
+        self.assertEqual(response.json()['count'], 2)
+
+
+@override_settings(CACHES=TEST_CACHES)
+class RatingAggregateTests(TestCase):
+    """Stored trail rating aggregates must match Review after every kind of review write"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('hiker', password='boots')
+        cls.first, cls.second = make_trail(0), make_trail(1)
+        Review.objects.create(trail=cls.first, user=cls.user, title='Old', content='Been before', rating=2)
+
+    def setUp(self):
+        self.client.force_login(self.user)
+
+    def assertAggregatesMatch(self):
+        for trail in Trail.objects.all():
+            fresh = Review.objects.filter(trail=trail).exclude(rating=None).aggregate(
+                avg=Avg('rating'), count=Count('id'),
+                **{str(value): Count('id', filter=Q(rating=value)) for value in RATING_VALUES},
+            )
+            with self.subTest(trail=trail.name):
+                self.assertEqual(trail.rating_count, fresh['count'])
+                if fresh['avg'] is None:
+                    self.assertIsNone(trail.rating_avg)
+                else:
+                    self.assertAlmostEqual(trail.rating_avg, fresh['avg'])
+                self.assertEqual(trail.rating_histogram, {str(value): fresh[str(value)] for value in RATING_VALUES})
+
+    def test_review_lifecycle(self):
+        response = self.client.post('/api/reviews/', {
+            'trail': self.first.id, 'title': 'Great', 'content': 'Clear views', 'rating': 5,
+        })
+        self.assertEqual(response.status_code, 201)
+        review = response.json()['id']
+        self.assertAggregatesMatch()
+
+        self.client.patch(f'/api/reviews/{review}/', {'rating': 3}, content_type='application/json')
+        self.assertAggregatesMatch()
+
+        self.client.patch(f'/api/reviews/{review}/', {'trail': self.second.id}, content_type='application/json')
+        self.assertEqual(Trail.objects.get(pk=self.second.pk).rating_count, 1)
+        self.assertAggregatesMatch()
+
+        self.client.patch(f'/api/reviews/{review}/', {'rating': None}, content_type='application/json')
+        self.assertAggregatesMatch()
+
+        self.client.delete(f'/api/reviews/{review}/')
+        self.assertFalse(Review.objects.filter(pk=review).exists())
+        self.assertAggregatesMatch()
+
+        data = self.client.get(f'/api/trails/{self.first.id}/').json()
+        self.assertEqual((data['rating_avg'], data['rating_count']), (2.0, 1))
+
+
+class ImportStateTests(SimpleTestCase):
+    """Incremental imports must delete exactly the rows a full import wouldn't produce"""
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+
+    def element(self, id, **tags):
+        return {'type': 'way', 'id': id, 'tags': tags}
+
+    def run_import(self, rows):
+        """rows: [(element, key)]; returns the keys the run would delete"""
+        state = ImportState('test', incremental=True, context='same', root=self.root)
+        for element, key in rows:
+            if not state.unchanged(element):
+                state.record(element, key)
+        removed = state.removed_keys()
+        state.save()
+        return removed
+
+    def test_rename_deletes_old_key(self):
+        self.run_import([(self.element(1, name='Old Name'), 'Old Name')])
+        self.assertEqual(self.run_import([(self.element(1, name='New Name'), 'New Name')]), ['Old Name'])
+
+    def test_relink_deletes_old_key(self):
+        self.run_import([(self.element(1, name='Car park'), ['Car park', 10])])
+        self.assertEqual(self.run_import([(self.element(1, name='Car park', v=2), ['Car park', 11])]), [['Car park', 10]])
+
+    def test_filtered_out_deletes_old_key(self):
+        self.run_import([(self.element(1, name='Stop'), ['Stop', 10, 'BUS'])])
+        self.assertEqual(self.run_import([(self.element(1, name='Stop', v=2), None)]), [['Stop', 10, 'BUS']])
+
+    def test_vanished_deletes_old_key(self):
+        self.run_import([(self.element(1, name='A'), 'A'), (self.element(2, name='B'), 'B')])
+        self.assertEqual(self.run_import([(self.element(1, name='A'), 'A')]), ['B'])
+
+    def test_key_still_produced_by_another_element_is_kept(self):
+        self.run_import([(self.element(1, name='A'), 'A'), (self.element(2, name='B'), 'B')])
+        self.assertEqual(self.run_import([(self.element(1, name='A', v=2), 'C'), (self.element(2, name='A'), 'A')]), ['B'])
+
+    def test_unchanged_run_deletes_nothing(self):
+        rows = [(self.element(1, name='A'), 'A')]
+        self.run_import(rows)
+        self.assertEqual(self.run_import(rows), [])
+
+    def test_emptied_table_is_not_skipped(self):
+        table = mock.Mock()
+        table.objects.aggregate.return_value = {'rows': 1, 'last': 1}
+        state = ImportState('test', incremental=True, model=table, root=self.root)
+        self.assertFalse(state.unchanged(self.element(1, name='A')))
+        state.record(self.element(1, name='A'), 'A')
+        state.save(['digest'])
+
+        # Same response, same table: the whole run is skipped
+        state = ImportState('test', incremental=True, model=table, root=self.root)
+        self.assertTrue(state.source_unchanged(['digest']))
+
+        # clear_* or a database reset emptied the table: nothing is skipped
+        table.objects.aggregate.return_value = {'rows': 0, 'last': None}
+        state = ImportState('test', incremental=True, model=table, root=self.root)
+        self.assertFalse(state.source_unchanged(['digest']))
+        self.assertFalse(state.unchanged(self.element(1, name='A')))
+
+
+class MalformedElementTests(SimpleTestCase):
+    """One broken Overpass element is skipped and counted; the rest still import"""
+
+    def setUp(self):
+        self.command = import_trails.Command(stdout=io.StringIO())
+        self.command.malformed = MalformedElements(log=self.command.stdout.write)
+
+    def way(self, id, points, **tags):
+        return {'type': 'way', 'id': id, 'tags': {'name': 'Edge Walk', **tags},
+                'geometry': [{'lat': lat, 'lon': lon} for lat, lon in points]}
+
+    def test_prepare_reports_bad_geometry(self):
+        good = self.way(1, [(53.30, -1.80), (53.32, -1.78), (53.34, -1.76)])
+        trail, profiles = self.command.prepare(good)
+        self.assertEqual(trail['name'], 'Edge Walk')
+
+        missing_lat = dict(good, geometry=[{'lon': -1.80}, {'lat': 53.32, 'lon': -1.78}])
+        not_numbers = dict(good, geometry=[{'lat': 'north', 'lon': -1.80}, {'lat': 53.32, 'lon': -1.78}])
+        no_type = {key: value for key, value in good.items() if key != 'type'}
+        for element in (missing_lat, not_numbers, no_type):
+            self.assertIsInstance(self.command.prepare(element), str)
+        self.assertIn('KeyError', self.command.prepare(missing_lat))
+
+    def test_candidates_skip_malformed(self):
+        state = ImportState('test', incremental=False, root=tempfile.mkdtemp())
+        elements = [
+            self.way(1, []),
+            {'type': 'way', 'id': 2, 'tags': None},
+            {'tags': {'name': 'No id'}},
+            {'type': 'way', 'id': 3, 'tags': ['not', 'a', 'dict']},
+            self.way(4, []),
+        ]
+        kept = list(self.command.changed_candidates(elements, state))
+        self.assertEqual([element.get('id') for element in kept], [1, 2, 4])
+        self.assertEqual(self.command.malformed.count, 2)
+        self.assertIn('Skipped malformed element without type/id', self.command.stdout.getvalue())
+
+
+@override_settings(CACHES=TEST_CACHES)
+class ClusterCacheTests(SimpleTestCase):
+    """Cluster requests read one precomputed zoom level, not the whole hierarchy"""
+
+    def hierarchy(self):
+        levels = {zoom: {(0, 0): [2, -3.6, 106.8, 1]} for zoom in range(clustering.MAX_CLUSTER_ZOOM + 1)}
+        levels[clustering.MAX_CLUSTER_ZOOM] = {(0, 0): [1, -1.8, 53.4, 1], (1, 0): [1, -1.8, 53.4, 2]}
+        return {'fields': ['type'], 'levels': {('BUS',): levels}}
+
+    def test_request_reads_only_its_level(self):
+        with mock.patch.object(clustering, 'build_clusters', return_value=self.hierarchy()) as build:
+            clustering.rebuild_clusters()
+            build.reset_mock()
+            with mock.patch.object(clustering.cache, 'get', wraps=clustering.cache.get) as get:
+                clusters = clustering.get_clusters('transport', 3, {'type': 'BUS'})
+        build.assert_not_called()
+        self.assertEqual(clusters, [{'latitude': 53.4, 'longitude': -1.8, 'count': 2}])
+        read = [call.args[0] for call in get.call_args_list if call.args[0].startswith('clusters_')]
+        self.assertEqual(len(read), 1)
+        self.assertTrue(read[0].endswith('_transport_3'))
+
+    def test_filters(self):
+        with mock.patch.object(clustering, 'build_clusters', return_value=self.hierarchy()):
+            clustering.rebuild_clusters()
+        self.assertEqual(clustering.get_clusters('transport', 20, {'type': 'TRAIN'}), [])
+        self.assertEqual(len(clustering.get_clusters('transport', 20)), 2)
+
+    def test_cold_cache_queues_one_rebuild(self):
+        cache.clear()
+        with mock.patch.object(clustering, 'build_clusters', return_value=self.hierarchy()) as build, \
+                mock.patch.object(clustering.threading, 'Thread') as thread:
+            for _ in range(2):
+                with self.assertRaises(clustering.ClustersNotReady):
+                    clustering.get_clusters('transport', 3)
+            build.assert_not_called()
+            thread.assert_called_once()
+
+            # What the thread runs: the levels are stored and the lock released
+            thread.call_args.kwargs['target']()
+        self.assertEqual(len(clustering.get_clusters('transport', 16)), 2)
+        self.assertIsNone(cache.get(clustering.REBUILD_LOCK_KEY))
+
+    def test_rebuild_drops_the_previous_version(self):
+        with mock.patch.object(clustering, 'build_clusters', return_value=self.hierarchy()):
+            clustering.rebuild_clusters()
+            previous = cache.get(clustering.CLUSTER_VERSION_KEY)
+            bump_data_version()
+            clustering.rebuild_clusters()
+        self.assertIsNone(cache.get(clustering._cache_key('transport', previous, 3)))
+        self.assertEqual(len(clustering.get_clusters('transport', 3)), 1)
+
+
+@override_settings(CACHES=TEST_CACHES)
+class DatasetExportTests(SimpleTestCase):
+    """Whole-table exports are throttled and answer conditional GETs without reading rows"""
+
+    def setUp(self):
+        cache.clear()
+        patcher = mock.patch('api_app.views.iter_export', return_value=iter([b'{}\n']))
+        self.iter_export = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_not_modified(self):
+        last_modified = self.client.get('/export/trails.ndjson')['Last-Modified']
+        self.iter_export.reset_mock()
+        response = self.client.get('/export/trails.ndjson', HTTP_IF_MODIFIED_SINCE=last_modified)
+        self.assertEqual(response.status_code, 304)
+        self.iter_export.assert_not_called()
+
+    def test_throttled(self):
+        limit = int(ScopedRateThrottle.THROTTLE_RATES['export'].split('/')[0])
+        for _ in range(limit):
+            self.assertEqual(self.client.get('/export/trails.geojson').status_code, 200)
+        self.assertEqual(self.client.get('/export/trails.geojson').status_code, 429)
+
+    def test_unknown_dataset(self):
+        self.assertEqual(self.client.get('/export/hotels.geojson').status_code, 404)
+        self.assertEqual(self.client.get('/export/trails.csv').status_code, 404)
+
+
+class IncludeFieldsetTests(SimpleTestCase):
+    """?include= must not bring back a relation that ?fields= / ?exclude= left out"""
+
+    def includes(self, **params):
+        view = TrailViewSet(action='list', format_kwarg=None)
+        view.request = Request(APIRequestFactory().get('/api/trails/', params))
+        return view.get_includes()
+
+    def test_include_within_fieldset(self):
+        self.assertEqual(self.includes(fields='id,car_parks', include='car_parks'), ['car_parks'])
+        self.assertEqual(self.includes(exclude='rating_histogram', include='car_parks'), ['car_parks'])
+        # reviews is only a field when included, so no fieldset can leave it out
+        self.assertEqual(self.includes(fields='id,name', include='reviews'), ['reviews'])
+
+    def test_include_outside_fieldset_is_rejected(self):
+        for params in [{'fields': 'id,name'}, {'exclude': 'car_parks'}]:
+            with self.subTest(params=params), self.assertRaises(ValidationError):
+                self.includes(include='car_parks', **params)
+
+
+class GeoTIFFDEMTests(SimpleTestCase):
+    """A batch spread over a large DEM reads one small window per block of points"""
+
+    def setUp(self):
+        # Each pixel holds column + 10000 * row, so bilinear sampling is exact
+        rows = cols = 1200
+        data = np.add.outer(10000 * np.arange(rows), np.arange(cols)).astype(np.float64)
+        self.name = '/vsimem/dem_test.tif'
+        self.source = GDALRaster({
+            'name': self.name, 'driver': 'GTiff', 'srid': 4326, 'width': cols, 'height': rows,
+            'origin': (-2.0, 54.0), 'scale': (0.001, -0.001), 'datatype': 7,
+            'bands': [{'data': data, 'nodata_value': -1}],
+        })
+        self.dem = elevation.GeoTIFFDEM(self.name)
+
+    def expected(self, lat, lon):
+        x, y = (lon + 2.0) / 0.001 - 0.5, (54.0 - lat) / 0.001 - 0.5
+        return x + 10000 * y
+
+    def test_far_apart_points_read_small_windows(self):
+        points = [(53.9, -1.9), (53.8995, -1.8995), (52.9, -0.9), (55.0, -1.0)]
+        with mock.patch.object(self.dem.band, 'data', wraps=self.dem.band.data) as read:
+            values = self.dem.sample(points)
+
+        for point, value in zip(points[:3], values):
+            self.assertAlmostEqual(value, self.expected(*point), places=3)
+        self.assertIsNone(values[3])  # North of the raster
+        self.assertEqual(read.call_count, 2)
+        for call in read.call_args_list:
+            width, height = call.kwargs['size']
+            self.assertLessEqual(max(width, height), elevation.DEM_WINDOW_PX + 2)
+
+
+def read_varint(data, pos=0):
+    """(value, next position) for the varint at data[pos]"""
+    value = shift = 0
+    while True:
+        byte = data[pos]
+        value |= (byte & 0x7F) << shift
+        pos += 1
+        shift += 7
+        if not byte & 0x80:
+            return value, pos
+
+
+def decode_geometry(commands):
+    """Absolute (x, y) parts of an MVT command stream; each MoveTo point starts a part"""
+    parts, x, y, i = [], 0, 0, 0
+    while i < len(commands):
+        command, count = commands[i] & 0x7, commands[i] >> 3
+        i += 1
+        for _ in range(count):
+            x += (commands[i] >> 1) ^ -(commands[i] & 1)
+            y += (commands[i + 1] >> 1) ^ -(commands[i + 1] & 1)
+            i += 2
+            if command == 1:
+                parts.append([])
+            parts[-1].append((x, y))
+    return parts
+
+
+class MVTEncodingTests(SimpleTestCase):
+    """The hand-written protobuf encoder must match the vector tile spec byte for byte"""
+
+    def test_varint_and_zigzag_round_trip(self):
+        for value in [0, 1, 127, 128, 300, 16383, 16384, 2 ** 31 - 1, 2 ** 40]:
+            self.assertEqual(read_varint(mvt._varint(value)), (value, len(mvt._varint(value))))
+        self.assertEqual(mvt._varint(300), bytes([0xAC, 0x02]))
+        for value in [0, -1, 1, -64, 64, 2 ** 31 - 1, -2 ** 31]:
+            encoded = mvt._zigzag(value)
+            self.assertGreaterEqual(encoded, 0)
+            self.assertEqual((encoded >> 1) ^ -(encoded & 1), value)
+        self.assertEqual([mvt._zigzag(v) for v in (0, -1, 1, -2)], [0, 1, 2, 3])
+
+    def test_spec_geometry_examples(self):
+        # Examples from section 4.3.5 of the 2.1 spec
+        self.assertEqual(mvt.point_geometry([(25, 17)]), [9, 50, 34])
+        self.assertEqual(mvt.point_geometry([(5, 7), (3, 2)]), [17, 10, 14, 3, 9])
+        self.assertEqual(mvt.line_geometry([[(2, 2), (2, 10), (10, 10)]]), [9, 4, 4, 18, 0, 16, 16, 0])
+        self.assertEqual(
+            mvt.line_geometry([[(2, 2), (2, 10), (10, 10)], [(1, 1), (3, 5)]]),
+            [9, 4, 4, 18, 0, 16, 16, 0, 9, 17, 17, 10, 4, 8],
+        )
+
+    def test_command_stream_round_trip(self):
+        points = [(0, 0), (4095, 4095), (-10, 20), (7, -3)]
+        self.assertEqual(decode_geometry(mvt.point_geometry(points)), [[point] for point in points])
+
+        lines = [[(10, 10), (10, 10), (20, 5), (4000, 4100)], [(3, 3), (3, 3)], [(-5, 9), (0, 0)]]
+        # Repeated points are dropped, and a line left with one point is skipped
+        self.assertEqual(
+            decode_geometry(mvt.line_geometry(lines)),
+            [[(10, 10), (20, 5), (4000, 4100)], [(-5, 9), (0, 0)]],
+        )
+
+    def test_known_tile(self):
+        layer = mvt.Layer('points')
+        layer.add_feature(mvt.POINT, mvt.point_geometry([(25, 17)]), {'name': 'A', 'skip': None}, feature_id=1)
+        feature = bytes.fromhex('0801' '12020000' '1801' '2203093222')
+        expected_layer = (
+            bytes.fromhex('7802')                                  # version 2
+            + bytes.fromhex('0a06') + b'points'                    # name
+            + bytes([0x12, len(feature)]) + feature                # feature
+            + bytes.fromhex('1a04') + b'name'                      # keys
+            + bytes.fromhex('22030a0141')                          # values: string 'A'
+            + bytes.fromhex('288020')                              # extent 4096
+        )
+        self.assertEqual(mvt.encode_tile([layer, mvt.Layer('empty')]), bytes([0x1A, len(expected_layer)]) + expected_layer)
+
+    def test_value_table_keeps_types_apart(self):
+        layer = mvt.Layer('values')
+        geometry = mvt.point_geometry([(1, 1)])
+        for value in (True, 1, 1.0, '1', 1):
+            layer.add_feature(mvt.POINT, geometry, {'v': value})
+        self.assertEqual(len(layer.keys), 1)
+        self.assertEqual(len(layer.values), 4)
+        self.assertEqual(mvt._encode_value(-1), bytes([0x30, 0x01]))           # sint_value, zigzagged
+        self.assertEqual(mvt._encode_value(True), bytes([0x38, 0x01]))         # bool_value
+        self.assertEqual(mvt._encode_value(0.5), b'\x19' + struct.pack('<d', 0.5))  # double_value
+
+
+def open_meteo(url, params, timeout):
+    """Stands in for requests.get: each location's temperature is its latitude"""
+    response = mock.Mock()
+    response.json.return_value = [
+        {'current_weather': {'temperature': float(lat), 'windspeed': 5}} for lat in params['latitude'].split(',')
+    ]
+    return response
+
+
+@override_settings(CACHES=TEST_CACHES)
+class WeatherTests(SimpleTestCase):
+    """The request path only reads the cache; refresh_cells keeps it warm"""
+
+    here = SimpleNamespace(latitude=53.345, longitude=-1.805)
+    there = SimpleNamespace(latitude=53.455, longitude=-1.705)
+
+    def setUp(self):
+        cache.clear()
+        self.cells = [weather.grid_cell(t.latitude, t.longitude) for t in (self.here, self.there)]
+        for target, attribute, new in [
+            (weather.requests, 'get', mock.Mock(side_effect=open_meteo)),
+            (weather, 'lookup_counters', weather.LookupCounters(weather.METRICS_FLUSH_INTERVAL)),
+        ]:
+            patcher = mock.patch.object(target, attribute, new)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.get = weather.requests.get
+
+    def resolve(self, *trails):
+        provider = weather.WeatherProvider()
+        provider.prime(trails)
+        return [provider.get(trail) for trail in trails]
+
+    def test_fresh_and_stale_hits(self):
+        now = time.time()
+        weather.store_cells({self.cells[0]: {'temperature': 12}}, now - 60)
+        weather.store_cells({self.cells[1]: {'temperature': 9}}, now - weather.CACHE_TTL - 60)
+        fresh, stale = self.resolve(self.here, self.there)
+        self.assertEqual((fresh['temperature'], fresh['stale']), (12, False))
+        self.assertEqual((stale['temperature'], stale['stale']), (9, True))
+        self.assertGreater(stale['age_seconds'], weather.CACHE_TTL)
+        self.get.assert_not_called()
+
+    def test_miss_is_null_without_fetching(self):
+        weather.store_failures([self.cells[1]], {})
+        self.assertEqual(self.resolve(self.here, self.there), [None, None])
+        self.get.assert_not_called()
+        metrics = weather.get_metrics()
+        self.assertEqual((metrics['miss'], metrics['failed'], metrics['hit_ratio']), (1, 1, 0))
+
+    def test_lookups_are_counted_without_writes_per_request(self):
+        weather.store_cells({self.cells[0]: {'temperature': 12}})
+        with mock.patch.object(weather, 'lookup_counters', weather.LookupCounters(flush_interval=3600)):
+            with mock.patch.object(weather.cache, 'incr') as incr:
+                for _ in range(5):
+                    self.resolve(self.here, self.there)
+            incr.assert_not_called()
+            metrics = weather.get_metrics()
+        self.assertEqual((metrics['fresh'], metrics['miss'], metrics['lookups']), (5, 5, 10))
+
+    def test_request_budget(self):
+        weather.store_cells({self.cells[0]: {'temperature': 12}})
+        provider = weather.WeatherProvider(budget=0)
+        provider.prime([self.here, self.there])
+        self.assertEqual([provider.get(self.here), provider.get(self.there)], [None, None])
+        self.assertEqual(weather.get_metrics()['over_budget'], 2)
+
+    def test_refresh_skipped_while_breaker_open(self):
+        for _ in range(weather.FAILURE_THRESHOLD):
+            weather.breaker.record_failure()
+        report = weather.refresh_cells(self.cells)
+        self.assertEqual((report['skipped'], report['due'], report['failed']), (True, 2, 0))
+        self.get.assert_not_called()
+        self.assertEqual(self.resolve(self.here, self.there), [None, None])
+
+    def test_refresh_cells(self):
+        latitudes = [weather.cell_centre(cell)[0] for cell in self.cells]
+        report = weather.refresh_cells(self.cells)
+        self.assertEqual((report['due'], report['refreshed'], report['failed']), (2, 2, 0))
+        self.assertEqual([w['temperature'] for w in self.resolve(self.here, self.there)], latitudes)
+        self.assertEqual(self.get.call_count, 1)  # One multi-location request
+
+        # Fresh cells aren't due again; forced ones are, and a failure keeps the old reading
+        self.assertEqual(weather.refresh_cells(self.cells)['due'], 0)
+        self.get.side_effect = requests.ConnectionError
+        report = weather.refresh_cells(self.cells, force=True)
+        self.assertEqual((report['due'], report['refreshed'], report['failed']), (2, 0, 2))
+        self.assertEqual([w['temperature'] for w in self.resolve(self.here, self.there)], latitudes)
+
+
+@override_settings(CACHES=TEST_CACHES)
+class CircuitBreakerTests(SimpleTestCase):
+    """Trips after repeated failures, cools down, then lets exactly one probe through"""
+
+    def setUp(self):
+        cache.clear()
+        self.now = 1000.0
+        clock = SimpleNamespace(time=lambda: self.now, monotonic=time.monotonic)
+        patcher = mock.patch.object(weather, 'time', clock)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.breaker = weather.CircuitBreaker('test', failure_threshold=3, cooldown=120)
+
+    def trip(self):
+        for _ in range(3):
+            self.breaker.record_failure()
+
+    def test_trips_at_threshold(self):
+        self.breaker.record_failure()
+        self.breaker.record_failure()
+        self.assertEqual(self.breaker.status(), {'state': 'closed', 'failures': 2})
+        self.assertTrue(self.breaker.allow())
+        self.breaker.record_failure()
+        self.assertEqual(self.breaker.status()['state'], 'open')
+        self.assertFalse(self.breaker.allow())
+        self.assertTrue(self.breaker.blocked())
+
+    def test_success_resets_the_count(self):
+        self.breaker.record_failure()
+        self.breaker.record_failure()
+        self.breaker.record_success()
+        self.breaker.record_failure()
+        self.assertEqual(self.breaker.status(), {'state': 'closed', 'failures': 1})
+
+    def test_cooldown_and_half_open_probe(self):
+        self.trip()
+        self.now += 119
+        self.assertFalse(self.breaker.allow())
+        self.now += 1
+        self.assertEqual(self.breaker.status()['state'], 'half-open')
+        self.assertFalse(self.breaker.blocked())
+        self.assertTrue(self.breaker.allow())   # The probe
+        self.assertFalse(self.breaker.allow())  # Everyone else waits for it
+
+        # A failed probe re-opens for a full cool-down, then hands out a new token
+        self.breaker.record_failure()
+        self.assertEqual(self.breaker.status()['state'], 'open')
+        self.now += 120
+        self.assertTrue(self.breaker.allow())
+        self.breaker.record_success()
+        self.assertEqual(self.breaker.status(), {'state': 'closed', 'failures': 0})
+        self.assertTrue(self.breaker.allow())
+        self.assertTrue(self.breaker.allow())
+
+    def test_concurrent_failures_are_all_counted(self):
+        breaker = weather.CircuitBreaker('busy', failure_threshold=100, cooldown=120)
+        threads = [threading.Thread(target=breaker.record_failure) for _ in range(20)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(breaker.status(), {'state': 'closed', 'failures': 20})
+
+
+class SQLiteCacheTests(SimpleTestCase):
+    """The shared file cache: LRU eviction, expiry, atomic add/incr across workers, stats"""
+
+    def setUp(self):
+        self.path = os.path.join(tempfile.mkdtemp(), 'cache.sqlite3')
+        self.now = time.time()
+        clock = SimpleNamespace(time=lambda: self.now, monotonic=time.monotonic)
+        patcher = mock.patch.object(sqlitecache, 'time', clock)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.cache = self.open()
+
+    def open(self, **options):
+        """Another handle on the same file, like a second worker process"""
+        return sqlitecache.SQLiteCache(self.path, {'OPTIONS': {'MAX_ENTRIES': 10, 'CULL_FREQUENCY': 5, **options}})
+
+    def test_lru_eviction(self):
+        for i in range(10):
+            self.cache.set(f'k{i}', i)
+            self.now += 1
+        self.now += sqlitecache.ACCESS_RESOLUTION
+        self.assertEqual(self.cache.get_many(['k0', 'k1']), {'k0': 0, 'k1': 1})
+        self.cache.set('k10', 10)  # 11 entries: evicts 1 + 10 // 5, least recently read first
+        remaining = [key for key in (f'k{i}' for i in range(11)) if self.cache.has_key(key)]
+        self.assertEqual(remaining, ['k0', 'k1', 'k5', 'k6', 'k7', 'k8', 'k9', 'k10'])
+        self.assertEqual(self.cache.stats()['evictions'], 3)
+
+    def test_expired_entries_are_gone(self):
+        self.cache.set('short', 1, timeout=5)
+        self.cache.set('forever', 1, timeout=None)
+        self.now += 6
+        self.assertIsNone(self.cache.get('short'))
+        self.assertFalse(self.cache.has_key('short'))
+        self.assertFalse(self.cache.touch('short'))
+        with self.assertRaises(ValueError):
+            self.cache.incr('short')
+        self.assertTrue(self.cache.add('short', 2))  # An expired entry doesn't block add()
+        self.assertEqual(self.cache.get('forever'), 1)
+
+    def test_incr_and_add_are_atomic_across_workers(self):
+        self.cache.set('counter', 0, timeout=None)
+        won = []
+
+        def work():
+            worker = self.open()
+            won.append(worker.add('token', os.getpid()))
+            for _ in range(25):
+                worker.incr('counter')
+
+        threads = [threading.Thread(target=work) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(self.cache.get('counter'), 200)
+        self.assertEqual(won.count(True), 1)
+
+    def test_stats_are_shared(self):
+        other = self.open()
+        self.cache.set('a', 'x' * 100)
+        self.cache.get('a')
+        other.get('a')
+        other.get_many(['a', 'missing'])
+        stats = self.cache.stats()  # Flushes this handle; the other's counts are still buffered
+        self.assertEqual((stats['hits'], stats['misses']), (1, 0))
+        other.flush_stats()
+        stats = self.cache.stats()
+        self.assertEqual((stats['hits'], stats['misses'], stats['hit_ratio']), (3, 1, 0.75))
+        self.assertEqual(stats['entries'], 1)
+        self.assertGreater(stats['size_bytes'], 100)
+
+    def test_cache_stats_command(self):
+        backend = {'default': {'BACKEND': 'api_app.sqlitecache.SQLiteCache', 'LOCATION': self.path}}
+        with override_settings(CACHES=backend):
+            caches['default'].set('a', 1)
+            caches['default'].get('a')
+            caches['default'].get('b')
+            out = io.StringIO()
+            call_command('cache_stats', '--reset', stdout=out)
+            self.assertIn('Hit ratio:  50.0%', out.getvalue())
+            self.assertEqual(caches['default'].stats()['hits'], 0)
+
+    def test_redis_url_switches_backend(self):
+        from myproject import settings
+        self.addCleanup(importlib.reload, settings)
+        with mock.patch.dict(os.environ, {'REDIS_URL': 'redis://127.0.0.1:6379/1'}):
+            default = importlib.reload(settings).CACHES['default']
+        self.assertEqual(default['BACKEND'], 'django.core.cache.backends.redis.RedisCache')
+        self.assertEqual(default['LOCATION'], 'redis://127.0.0.1:6379/1')
+
+        with mock.patch.dict(os.environ):
+            os.environ.pop('REDIS_URL', None)
+            default = importlib.reload(settings).CACHES['default']
+        self.assertEqual(default['BACKEND'], 'api_app.sqlitecache.SQLiteCache')
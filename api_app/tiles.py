@@ -0,0 +1,136 @@
+from math import atan, degrees, pi, sinh
+
+import numpy as np
+from django.contrib.gis.geos import LineString, MultiLineString, Polygon
+from django.core.cache import cache
+
+from .dataversion import get_data_version
+from .geoqueries import in_bbox
+from .lod import DETAIL_FIELDS, detail_for_zoom
+from .models import Trail, CarPark, TransportLink
+from .mvt import Layer, LINESTRING, POINT, encode_tile, line_geometry, point_geometry
+
+# --- CONFIGURATION ---
+EXTENT = 4096               # Tile coordinate space (MVT default)
+BUFFER = 64                 # Tile units kept outside each edge so lines join up across tiles
+MAX_ZOOM = 20
+POINT_MIN_ZOOM = 12         # Car parks and stops only appear once zoomed in
+TILE_CACHE_TTL = 60 * 60 * 24
+# Shortest trail (km) drawn at each zoom: (up to zoom, min length)
+TRAIL_MIN_LENGTH = [(7, 20.0), (9, 8.0), (11, 3.0)]
+
+
+def valid_tile(z, x, y):
+    return 0 <= z <= MAX_ZOOM and 0 <= x < 2 ** z and 0 <= y < 2 ** z
+
+
+def tile_lonlat(z, tx, ty):
+    """(lon, lat) of a (fractional) tile coordinate in Web Mercator tiling"""
+    n = 2 ** z
+    lon = tx / n * 360.0 - 180.0
+    lat = degrees(atan(sinh(pi * (1 - 2 * ty / n))))
+    return lon, lat
+
+
+def tile_bounds(z, x, y, buffer=0):
+    """(west, south, east, north) of a tile, grown by buffer tile units on every side"""
+    pad = buffer / EXTENT
+    west, north = tile_lonlat(z, x - pad, y - pad)
+    east, south = tile_lonlat(z, x + 1 + pad, y + 1 + pad)
+    return west, south, east, north
+
+
+def project(z, x, y, lons, lats):
+    """Lon/lat arrays -> integer tile coordinates (origin top-left, EXTENT units)"""
+    n = 2 ** z
+    lons = np.asarray(lons, dtype=float)
+    lats = np.radians(np.asarray(lats, dtype=float))
+    px = ((lons + 180.0) / 360.0 * n - x) * EXTENT
+    py = ((1 - np.log(np.tan(lats) + 1 / np.cos(lats)) / pi) / 2 * n - y) * EXTENT
+    return np.rint(px).astype(int), np.rint(py).astype(int)
+
+
+def min_trail_length(z):
+    for max_zoom, length in TRAIL_MIN_LENGTH:
+        if z <= max_zoom:
+            return length
+    return 0.0
+
+
+def _lines(geom):
+    """LineStrings out of whatever a clip returned"""
+    if isinstance(geom, LineString):
+        return [geom]
+    if isinstance(geom, MultiLineString) or geom.geom_type == 'GeometryCollection':
+        return [part for g in geom for part in _lines(g)]
+    return []
+
+
+def trail_layer(z, x, y, clip):
+    """
+    Trails as lines.
+    - short trails are dropped at low zoom (TRAIL_MIN_LENGTH)
+    - the path level of detail follows the zoom, like ?zoom= on the API
+    - candidates come from that path column's spatial index, and their
+      geometry is clipped to the buffered tile before projecting
+    """
+    layer = Layer('trails', EXTENT)
+    field = DETAIL_FIELDS[detail_for_zoom(z)]
+    trails = (
+        in_bbox(Trail.objects.filter(length__gte=min_trail_length(z)), clip.extent, field)
+        .only('id', 'name', 'difficulty', 'length', field)
+    )
+    for trail in trails.iterator(chunk_size=200):
+        geom = getattr(trail, field)
+        if geom is None:
+            continue
+        lines = []
+        for line in _lines(geom.intersection(clip)):
+            coords = np.asarray(line.coords)
+            px, py = project(z, x, y, coords[:, 0], coords[:, 1])
+            lines.append(list(zip(px.tolist(), py.tolist())))
+        layer.add_feature(LINESTRING, line_geometry(lines), {
+            'name': trail.name,
+            'difficulty': trail.difficulty,
+            'length': float(trail.length),
+        }, feature_id=trail.id)
+    return layer
+
+
+def point_layer(name, queryset, z, x, y, bounds, fields):
+    """Points in the buffered tile, found through the spatial index on location"""
+    layer = Layer(name, EXTENT)
+    rows = in_bbox(queryset, bounds).values('id', 'latitude', 'longitude', *fields)
+    for row in rows.iterator(chunk_size=500):
+        px, py = project(z, x, y, [row['longitude']], [row['latitude']])
+        properties = {field: row[field] for field in fields}
+        layer.add_feature(POINT, point_geometry([(int(px[0]), int(py[0]))]), properties, feature_id=row['id'])
+    return layer
+
+
+def build_tile(z, x, y):
+    bounds = tile_bounds(z, x, y, BUFFER)
+    clip = Polygon.from_bbox(bounds)
+    clip.srid = 4326
+
+    layers = [trail_layer(z, x, y, clip)]
+    if z >= POINT_MIN_ZOOM:
+        layers.append(point_layer('car_parks', CarPark.objects.all(), z, x, y, bounds,
+                                  ['name', 'is_free', 'capacity', 'has_disabled_parking']))
+        layers.append(point_layer('transport_links', TransportLink.objects.all(), z, x, y, bounds,
+                                  ['name', 'type']))
+    return encode_tile(layers)
+
+
+def get_tile(z, x, y):
+    """
+    Encoded tile bytes, cached per data version.
+    The import and clear commands bump the version, so tiles from before
+    an import are never served again.
+    """
+    key = f"tile_{get_data_version()['version']}_{z}_{x}_{y}"
+    tile = cache.get(key)
+    if tile is None:
+        tile = build_tile(z, x, y)
+        cache.set(key, tile, TILE_CACHE_TTL)
+    return tile
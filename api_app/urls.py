@@ -5,7 +5,9 @@ from .views import (
     ReviewViewSet, 
     TransportViewSet, 
     CarParkViewSet,
-    TrailLogBookViewSet
+    TrailLogBookViewSet,
+    vector_tile,
+    DatasetExport,
 )
 
 # Create a router and register our viewsets with it.
@@ -23,4 +25,6 @@ urlpatterns = [
     # Include the router URLs
     path('api/', include(router.urls)),
     path('mcp/', include('djangorestframework_mcp.urls')),
+    path('export/<str:dataset>.<str:fmt>', DatasetExport.as_view(), name='export'), # http://127.0.0.1:8000/export/trails.geojson
+    path('tiles/<int:z>/<int:x>/<int:y>.mvt', vector_tile, name='vector-tile'), # http://127.0.0.1:8000/tiles/12/2030/1318.mvt
 ]
\ No newline at end of file
@@ -1,11 +1,29 @@
 from django.shortcuts import render, get_object_or_404
-from rest_framework.decorators import api_view
+from django.http import HttpResponse, HttpResponseNotModified, Http404, StreamingHttpResponse
+from django.utils.http import http_date, parse_http_date_safe
+from django.views.decorators.http import require_GET
+from rest_framework.decorators import api_view, action
+from rest_framework.exceptions import ValidationError
 from rest_framework.response import Response
-from rest_framework import viewsets, permissions, filters, generics
+from rest_framework.throttling import ScopedRateThrottle
+from rest_framework.views import APIView
+from rest_framework import viewsets, permissions, filters, generics, status
+from django.db import transaction
 from django_filters.rest_framework import DjangoFilterBackend
 from djangorestframework_mcp.decorators import mcp_viewset
 
 from .models import Trail, Review, TransportLink, CarPark, TrailLogBook
+from .lod import detail_from_request, unused_path_fields
+from .tiles import get_tile, valid_tile
+from .dataversion import bump_data_version, get_data_version
+from .export import FORMATS, iter_export, resolve_datasets
+from .geoqueries import nearby
+from .filters import InBBoxFilter, FullTextSearchFilter
+from .clustering import get_clusters, ClustersNotReady, MAX_CLUSTER_ZOOM, REBUILD_RETRY_AFTER
+from .ratings import apply_rating_change
+from .responsecache import CachedResponseMixin
+from .fieldsets import SparseFieldsetMixin
+from .includes import IncludeMixin
 
 from .serializers import (
     TrailSerializer,
@@ -29,6 +47,59 @@ class TrailDetail(generics.RetrieveUpdateDestroyAPIView):
     queryset = Trail.objects.all()
     serializer_class = TrailSerializer
 
+# 3. Vector tiles (GET /tiles/{z}/{x}/{y}.mvt)
+@require_GET
+def vector_tile(request, z, x, y):
+    """
+    Mapbox Vector Tile with 'trails', 'car_parks' and 'transport_links' layers.
+    A plain Django view: the body is binary protobuf, not DRF JSON.
+    """
+    if not valid_tile(z, x, y):
+        raise Http404("Tile out of range")
+
+    response = HttpResponse(get_tile(z, x, y), content_type='application/vnd.mapbox-vector-tile')
+    response['Last-Modified'] = http_date(get_data_version()['changed_at'])
+    response['Cache-Control'] = 'public, max-age=300'
+    response['Access-Control-Allow-Origin'] = '*'
+    return response
+
+# 4. Bulk export (GET /export/{trails|carparks|transport|all}.{geojson|ndjson})
+class DatasetExport(APIView):
+    """
+    Streams a whole table as a GeoJSON FeatureCollection or newline-delimited
+    GeoJSON. Rows are read in chunks and written as they go, so memory use
+    stays flat however big the table is.
+    Each export reads every row, so it is throttled per client under the
+    'export' rate, and If-Modified-Since is answered with 304 from the data
+    version alone.
+    """
+    permission_classes = [permissions.AllowAny]
+    throttle_classes = [ScopedRateThrottle]
+    throttle_scope = 'export'
+
+    def perform_content_negotiation(self, request, force=False):
+        # The body is GeoJSON whatever the Accept header asks for
+        return super().perform_content_negotiation(request, force=True)
+
+    def get(self, request, dataset, fmt):
+        try:
+            datasets = resolve_datasets(dataset)
+        except KeyError:
+            raise Http404("Unknown dataset")
+        if fmt not in FORMATS:
+            raise Http404("Unknown format")
+
+        changed_at = int(get_data_version()['changed_at'])
+        since = parse_http_date_safe(request.headers.get('If-Modified-Since', ''))
+        if since is not None and changed_at <= since:
+            response = HttpResponseNotModified()
+        else:
+            response = StreamingHttpResponse(iter_export(datasets, fmt), content_type=FORMATS[fmt])
+            response['Content-Disposition'] = f'attachment; filename="{dataset}.{fmt}"'
+        response['Last-Modified'] = http_date(changed_at)
+        response['Cache-Control'] = 'public, max-age=300'
+        return response
+
 # --- CUSTOM PERMISSIONS ---
 
 class IsOwnerOrReadOnly(permissions.BasePermission):
@@ -49,30 +120,161 @@ class IsOwnerOrReadOnly(permissions.BasePermission):
         return obj.user == request.user
 
 
+# --- MIXINS ---
+
+def query_number(request, name, cast, default=None, low=None, high=None):
+    """A numeric query parameter, checked against [low, high]; required if there is no default"""
+    raw = request.query_params.get(name)
+    if raw in (None, ''):
+        if default is None:
+            raise ValidationError({name: "This parameter is required."})
+        return default
+    try:
+        value = cast(raw)
+    except ValueError:
+        raise ValidationError({name: "Must be a number."})
+    if (low is not None and value < low) or (high is not None and value > high):
+        raise ValidationError({name: f"Must be between {low} and {high}."})
+    return value
+
+
+class NearbyMixin:
+    """
+    Adds GET .../nearby/?lat=&lon=&radius=&limit= to a viewset.
+    - radius in km (default 5, max 50), limit default 20 (max 100)
+    - answered through the spatial index on `location`, nearest first
+    - each result gets a distance_km field
+    """
+    NEARBY_DEFAULT_RADIUS = 5.0
+    NEARBY_MAX_RADIUS = 50.0
+    NEARBY_DEFAULT_LIMIT = 20
+    NEARBY_MAX_LIMIT = 100
+
+    @action(detail=False, methods=['get'])
+    def nearby(self, request):
+        lat = query_number(request, 'lat', float, low=-90, high=90)
+        lon = query_number(request, 'lon', float, low=-180, high=180)
+        radius = query_number(request, 'radius', float, self.NEARBY_DEFAULT_RADIUS, 0, self.NEARBY_MAX_RADIUS)
+        limit = query_number(request, 'limit', int, self.NEARBY_DEFAULT_LIMIT, 1, self.NEARBY_MAX_LIMIT)
+
+        queryset = self.filter_queryset(self.get_queryset())
+        results = nearby(queryset, lat, lon, radius, limit)
+
+        serializer = self.get_serializer([obj for obj, _ in results], many=True)
+        data = serializer.data
+        for row, (_, dist) in zip(data, results):
+            row['distance_km'] = round(dist, 3)
+        return Response(data)
+
+
+class ClusterMixin:
+    """
+    Adds GET .../clusters/?zoom= to a viewset: grid clusters of its points,
+    each with a count and centroid (plus id when it holds a single row).
+    - cluster_dataset: key in api_app.clustering.DATASETS
+    - cluster_filters: query params usable as filters, e.g. ?is_free=true
+    - ?in_bbox=minx,miny,maxx,maxy keeps only clusters in the viewport
+    Clusters come from a hierarchy precomputed after each import. If it
+    isn't cached, a rebuild is queued and the response is a 503.
+    """
+    cluster_dataset = None
+    cluster_filters = []
+
+    def _filter_value(self, name, raw):
+        if name in ('is_free', 'has_disabled_parking'):
+            values = {'true': True, '1': True, 'false': False, '0': False, 'null': None, 'unknown': None}
+            if raw.lower() not in values:
+                raise ValidationError({name: "Must be true, false or null."})
+            return values[raw.lower()]
+        return raw
+
+    @action(detail=False, methods=['get'])
+    def clusters(self, request):
+        zoom = query_number(request, 'zoom', int, low=0, high=22)
+        filters = {
+            name: self._filter_value(name, request.query_params[name])
+            for name in self.cluster_filters if name in request.query_params
+        }
+        bbox = InBBoxFilter().get_bbox(request)
+
+        try:
+            clusters = get_clusters(self.cluster_dataset, zoom, filters, bbox)
+        except ClustersNotReady:
+            return Response(
+                {'detail': "Clusters are being rebuilt. Try again shortly."},
+                status=status.HTTP_503_SERVICE_UNAVAILABLE,
+                headers={'Retry-After': str(REBUILD_RETRY_AFTER)},
+            )
+        return Response({
+            'zoom': min(zoom, MAX_CLUSTER_ZOOM),
+            'count': sum(cluster['count'] for cluster in clusters),
+            'clusters': clusters,
+        })
+
+
 # --- VIEWSETS ---
 @mcp_viewset()
-class TrailViewSet(viewsets.ReadOnlyModelViewSet):
+class TrailViewSet(CachedResponseMixin, IncludeMixin, SparseFieldsetMixin, NearbyMixin, viewsets.ReadOnlyModelViewSet):
     """
     API endpoint that allows trails to be viewed or searched.
     - GET /api/trails/: List all trails
     - GET /api/trails/{id}/: Retrieve specific trail
+    - GET /api/trails/nearby/?lat=&lon=&radius=&limit=: Closest trails first
+    - ?in_bbox=minx,miny,maxx,maxy: Only trails crossing the map viewport
+    - ?ordering=-rating_avg / ?rating_avg__gte=4: Sort or filter by stored rating aggregates
+    - ?detail=low|medium|full or ?zoom=<map zoom> picks the path resolution
+      (lists default to low, a single trail to medium)
+    - list/retrieve are cached and support ETag / conditional GET
+    - lists are paged with ?cursor= (default order: id)
+    - ?fields=name,difficulty / ?exclude=path return and load only those fields
+    - ?include=reviews,car_parks,transport_links embeds the related objects
+      (lists send them once each in a top-level 'included' section)
     """
     queryset = Trail.objects.all()
     serializer_class = TrailSerializer
     permission_classes = [permissions.AllowAny] # Open to everyone
 
+    # Trails embed ratings and weather, so those versions are part of the key.
+    # Weather ages are computed per request, so entries live one refresh cycle.
+    cache_scopes = ('data', 'reviews', 'weather')
+    cache_timeout = 300
+
     # Enable search and filtering
-    filter_backends = [filters.SearchFilter, DjangoFilterBackend]
-    search_fields = ['name', 'region']      # Search by name (e.g., ?search=Mam Tor)
-    filterset_fields = ['region', 'difficulty'] # Filter (e.g., ?difficulty=Easy)
+    filter_backends = [FullTextSearchFilter, DjangoFilterBackend, InBBoxFilter, filters.OrderingFilter]
+    search_fields = ['name', 'region']      # Search by name, ranked, prefixes match (e.g., ?search=Mam To)
+    filterset_fields = {                    # Filter (e.g., ?difficulty=Easy&rating_avg__gte=4)
+        'region': ['exact'],
+        'difficulty': ['exact'],
+        'rating_avg': ['gte', 'lte'],
+        'rating_count': ['gte'],
+    }
+    ordering_fields = ['name', 'length', 'elevation_gain', 'popularity', 'rating_avg', 'rating_count'] # (e.g., ?ordering=-rating_avg)
+    bbox_filter_field = 'path'              # Viewport (e.g., ?in_bbox=-1.9,53.3,-1.7,53.4)
+    bbox_filter_envelope = 'bbox'
+
+    def get_path_detail(self):
+        if not hasattr(self, '_path_detail'):
+            default = 'low' if self.action in ('list', 'nearby') else 'medium'
+            self._path_detail = detail_from_request(self.request, default)
+        return self._path_detail
+
+    def get_queryset(self):
+        # Only load the one path column this response will use
+        return super().get_queryset().defer(*unused_path_fields(self.get_path_detail()))
+
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        context['path_detail'] = self.get_path_detail()
+        return context
 
 @mcp_viewset()
-class ReviewViewSet(viewsets.ModelViewSet):
+class ReviewViewSet(SparseFieldsetMixin, viewsets.ModelViewSet):
     """
     API endpoint for User Reviews.
     - POST: Create a review (Auth required)
     - PUT/PATCH: Update a review (Owner only)
     - DELETE: Delete a review (Owner only)
+    - lists are paged with ?cursor=, newest first by default
     """
     queryset = Review.objects.all()
     serializer_class = ReviewSerializer
@@ -83,48 +285,86 @@ class ReviewViewSet(viewsets.ModelViewSet):
     # Filtering: Get reviews for a specific trail
     filter_backends = [DjangoFilterBackend, filters.OrderingFilter]
     filterset_fields = ['trail', 'rating']  # Usage: /api/reviews/?trail=5
-    ordering_fields = ['created_at', 'rating'] # Usage: /api/reviews/?ordering=-rating
+    ordering_fields = ['created_on', 'rating'] # Usage: /api/reviews/?ordering=-rating
+    keyset_ordering = ['-created_on']          # Page order without ?ordering=
+
+    # Each write also moves the trail's stored rating aggregates, in the same transaction,
+    # and once committed invalidates cached trail responses (aggregates, ?include=reviews)
 
+    def reviews_changed(self):
+        transaction.on_commit(lambda: bump_data_version('reviews'))
+
+    @transaction.atomic
     def perform_create(self, serializer):
         # Automatically attach the logged-in user as the author
-        serializer.save(user=self.request.user)
+        review = serializer.save(user=self.request.user)
+        apply_rating_change(review.trail_id, new=review.rating)
+        self.reviews_changed()
+
+    @transaction.atomic
+    def perform_update(self, serializer):
+        old_trail, old_rating = serializer.instance.trail_id, serializer.instance.rating
+        review = serializer.save()
+        if review.trail_id == old_trail:
+            apply_rating_change(old_trail, old=old_rating, new=review.rating)
+        else:
+            apply_rating_change(old_trail, old=old_rating)
+            apply_rating_change(review.trail_id, new=review.rating)
+        self.reviews_changed()
+
+    @transaction.atomic
+    def perform_destroy(self, instance):
+        apply_rating_change(instance.trail_id, old=instance.rating)
+        instance.delete()
+        self.reviews_changed()
 
 @mcp_viewset()
-class TransportViewSet(viewsets.ReadOnlyModelViewSet):
+class TransportViewSet(CachedResponseMixin, SparseFieldsetMixin, NearbyMixin, ClusterMixin, viewsets.ReadOnlyModelViewSet):
     """
     API endpoint for Public Transport links (Bus/Train).
     Read-only reference data.
+    - GET /api/transport/nearby/?lat=&lon=&radius=&limit=: Closest stops first
+    - GET /api/transport/clusters/?zoom=&type=: Stops grouped for a map zoom level
     """
     queryset = TransportLink.objects.all()
     serializer_class = TransportSerializer
     permission_classes = [permissions.AllowAny]
 
-    filter_backends = [DjangoFilterBackend]
+    filter_backends = [DjangoFilterBackend, InBBoxFilter]
     filterset_fields = ['trail', 'type'] # Usage: /api/transport/?type=Train
+    cluster_dataset = 'transport'
+    cluster_filters = ['type']
 
 @mcp_viewset()
-class CarParkViewSet(viewsets.ReadOnlyModelViewSet):
+class CarParkViewSet(CachedResponseMixin, SparseFieldsetMixin, NearbyMixin, ClusterMixin, viewsets.ReadOnlyModelViewSet):
     """
     API endpoint for Car Parks.
     Read-only reference data.
+    - GET /api/carparks/nearby/?lat=&lon=&radius=&limit=: Closest car parks first
+    - GET /api/carparks/clusters/?zoom=&is_free=&has_disabled_parking=: Car parks grouped for a map zoom level
     """
     queryset = CarPark.objects.all()
     serializer_class = CarParkSerializer
     permission_classes = [permissions.AllowAny]
 
-    filter_backends = [DjangoFilterBackend]
+    filter_backends = [DjangoFilterBackend, InBBoxFilter]
     filterset_fields = ['trail', 'is_free', 'has_disabled_parking'] # Usage: /api/carparks/?is_free=true
+    cluster_dataset = 'carparks'
+    cluster_filters = ['is_free', 'has_disabled_parking']
 
-class TrailLogBookViewSet(viewsets.ModelViewSet):
+class TrailLogBookViewSet(SparseFieldsetMixin, viewsets.ModelViewSet):
     serializer_class = TrailLogBookSerializer
     permission_classes = [permissions.IsAuthenticated]
+    keyset_ordering = ['-id']   # Most recently logged first
+
+    queryset = TrailLogBook.objects.all()
 
     def get_queryset(self):
         """
         This view should return a list of all the hiking logs
         for the currently authenticated user.
         """
-        return TrailLogBook.objects.filter(user=self.request.user)
+        return super().get_queryset().filter(user=self.request.user)
 
     def perform_create(self, serializer):
         """
@@ -0,0 +1,423 @@
+import threading
+import time
+import requests
+from math import floor
+from concurrent.futures import ThreadPoolExecutor
+from django.core.cache import cache
+from .models import Trail
+from .dataversion import bump_data_version
+
+# --- CONFIGURATION ---
+OPEN_METEO_URL = "https://api.open-meteo.com/v1/forecast"
+GRID_SIZE_DEGREES = 0.01     # ~1.1km north-south, ~0.7km east-west at Peak District latitudes
+CACHE_TTL = 3600             # Seconds a reading counts as fresh (1 hour)
+REFRESH_AFTER = 2700         # Refresher re-fetches cells older than this, ahead of CACHE_TTL
+STALE_TTL = 6 * 3600         # Last known value is served (marked stale) for this long
+NEGATIVE_TTL = 300           # A cell that failed to fetch is left alone for this long
+LOCATIONS_PER_REQUEST = 100  # Open-Meteo accepts comma-separated coordinate lists
+MAX_CONCURRENT_REQUESTS = 4
+REQUEST_TIMEOUT = 3
+
+# Circuit breaker (shared by every process through the cache)
+FAILURE_THRESHOLD = 3        # Consecutive failed requests before outbound calls stop
+BREAKER_COOLDOWN = 120       # Seconds outbound calls stay blocked once tripped
+
+# Request path
+REQUEST_BUDGET = 0.25        # Seconds one API request may spend resolving weather
+CACHE_READ_CHUNK = 50        # Cells read per cache round trip while checking the budget
+METRICS_FLUSH_INTERVAL = 30  # Seconds a process buffers lookup counts before writing them
+
+
+def grid_cell(latitude, longitude):
+    """
+    Snaps a coordinate to the grid cell whose forecast it shares.
+    Trails a few hundred metres apart land in the same cell.
+    """
+    return (
+        floor(float(latitude) / GRID_SIZE_DEGREES),
+        floor(float(longitude) / GRID_SIZE_DEGREES),
+    )
+
+
+def cell_centre(cell):
+    """Returns the (lat, lon) used when asking Open-Meteo about a cell"""
+    return (
+        round((cell[0] + 0.5) * GRID_SIZE_DEGREES, 4),
+        round((cell[1] + 0.5) * GRID_SIZE_DEGREES, 4),
+    )
+
+
+def cell_cache_key(cell):
+    return f"weather_cell_{cell[0]}_{cell[1]}"
+
+
+# --- METRICS ---
+METRIC_KEYS = {
+    'fresh': 'weather_metrics_fresh',
+    'stale': 'weather_metrics_stale',
+    'miss': 'weather_metrics_miss',
+    'failed': 'weather_metrics_failed',
+    'over_budget': 'weather_metrics_over_budget',
+}
+LAST_REFRESH_KEY = 'weather_metrics_last_refresh'
+
+
+class LookupCounters:
+    """
+    Buffers cache outcomes in the process and adds them to the shared
+    counters at most once per flush_interval, so a request normally costs
+    no cache writes at all. A process that exits loses at most one
+    interval of counts, which the ratios can afford.
+    """
+
+    def __init__(self, flush_interval):
+        self.flush_interval = flush_interval
+        self._pending = dict.fromkeys(METRIC_KEYS, 0)
+        self._lock = threading.Lock()
+        self._flushed_at = time.monotonic()
+
+    def record(self, counts):
+        with self._lock:
+            for outcome, amount in counts.items():
+                self._pending[outcome] += amount
+            due = time.monotonic() - self._flushed_at >= self.flush_interval
+        if due:
+            self.flush()
+
+    def flush(self):
+        """Adds the buffered counts to the shared counters (one incr per outcome)"""
+        with self._lock:
+            pending, self._pending = self._pending, dict.fromkeys(METRIC_KEYS, 0)
+            self._flushed_at = time.monotonic()
+        for outcome, amount in pending.items():
+            if not amount:
+                continue
+            key = METRIC_KEYS[outcome]
+            cache.add(key, 0, None)
+            try:
+                cache.incr(key, amount)
+            except ValueError:
+                # Key was evicted between add() and incr()
+                cache.set(key, amount, None)
+
+
+lookup_counters = LookupCounters(METRICS_FLUSH_INTERVAL)
+
+
+def get_metrics():
+    """
+    Returns hit ratio counters and the last refresh report.
+    - hit_ratio: share of lookups answered from cache (fresh or stale)
+    - fresh_ratio: share of lookups answered with a reading younger than CACHE_TTL
+    Other processes' counts arrive up to METRICS_FLUSH_INTERVAL late.
+    """
+    lookup_counters.flush()
+    counts = {outcome: cache.get(key, 0) for outcome, key in METRIC_KEYS.items()}
+    total = sum(counts.values())
+    return {
+        **counts,
+        'lookups': total,
+        'hit_ratio': round((counts['fresh'] + counts['stale']) / total, 4) if total else None,
+        'fresh_ratio': round(counts['fresh'] / total, 4) if total else None,
+        'last_refresh': cache.get(LAST_REFRESH_KEY),
+        'breaker': breaker.status(),
+    }
+
+
+class CircuitBreaker:
+    """
+    Stops outbound calls after repeated failures.
+    - closed: calls allowed, consecutive failures are counted
+    - open: after failure_threshold failures, calls are blocked for cooldown seconds
+    - half-open: once the cooldown passes, exactly one caller gets a probe
+      token and makes a call; success closes the breaker, failure re-opens it
+    State lives in the shared cache so every process trips together. Every
+    change is a single add/incr/set, never a read-modify-write, so
+    concurrent failures can't lose counts and only one probe goes out.
+    """
+
+    def __init__(self, name, failure_threshold, cooldown):
+        self.failures_key = f"breaker_{name}_failures"
+        self.open_key = f"breaker_{name}_open_until"
+        self.probe_key = f"breaker_{name}_probe"
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+
+    def blocked(self):
+        """Whether the breaker is open and still cooling down"""
+        open_until = cache.get(self.open_key)
+        return open_until is not None and time.time() < open_until
+
+    def allow(self):
+        """Whether a call may go out now (in half-open, this takes the probe token)"""
+        open_until = cache.get(self.open_key)
+        if open_until is None:
+            return True
+        if time.time() < open_until:
+            return False
+        # The token expires with the cool-down, in case its holder never reports back
+        return cache.add(self.probe_key, True, self.cooldown)
+
+    def record_success(self):
+        if cache.get_many([self.failures_key, self.open_key]):
+            cache.delete_many([self.failures_key, self.open_key, self.probe_key])
+
+    def record_failure(self):
+        cache.add(self.failures_key, 0, None)
+        try:
+            failures = cache.incr(self.failures_key)
+        except ValueError:
+            # Key was evicted between add() and incr()
+            cache.set(self.failures_key, 1, None)
+            failures = 1
+        if failures < self.failure_threshold:
+            return
+
+        now = time.time()
+        if cache.add(self.open_key, now + self.cooldown, None):
+            return  # This failure tripped it
+        open_until = cache.get(self.open_key)
+        if open_until is not None and now >= open_until:
+            # The half-open probe failed: open again and hand out a new token later
+            cache.set(self.open_key, now + self.cooldown, None)
+            cache.delete(self.probe_key)
+
+    def status(self):
+        state = cache.get_many([self.failures_key, self.open_key])
+        failures = state.get(self.failures_key, 0)
+        open_until = state.get(self.open_key)
+        if open_until is None:
+            return {'state': 'closed', 'failures': failures}
+        remaining = open_until - time.time()
+        if remaining > 0:
+            return {'state': 'open', 'failures': failures, 'retry_in_seconds': round(remaining)}
+        return {'state': 'half-open', 'failures': failures}
+
+
+breaker = CircuitBreaker('open_meteo', FAILURE_THRESHOLD, BREAKER_COOLDOWN)
+
+
+def _fetch_chunk(cells):
+    """
+    One multi-location request for up to LOCATIONS_PER_REQUEST cells.
+    Returns {cell: current_weather} for the cells that came back, or an
+    empty dict if the breaker is open or the request failed.
+    """
+    if not breaker.allow():
+        return {}
+
+    centres = [cell_centre(cell) for cell in cells]
+    params = {
+        'latitude': ','.join(str(lat) for lat, _ in centres),
+        'longitude': ','.join(str(lon) for _, lon in centres),
+        'current_weather': 'true',
+    }
+    try:
+        response = requests.get(OPEN_METEO_URL, params=params, timeout=REQUEST_TIMEOUT)
+        response.raise_for_status()
+        payload = response.json()
+    except (requests.RequestException, ValueError):
+        breaker.record_failure()
+        return {}
+    breaker.record_success()
+
+    # A single location comes back as an object, several as a list
+    if isinstance(payload, dict):
+        payload = [payload]
+
+    results = {}
+    for cell, entry in zip(cells, payload):
+        data = entry.get('current_weather')
+        if data:
+            results[cell] = data
+    return results
+
+
+def fetch_cells(cells):
+    """
+    Fetches current weather for many grid cells.
+    Cells are chunked into multi-location requests, and the chunks are
+    sent with a bounded thread pool so a cold page costs a handful of
+    round trips instead of one per trail.
+    """
+    cells = list(cells)
+    chunks = [cells[i:i + LOCATIONS_PER_REQUEST] for i in range(0, len(cells), LOCATIONS_PER_REQUEST)]
+    if not chunks:
+        return {}
+
+    results = {}
+    with ThreadPoolExecutor(max_workers=min(MAX_CONCURRENT_REQUESTS, len(chunks))) as pool:
+        for chunk_result in pool.map(_fetch_chunk, chunks):
+            results.update(chunk_result)
+    return results
+
+
+def store_cells(fetched, fetched_at=None):
+    """
+    Saves fresh readings as {data, fetched_at} envelopes.
+    Envelopes outlive CACHE_TTL so readers can keep serving the last known
+    value while the refresher catches up.
+    """
+    fetched_at = fetched_at or time.time()
+    cache.set_many(
+        {cell_cache_key(cell): {'data': data, 'fetched_at': fetched_at} for cell, data in fetched.items()},
+        STALE_TTL,
+    )
+
+
+def store_failures(failed, envelopes, failed_at=None):
+    """
+    Negative-caches cells that could not be fetched.
+    A cell with a previous reading keeps it (still served as stale) and just
+    gains a failed_at mark; a cell with nothing gets an empty envelope that
+    expires after NEGATIVE_TTL. Either way the refresher won't retry it
+    until NEGATIVE_TTL has passed.
+    """
+    failed_at = failed_at or time.time()
+    keep, empty = {}, {}
+    for cell in failed:
+        key = cell_cache_key(cell)
+        previous = envelopes.get(key)
+        if previous and previous['data']:
+            keep[key] = {**previous, 'failed_at': failed_at}
+        else:
+            empty[key] = {'data': None, 'fetched_at': None, 'failed_at': failed_at}
+    if keep:
+        cache.set_many(keep, STALE_TTL)
+    if empty:
+        cache.set_many(empty, NEGATIVE_TTL)
+
+
+def _is_due(envelope, now, force):
+    """Whether the refresher should fetch a cell this cycle"""
+    if envelope is None:
+        return True
+    failed_at = envelope.get('failed_at')
+    if failed_at and now - failed_at < NEGATIVE_TTL:
+        return False
+    if force or envelope['fetched_at'] is None:
+        return True
+    return now - envelope['fetched_at'] >= REFRESH_AFTER
+
+
+def trail_cells():
+    """Every distinct grid cell that currently holds at least one trail"""
+    coords = Trail.objects.values_list('latitude', 'longitude')
+    return {grid_cell(lat, lon) for lat, lon in coords}
+
+
+def refresh_cells(cells=None, force=False):
+    """
+    Re-fetches every cell whose reading is missing or older than REFRESH_AFTER.
+    Cells that failed recently are skipped (see store_failures), and nothing
+    is fetched while the circuit breaker is open.
+    Used by the refresh_weather command; never called on the request path.
+    Returns a report that is also stored for get_metrics().
+    """
+    started = time.time()
+    cells = trail_cells() if cells is None else set(cells)
+
+    keys = {cell_cache_key(cell): cell for cell in cells}
+    envelopes = cache.get_many(list(keys))
+    ages = {
+        keys[key]: started - envelope['fetched_at']
+        for key, envelope in envelopes.items() if envelope['fetched_at'] is not None
+    }
+
+    due = [cell for cell in cells if _is_due(envelopes.get(cell_cache_key(cell)), started, force)]
+    # Nothing goes out while the breaker is open. Half-open, the first chunk
+    # is the probe and the rest follow only if it closed the breaker.
+    state = breaker.status()['state']
+    attempted = [] if state == 'open' else due if state == 'closed' else due[:LOCATIONS_PER_REQUEST]
+    fetched = fetch_cells(attempted)
+    if state == 'half-open' and breaker.status()['state'] == 'closed':
+        fetched.update(fetch_cells(due[LOCATIONS_PER_REQUEST:]))
+        attempted = due
+    store_cells(fetched, started)
+    if fetched:
+        # Cached trail responses embed the weather
+        bump_data_version('weather')
+
+    failed = [cell for cell in attempted if cell not in fetched]
+    store_failures(failed, envelopes, started)
+
+    report = {
+        'finished_at': time.time(),
+        'duration_seconds': round(time.time() - started, 2),
+        'cells': len(cells),
+        'due': len(due),
+        'refreshed': len(fetched),
+        'failed': len(failed),
+        'skipped': state == 'open',
+        'breaker': breaker.status()['state'],
+        # Refresh lag: how old the oldest reading was when this cycle began
+        'max_age_seconds': round(max(ages.values()), 1) if ages else None,
+        'never_fetched': len(cells) - len(ages),
+    }
+    cache.set(LAST_REFRESH_KEY, report, None)
+    return report
+
+
+class WeatherProvider:
+    """
+    Resolves current weather for the trails in one API response.
+    - prime(): collects every trail on the page, groups them into grid cells
+      and reads all of their cells from the cache in one round trip.
+    - get(): returns the weather for a single trail from the primed cells.
+
+    The request path never calls Open-Meteo. Readings are kept warm by the
+    refresh_weather command, and a reading past CACHE_TTL is still served
+    with 'stale': True while the refresher catches up.
+
+    Each request gets REQUEST_BUDGET seconds in total. Once it is spent
+    (e.g. a slow shared cache) the remaining trails get None, so
+    current_weather and safety_score degrade to null instead of stalling.
+    """
+
+    def __init__(self, budget=REQUEST_BUDGET):
+        self._weather = {}  # cell -> current_weather dict (or None if unavailable)
+        self._deadline = time.monotonic() + budget
+
+    def prime(self, trails):
+        cells = {grid_cell(trail.latitude, trail.longitude) for trail in trails}
+        missing = list(cells - self._weather.keys())
+        if not missing:
+            return
+
+        now = time.time()
+        counts = dict.fromkeys(METRIC_KEYS, 0)
+
+        for start in range(0, len(missing), CACHE_READ_CHUNK):
+            chunk = missing[start:start + CACHE_READ_CHUNK]
+
+            if time.monotonic() >= self._deadline:
+                counts['over_budget'] += len(chunk)
+                self._weather.update(dict.fromkeys(chunk))
+                continue
+
+            keys = {cell_cache_key(cell): cell for cell in chunk}
+            envelopes = cache.get_many(list(keys))
+
+            for key, cell in keys.items():
+                envelope = envelopes.get(key)
+                if not envelope:
+                    counts['miss'] += 1
+                    self._weather[cell] = None
+                    continue
+                if not envelope['data']:
+                    counts['failed'] += 1
+                    self._weather[cell] = None
+                    continue
+
+                age = int(now - envelope['fetched_at'])
+                stale = age > CACHE_TTL
+                counts['stale' if stale else 'fresh'] += 1
+                self._weather[cell] = {**envelope['data'], 'age_seconds': age, 'stale': stale}
+
+        lookup_counters.record(counts)
+
+    def get(self, trail):
+        cell = grid_cell(trail.latitude, trail.longitude)
+        if cell not in self._weather:
+            self.prime([trail])
+        return self._weather[cell]
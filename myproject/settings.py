@@ -97,6 +97,32 @@ DATABASES = {
 }
 
 
+# Cache
+# The refresh_weather command runs in its own process, so the weather cache
+# has to be shared between it and the web workers (LocMemCache is per-process).
+# The same cache holds the throttle counters, so limits apply across workers.
+# - Default: one SQLite file shared by every process on the host, with LRU
+#   eviction and hit/miss stats (python manage.py cache_stats).
+# - REDIS_URL set (e.g. redis://127.0.0.1:6379/0): Django's Redis backend,
+#   for several hosts. Needs `pip install redis`.
+
+if os.getenv('REDIS_URL'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.getenv('REDIS_URL'),
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'api_app.sqlitecache.SQLiteCache',
+            'LOCATION': BASE_DIR / 'cache.sqlite3',
+            'OPTIONS': {'MAX_ENTRIES': 50000},
+        }
+    }
+
+
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
 
@@ -140,13 +166,17 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 # Throttling 
 REST_FRAMEWORK = {
+    # Every list endpoint is paged with keyset cursors (see api_app/pagination.py)
+    'DEFAULT_PAGINATION_CLASS': 'api_app.pagination.KeysetPagination',
+    'PAGE_SIZE': 50,
     'DEFAULT_THROTTLE_CLASSES': [
         'rest_framework.throttling.AnonRateThrottle',
         'rest_framework.throttling.UserRateThrottle'
     ],
     'DEFAULT_THROTTLE_RATES': {
         'anon': '100/day',   # Limits unauthorized requests
-        'user': '1000/day'   # Limits requests for 'Marker' and other users
+        'user': '1000/day',  # Limits requests for 'Marker' and other users
+        'export': '10/hour', # Whole-table downloads from /export/ (per user or IP)
     }
 }
 